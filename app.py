@@ -5,7 +5,11 @@ import os
 app = Flask(__name__)
 app.secret_key = 'dev_key_very_secret'  # For session/flash messages
 
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 DATABASE = 'library.db'
@@ -69,14 +73,118 @@ def init_db():
 
     conn.close()
 
+# -------------------------------------------------------------------------
+# SCHEMA MIGRATIONS
+# -------------------------------------------------------------------------
+# Steps run in order, each once per database file: PRAGMA user_version counts the steps
+# already applied and moves forward in the same transaction as each step. Append new
+# steps at the end; never edit or reorder applied ones. A step is a SQL script, or a
+# function of the connection returning one.
+
+def _book_columns(conn):
+    """isbn and cover_url: written by add/edit book but missing from the original books table."""
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(books)')}
+    return ''.join(f'ALTER TABLE books ADD COLUMN {column} TEXT;'
+                   for column in ('isbn', 'cover_url') if column not in existing)
+
+MIGRATIONS = [
+    _book_columns,
+
+    # Lookups by student, by status, the duplicate-request check, and staff/student lists
+    '''
+    CREATE INDEX IF NOT EXISTS idx_requests_user_email ON requests (user_email);
+    CREATE INDEX IF NOT EXISTS idx_requests_status ON requests (status);
+    CREATE INDEX IF NOT EXISTS idx_requests_book_user_status ON requests (book_id, user_email, status);
+    CREATE INDEX IF NOT EXISTS idx_users_role ON users (role);
+    ''',
+
+    # Full-text catalog search. books_fts indexes the books table's own rows (external
+    # content), and the triggers keep it in step with every insert, delete and edit.
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, category, isbn,
+        content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, category, isbn)
+        VALUES (new.id, new.title, new.author, new.category, new.isbn);
+    END;
+    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, category, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.category, old.isbn);
+    END;
+    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, category, isbn ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, author, category, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.category, old.isbn);
+        INSERT INTO books_fts (rowid, title, author, category, isbn)
+        VALUES (new.id, new.title, new.author, new.category, new.isbn);
+    END;
+    INSERT INTO books_fts (books_fts) VALUES ('rebuild');
+    ''',
+]
+
+def migrate():
+    """Applies the MIGRATIONS this database has not seen yet."""
+    conn = get_db()
+    try:
+        applied = conn.execute('PRAGMA user_version').fetchone()[0]
+        for version, step in enumerate(MIGRATIONS[applied:], applied + 1):
+            script = step(conn) if callable(step) else step
+            try:
+                conn.executescript(f'BEGIN; {script} PRAGMA user_version = {version}; COMMIT;')
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+            print(f"Applied schema migration {version} to {DATABASE}")
+    finally:
+        conn.close()
+
 # Initialize DB on startup
 if not os.path.exists(DATABASE):
     init_db()
 elif os.environ.get("WERKZEUG_RUN_MAIN") == "true": 
     # Optional: Re-run init to ensure tables exist on reload, but avoid reseeding duplicates if checks are weak
     init_db()
+migrate()
+
 
 
+# -------------------------------------------------------------------------
+# USER CACHE (session checks)
+# -------------------------------------------------------------------------
+# Per-process LRU of user rows so "does the session user still exist?" is a memory lookup.
+# Password changes, registration and deletion invalidate; login and the current-password
+# check in profile() still read the table directly.
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 2048
+_user_cache = OrderedDict()  # email -> (loaded_at, row)
+_user_cache_lock = threading.Lock()
+user_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def get_cached_user(email):
+    with _user_cache_lock:
+        entry = _user_cache.get(email)
+        if entry and time.monotonic() - entry[0] < USER_CACHE_TTL:
+            _user_cache.move_to_end(email)
+            user_cache_stats['hits'] += 1
+            return entry[1]
+        user_cache_stats['misses'] += 1
+
+    db = get_db()
+    user = db.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
+    db.close()
+    if user is not None:
+        with _user_cache_lock:
+            _user_cache[email] = (time.monotonic(), user)
+            _user_cache.move_to_end(email)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+                user_cache_stats['evictions'] += 1
+    return user
+
+def invalidate_user(email):
+    with _user_cache_lock:
+        _user_cache.pop(email, None)
 
 # -------------------------------------------------------------------------
 # ROUTES
@@ -86,9 +194,7 @@ elif os.environ.get("WERKZEUG_RUN_MAIN") == "true":
 def index():
     if 'user' in session:
         # Verify user exists in DB
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE email = ?', (session['user'],)).fetchone()
-        db.close()
+        user = get_cached_user(session['user'])
         
         if not user:
              session.clear()
@@ -103,9 +209,7 @@ def about():
 @app.route('/auth')
 def auth():
     if 'user' in session:
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE email = ?', (session['user'],)).fetchone()
-        db.close()
+        user = get_cached_user(session['user'])
         
         if user:
              return redirect(url_for('dashboard') if session['role'] == 'student' else url_for('staff_dashboard'))
@@ -141,7 +245,10 @@ def catalog():
     my_requests = db.execute('SELECT * FROM requests WHERE user_email = ?', (session['user'],)).fetchall()
     db.close()
     
-    return render_template('catalog.html', books=books, my_requests=my_requests)
+    # request_book takes an <int:book_id>, so the template's URL pattern is built around a real id
+    request_url = url_for('request_book', book_id=0).rsplit('/', 1)[0] + '/__ID__'
+    return render_template('catalog.html', books=books, my_requests=my_requests,
+                           search_url=url_for('search_books'), request_url=request_url)
 
     return render_template('catalog.html', books=books, my_requests=my_requests)
 
@@ -167,13 +274,14 @@ def profile():
             hashed_pw = generate_password_hash(new_pw)
             db.execute('UPDATE users SET password = ? WHERE email = ?', (hashed_pw, session['user']))
             db.commit()
+            invalidate_user(session['user'])
             flash("Password updated successfully.", "success")
             
         db.close()
         return redirect(url_for('profile'))
 
-    user = db.execute('SELECT * FROM users WHERE email = ?', (session['user'],)).fetchone()
     db.close()
+    user = get_cached_user(session['user'])
     return render_template('profile.html', user=user)
 
 @app.route('/my-requests')
@@ -199,15 +307,15 @@ def staff_dashboard():
         flash("Restricted access. Staff only.", "danger")
         return redirect(url_for('auth', role='staff'))
     
-    db = get_db()
-    user = db.execute('SELECT * FROM users WHERE email = ?', (session['user'],)).fetchone()
+    user = get_cached_user(session['user'])
     if not user:
         session.clear()
-        db.close()
         flash("Session expired. Please login again.", "danger")
         return redirect(url_for('auth', mode='login', role='staff'))
 
-    books = db.execute('SELECT * FROM books').fetchall()
+    db = get_db()
+
+    total, out_of_stock = db.execute('SELECT COUNT(*), COALESCE(SUM(copies < 1), 0) FROM books').fetchone()
     requests = db.execute('''
         SELECT r.*, b.title as book_title, b.cover_url as book_cover, u.email as user_email
         FROM requests r
@@ -217,7 +325,8 @@ def staff_dashboard():
     ''').fetchall()
     db.close()
 
-    return render_template('staff_dashboard.html', user=user, books=books, requests=requests)
+    return render_template('staff_dashboard.html', user=user, requests=requests,
+                           book_counts={'total': total, 'out_of_stock': out_of_stock})
 
 @app.route('/staff/books')
 def manage_books():
@@ -225,7 +334,10 @@ def manage_books():
         return redirect(url_for('index'))
     
     db = get_db()
-    books = db.execute('SELECT * FROM books').fetchall()
+    if request.args.get('availability') == 'out_of_stock':  # Staff dashboard's Low Stock link
+        books = db.execute('SELECT * FROM books WHERE copies < 1').fetchall()
+    else:
+        books = db.execute('SELECT * FROM books').fetchall()
     db.close()
     
     return render_template('manage_books.html', books=books)
@@ -507,6 +619,7 @@ def delete_user(email):
     db.execute('DELETE FROM users WHERE email = ?', (email,))
     db.commit()
     db.close()
+    invalidate_user(email)
     flash("Student removed.", "success")
     return redirect(url_for('manage_students'))
 
@@ -573,13 +686,18 @@ def request_book(book_id):
 # -------------------------------------------------------------------------
 # AI CHATBOT (GEMINI)
 # -------------------------------------------------------------------------
-import google.generativeai as genai
-
-# Configure Gemini
 GENAI_API_KEY = ""
-genai.configure(api_key=GENAI_API_KEY)
-# Switch to 'gemini-flash-latest' for better quota
-model = genai.GenerativeModel('gemini-flash-latest')
+model = None
+
+def get_model():
+    """Configures Gemini on the first chat message instead of at import (the SDK is slow to load)."""
+    global model
+    if model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GENAI_API_KEY)
+        # Switch to 'gemini-flash-latest' for better quota
+        model = genai.GenerativeModel('gemini-flash-latest')
+    return model
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
@@ -607,7 +725,7 @@ def chat():
     """.format(session.get('role', 'Guest'), session.get('user', 'Guest'))
 
     try:
-        chat = model.start_chat(history=[])
+        chat = get_model().start_chat(history=[])
         response = chat.send_message(f"{context}\nUser: {user_message}")
         return jsonify({'response': response.text})
     except Exception as e:
@@ -635,6 +753,48 @@ def get_stats():
     }
     return jsonify(stats)
 
+SEARCH_RESULTS = 24
+
+def fts_query(text):
+    """FTS5 MATCH expression for a search box: every word must match, and the last one may be
+    unfinished ('harry pot' -> "harry" "pot"*). Words are quoted so FTS syntax in input is inert."""
+    words = re.findall(r'[^\W_]+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if text[-1:].isalnum():
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+@app.route('/api/search')
+def search_books():
+    """Ranked catalog search through the books_fts index (same response shape as app_aws.py)."""
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    query = request.args.get('q', '').strip()
+    match = fts_query(query)
+    if not match:
+        return jsonify({'query': query, 'corrections': {}, 'results': []})
+    
+    db = get_db()
+    # bm25() is lower-is-better; columns weighted title 3, author 2, category 1, isbn 1
+    rows = db.execute('''
+        SELECT b.id, b.title, b.author, b.category, b.copies, b.cover_url,
+               bm25(books_fts, 3.0, 2.0, 1.0, 1.0) AS rank
+        FROM books_fts
+        JOIN books b ON b.id = books_fts.rowid
+        WHERE books_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (match, SEARCH_RESULTS)).fetchall()
+    db.close()
+    
+    results = [dict(row, score=round(-row['rank'], 3)) for row in rows]
+    for result in results:
+        del result['rank']
+    return jsonify({'query': query, 'corrections': {}, 'results': results})
+
 @app.route('/login', methods=['POST'])
 def login_post():
     data = request.form
@@ -757,6 +917,7 @@ def reset_password():
         db.execute('DELETE FROM password_resets WHERE email = ?', (email,)) # Cleanup
         db.commit()
         db.close()
+        invalidate_user(email)
         
         session.pop('reset_email', None)
         session.pop('otp_verified', None)
@@ -797,6 +958,7 @@ def register_user(data):
     
     db.commit()
     db.close()
+    invalidate_user(email)
     
     flash("Registration successful! Please login.", "success")
     return redirect(url_for('auth', mode='login', role=role))
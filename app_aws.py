@@ -1,15 +1,27 @@
 import os
+import io
 import json
-import boto3
+import base64
 import random
 import string
-import requests
-from decimal import Decimal
-from datetime import datetime
+import queue
+import threading
+import time
+import zlib
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+import csv
+import uuid
+from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from botocore.exceptions import ClientError
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context, g, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
-import google.generativeai as genai
 
 # =============================================================================
 # CONFIGURATION
@@ -19,158 +31,3336 @@ class Config:
     SECRET_KEY = 'never_mind_its_ok_lol'
     AWS_REGION = 'us-east-1'
     
+    # boto3 client tuning (one pool per process, shared by request threads and background workers)
+    AWS_MAX_POOL_CONNECTIONS = 50   # Keep >= server threads + SCAN_SEGMENTS / BULK_WORKERS / IMPORT_WORKERS
+    AWS_CONNECT_TIMEOUT = 2         # Seconds
+    AWS_READ_TIMEOUT = 10           # Seconds
+    AWS_RETRY_MODE = 'adaptive'     # Standard retries plus client-side rate limiting when throttled
+    AWS_MAX_ATTEMPTS = 5
+    AWS_TCP_KEEPALIVE = True
+    
     # AWS Resources (DynamoDB Tables)
     TABLE_USERS = 'InstantLibrary_Users'
     TABLE_BOOKS = 'InstantLibrary_Books'
     TABLE_REQUESTS = 'InstantLibrary_Requests'
     TABLE_OTP = 'InstantLibrary_OTP'
+    TABLE_STATS = 'InstantLibrary_Stats'
+    
+    # Storage engine behind DatabaseService (see STORAGE BACKENDS): 'dynamodb' (the tables above),
+    # 'sqlite' (one file on a single host) or 'memory' (per process, for benchmarks and local runs)
+    STORAGE_BACKEND = 'dynamodb'
+    SQLITE_PATH = 'instant_library_storage.db'
+    
+    # Global Secondary Indexes
+    INDEX_REQUESTS_BY_USER = 'user_email-date-index'   # HASH user_email, RANGE date
+    INDEX_REQUESTS_BY_STATUS = 'status-date-index'     # HASH status, RANGE date
+    INDEX_USERS_BY_ROLE = 'role-email-index'           # HASH role, RANGE email
+    INDEX_STATS_BY_POPULARITY = 'kind-request_count-index'  # HASH kind, RANGE request_count (N)
+    INDEX_WAITLIST = 'waitlist_book-waitlisted_at-index'    # HASH waitlist_book, RANGE waitlisted_at (sparse)
+    
+    # Request lifecycle: the staff queue only ever loads the active statuses
+    ACTIVE_REQUEST_STATUSES = ('pending', 'waitlisted', 'approved')
+    WAITLIST_PROMOTE_RETRIES = 3    # Extra queue heads tried when a promotion loses a race
+    
+    # Pagination
+    CATALOG_PAGE_SIZE = 24
+    REQUESTS_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 100
+    MAX_RANGE_DAYS = 3650  # Largest days=N a date filter accepts; longer asks are clamped to it
+    BOOK_SORT_FIELDS = ('title', 'author', 'category', 'copies')
+    
+    # Named projections: only the attributes each view renders are read (Utils.projection_args).
+    # Names a table lacks are simply absent from its items, so one view can span tables.
+    PROJECTIONS = {
+        'card': ('id', 'title', 'author', 'category', 'copies', 'cover_url'),          # catalog.html
+        'admin_row': ('id', 'title', 'author', 'category', 'copies', 'cover_url'),     # manage_books.html
+        'analytics': ('id', 'title', 'copies', 'book_id', 'status'),                   # dashboard counts, stats rebuild
+        'request_row': ('id', 'user_email', 'book_id', 'status', 'date'),              # request lists
+        'request_book': ('id', 'title', 'author', 'cover_url')                         # request enrichment
+    }
+    
+    # Parallel Scans (Segment/TotalSegments workers for full-table reads)
+    SCAN_SEGMENTS = 4
+    
+    # In-process catalog cache (seconds; 0 disables and every read goes to DynamoDB)
+    CATALOG_CACHE_TTL = 60
+    STAFF_ROSTER_TTL = 300
+    USER_CACHE_TTL = 60
+    USER_CACHE_SIZE = 2048
+    CATALOG_CHANGE_LOG_SIZE = 10000  # Book changes kept for incremental index updates (CatalogCache.changes_since)
+    
+    # Catalog search (per-worker inverted index that follows the catalog cache)
+    SEARCH_RESULTS = 24
+    SEARCH_PREFIX_TERMS = 50  # Index terms an unfinished last word may expand to
+    FUZZY_MIN_SIMILARITY = 0.4  # Trigram (Dice) overlap a term needs to stand in for a misspelled word
+    FUZZY_EXPANSIONS = 3        # Terms a misspelled word may stand for
+    SUGGEST_RESULTS = 8
+    SUGGEST_POPULARITY_TTL = 300  # Seconds between reloads of the per-book request counts
+    SUGGEST_MEMO_SIZE = 1024      # Prefixes whose ranked completions are kept
+    SUGGEST_SCAN_LIMIT = 2000     # Keys scanned for a prefix before walking the popularity order instead
+    FACET_VALUES = 15             # Values listed per facet (category, author), largest first
+    FACET_MEMO_SIZE = 256         # Filter combinations whose counts are kept until the catalog changes
+    
+    # BatchGetItem (DynamoDB caps a batch at 100 keys)
+    BATCH_GET_SIZE = 100
+    BATCH_MAX_RETRIES = 8
+    
+    # Bulk request actions (DynamoDB caps a transaction at 100 actions)
+    TRANSACT_MAX_ITEMS = 100
+    BULK_WORKERS = 4
+    BULK_MAX_REQUESTS = 500
+    
+    # Streaming exports (items per scan page, bytes buffered per response chunk)
+    EXPORT_PAGE_SIZE = 1000
+    EXPORT_CHUNK_BYTES = 64 * 1024
+    
+    # Bulk book import (rows per batch_writer chunk, parallel writer threads)
+    IMPORT_CHUNK_ROWS = 500
+    IMPORT_WORKERS = 4
+    IMPORT_MAX_ERRORS = 50  # Row errors kept in the report; the rest are only counted
     
     # External Services
     SNS_TOPIC_ARN = '' # PASTE YOUR SNS ARN HERE
     GEMINI_API_KEY = ''
 
-# Initialize Flask App
-app = Flask(__name__)
-app.config.from_object(Config)
+# Initialize Flask App
+app = Flask(__name__)
+app.config.from_object(Config)
+
+# =============================================================================
+# AWS CLIENTS & SERVICES SETUP
+# =============================================================================
+# boto3 (and the google/requests SDKs further down) are imported on first use, not at
+# module import: a worker boots without paying for SDKs the first request may never need.
+class NativeDeserializer:
+    """Decodes DynamoDB wire values straight to native Python types.
+    
+    Drop-in for boto3's TypeDeserializer, which turns every number into a Decimal (through
+    a strict decimal context) that we then walked every item again to turn into int/float.
+    This does it in one pass: 'N' becomes int when integral and float otherwise, the same
+    values the old Utils.convert_decimals pass produced, and type dispatch is a dict lookup.
+    """
+
+    def __init__(self):
+        from boto3.dynamodb.types import Binary
+        self._decoders = {
+            'S': str,
+            'N': self._number,
+            'BOOL': bool,
+            'NULL': lambda _: None,
+            'M': lambda value: {k: self.deserialize(v) for k, v in value.items()},
+            'L': lambda value: [self.deserialize(v) for v in value],
+            'SS': set,
+            'NS': lambda value: {self._number(v) for v in value},
+            'B': Binary,
+            'BS': lambda value: {Binary(v) for v in value}
+        }
+
+    @staticmethod
+    def _number(value):
+        try:
+            return int(value)
+        except ValueError:
+            number = float(value)
+            return int(number) if number.is_integer() else number
+
+    def deserialize(self, value):
+        for dynamodb_type, raw in value.items():
+            return self._decoders[dynamodb_type](raw)
+        raise TypeError('Value must be a nonempty dictionary whose key is a valid dynamodb type.')
+
+def use_native_decoding(resource):
+    """Swaps the resource's response deserializer for NativeDeserializer.
+    Every table (and table.meta.client) built from the resource then returns int/float, not Decimal."""
+    from boto3.dynamodb.transform import TransformationInjector
+    injector = TransformationInjector(deserializer=NativeDeserializer())
+    events = resource.meta.client.meta.events
+    events.unregister('after-call.dynamodb', unique_id='dynamodb-attr-value-output')
+    events.register('after-call.dynamodb', injector.inject_attribute_value_output,
+                    unique_id='dynamodb-attr-value-output')
+    return resource
+
+class AWSClients:
+    """Process-wide boto3 clients, built on first use from one tuned botocore config.
+    
+    Creation is guarded by a lock, so concurrent first requests share one client set. The
+    owning pid is remembered and the set is dropped in a forked child (gunicorn workers),
+    because a session and its connection pool must never be shared across processes.
+    Clients are thread-safe; every thread, scan segment and bulk worker shares their pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._dynamodb = None
+        self._sns = None
+        self._tables = {}
+
+    @staticmethod
+    def client_config():
+        from botocore.config import Config as BotoConfig
+        return BotoConfig(
+            region_name=Config.AWS_REGION,
+            max_pool_connections=Config.AWS_MAX_POOL_CONNECTIONS,
+            connect_timeout=Config.AWS_CONNECT_TIMEOUT,
+            read_timeout=Config.AWS_READ_TIMEOUT,
+            retries={'mode': Config.AWS_RETRY_MODE, 'total_max_attempts': Config.AWS_MAX_ATTEMPTS},
+            tcp_keepalive=Config.AWS_TCP_KEEPALIVE
+        )
+
+    def _ensure(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            try:
+                import boto3
+                boto_session = boto3.session.Session(region_name=Config.AWS_REGION)
+                config = self.client_config()
+                self._dynamodb = use_native_decoding(boto_session.resource('dynamodb', config=config))
+                self._sns = boto_session.client('sns', config=config)
+                self._tables = {}
+            except Exception as e:
+                print(f"CRITICAL: Failed to initialise AWS clients. Error: {e}")
+                raise
+            self._pid = pid
+
+    @property
+    def dynamodb(self):
+        self._ensure()
+        return self._dynamodb
+
+    @property
+    def sns(self):
+        self._ensure()
+        return self._sns
+
+    def table(self, name):
+        self._ensure()
+        table = self._tables.get(name)
+        if table is None:
+            with self._lock:
+                table = self._tables.setdefault(name, self._dynamodb.Table(name))
+        return table
+
+    def reset(self):
+        """Drops the clients; the next call rebuilds them (runs in every forked child)."""
+        self._pid = None
+
+    @staticmethod
+    def _pool_stats(client):
+        # botocore keeps one urllib3 pool per endpoint host; these are private attributes,
+        # so report what is there rather than fail the caller
+        try:
+            manager = client._endpoint.http_session._manager
+            pools = [manager.pools[key] for key in list(manager.pools.keys())]
+        except (AttributeError, KeyError):
+            return []
+        return [{
+            'host': pool.host,
+            'max_connections': pool.pool.maxsize,
+            'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None),
+            'connections_opened': pool.num_connections,
+            'requests_sent': pool.num_requests
+        } for pool in pools]
+
+    def stats(self):
+        """Connection pool usage per service: a connections_opened figure that keeps growing
+        relative to requests_sent means churn, and zero idle connections under load means
+        threads are queuing for the pool."""
+        if self._pid != os.getpid():
+            return {'initialised': False}
+        return {
+            'initialised': True,
+            'pid': self._pid,
+            'max_pool_connections': Config.AWS_MAX_POOL_CONNECTIONS,
+            'retry_mode': Config.AWS_RETRY_MODE,
+            'dynamodb': self._pool_stats(self._dynamodb.meta.client),
+            'sns': self._pool_stats(self._sns)
+        }
+
+class LazyAWSObject:
+    """Module-level stand-in for a boto3 resource, table or client that resolves it through
+    AWSClients on every attribute access, so importing this module never touches AWS."""
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+aws = AWSClients()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=aws.reset)
+
+dynamodb = LazyAWSObject(lambda: aws.dynamodb)
+sns_client = LazyAWSObject(lambda: aws.sns)
+
+# Table Resources
+users_table = LazyAWSObject(lambda: aws.table(Config.TABLE_USERS))
+books_table = LazyAWSObject(lambda: aws.table(Config.TABLE_BOOKS))
+requests_table = LazyAWSObject(lambda: aws.table(Config.TABLE_REQUESTS))
+password_resets_table = LazyAWSObject(lambda: aws.table(Config.TABLE_OTP))
+stats_table = LazyAWSObject(lambda: aws.table(Config.TABLE_STATS))
+
+class AIService:
+    """Gemini model shared by the AI routes, imported and configured on first use
+    (google.generativeai alone takes most of a second to import)."""
+    _model = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def model():
+        with AIService._lock:
+            if AIService._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=Config.GEMINI_API_KEY)
+                AIService._model = genai.GenerativeModel('gemini-flash-latest')
+            return AIService._model
+
+# =============================================================================
+# UTILITIES & HELPER CLASSES
+# =============================================================================
+class Utils:
+    ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+    _ulid_lock = threading.Lock()
+    _ulid_last = (0, 0)
+
+    @staticmethod
+    def generate_otp():
+        """Generates a 6-digit numeric OTP."""
+        return ''.join(random.choices(string.digits, k=6))
+
+    @staticmethod
+    def normalize_isbn(value):
+        """Digits (and a trailing X) of an ISBN-10/13, or None for blanks and placeholders like 'N/A'.
+        Raises ValueError for anything else."""
+        raw = str(value or '').strip()
+        if raw.upper() in ('', 'N/A', 'NA', 'NONE'):
+            return None
+        isbn = ''.join(ch for ch in raw.upper() if ch.isdigit() or ch == 'X')
+        if len(isbn) not in (10, 13) or 'X' in isbn[:-1] or (len(isbn) == 13 and 'X' in isbn):
+            raise ValueError(f"invalid ISBN '{raw}'")
+        return isbn
+
+    @staticmethod
+    def sort_key(value):
+        """Case-insensitive sort key that tolerates missing attributes."""
+        if value is None:
+            return (1, '')
+        if isinstance(value, str):
+            return (0, value.lower())
+        return (0, value)
+
+    @staticmethod
+    def projection_names(attributes, required=()):
+        """Attribute names for a list of names or a Config.PROJECTIONS name, plus the required
+        ones (keys the caller needs); None means whole items."""
+        if not attributes:
+            return None
+        if isinstance(attributes, str):
+            attributes = Config.PROJECTIONS[attributes]
+        return list(dict.fromkeys(list(attributes) + list(required)))
+
+    @staticmethod
+    def projection_args(attributes, required=()):
+        """ProjectionExpression kwargs for a list of attribute names or a Config.PROJECTIONS name.
+        required attributes (keys the caller needs) are always added.
+        Every name goes through a placeholder, so reserved words like 'status' and 'date' are safe."""
+        attributes = Utils.projection_names(attributes, required)
+        if not attributes:
+            return {}
+        names = {f'#p{i}': attr for i, attr in enumerate(attributes)}
+        return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+    @staticmethod
+    def project(item, attributes, required=()):
+        """A copy of item narrowed to a projection, for engines that read whole items."""
+        attributes = Utils.projection_names(attributes, required)
+        if not attributes:
+            return dict(item)
+        return {k: item[k] for k in attributes if k in item}
+
+    @staticmethod
+    def encode_cursor(key):
+        """Encodes a DynamoDB LastEvaluatedKey as a URL-safe cursor string."""
+        if not key:
+            return None
+        raw = json.dumps(key, separators=(',', ':'), sort_keys=True)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Decodes a cursor back into an ExclusiveStartKey (None if missing or tampered)."""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            key = json.loads(raw)
+            return key if isinstance(key, dict) else None
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def new_request_id():
+        """A ULID: 48-bit millisecond timestamp then 80 random bits, as 26 base32 characters.
+        Ids sort in creation order; within one millisecond the random part is incremented,
+        so ids from this process are strictly increasing."""
+        with Utils._ulid_lock:
+            ms = int(time.time() * 1000)
+            last_ms, last_rand = Utils._ulid_last
+            if ms <= last_ms:
+                ms, rand = last_ms, (last_rand + 1) & ((1 << 80) - 1)
+            else:
+                rand = int.from_bytes(os.urandom(10), 'big')
+            Utils._ulid_last = (ms, rand)
+        value = (ms << 80) | rand
+        return ''.join(Utils.ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+    @staticmethod
+    def timestamp(now=None):
+        """Full ISO-8601 timestamp; sorts chronologically as a string, like the older YYYY-MM-DD dates."""
+        return (now or datetime.now()).isoformat(timespec='milliseconds')
+
+    @staticmethod
+    def date_range_args(args):
+        """Reads since/until (YYYY-MM-DD or ISO timestamps) or days=N from a query string.
+        days=1 is today, days=7 the last seven days; days is kept in the result so pagination
+        links carry it, clamped to Config.MAX_RANGE_DAYS. Unparseable values are ignored."""
+        def valid(value):
+            try:
+                datetime.fromisoformat(value)
+                return value
+            except (TypeError, ValueError):
+                return None
+        
+        since, until = valid(args.get('since')), valid(args.get('until'))
+        days = args.get('days', '')
+        if days.isdigit() and int(days) > 0:
+            days = str(min(int(days), Config.MAX_RANGE_DAYS))
+            since = (datetime.now() - timedelta(days=int(days) - 1)).strftime("%Y-%m-%d")
+        else:
+            days = None
+        return {k: v for k, v in (('days', days), ('since', since), ('until', until)) if v}
+
+    @staticmethod
+    def date_bounds(since=None, until=None):
+        """Inclusive (low, high) bounds on the 'date' sort key for a since/until range.
+        A date-only until covers that whole day."""
+        if until and len(until) == 10:
+            until += '~'  # Sorts after every 'T..' time on that day
+        return since, until
+
+    @staticmethod
+    def waitlist_position(req):
+        """waitlisted_at for a request that predates it: its own date, as a timestamp."""
+        return req['date'] if 'T' in req['date'] else f"{req['date']}T00:00:00"
+
+    @staticmethod
+    def page_args(args, default_size=Config.CATALOG_PAGE_SIZE, sort_fields=Config.BOOK_SORT_FIELDS):
+        """Reads cursor/page-size/sort options from a request's query string."""
+        try:
+            per_page = int(args.get('per_page', default_size))
+        except ValueError:
+            per_page = default_size
+        sort = args.get('sort')
+        return {
+            'cursor': args.get('cursor') or None,
+            'prev': [c for c in args.get('prev', '').split('.') if c],
+            'per_page': max(1, min(per_page, Config.MAX_PAGE_SIZE)),
+            'sort': sort if sort in sort_fields else None,
+            'order': 'desc' if args.get('order') == 'desc' else 'asc'
+        }
+
+    @staticmethod
+    def build_pagination(endpoint, page, next_key, sort_fields=Config.BOOK_SORT_FIELDS, **extra):
+        """Builds next/prev links for cursor pagination.
+        The trail of earlier cursors travels in the 'prev' query param so Back needs no server state.
+        extra query params (e.g. a status filter) are carried through every link."""
+        opts = dict(extra, per_page=page['per_page'])
+        if page['sort']:
+            opts.update(sort=page['sort'], order=page['order'])
+        
+        next_url = None
+        next_cursor = Utils.encode_cursor(next_key)
+        if next_cursor:
+            trail = page['prev'] + [page['cursor'] or '']
+            next_url = url_for(endpoint, cursor=next_cursor, prev='.'.join(trail) or None, **opts)
+        
+        prev_url = None
+        if page['cursor']:
+            trail = page['prev'][:-1]
+            prev_cursor = page['prev'][-1] if page['prev'] else None
+            prev_url = url_for(endpoint, cursor=prev_cursor or None, prev='.'.join(trail) or None, **opts)
+        
+        return {
+            'next_url': next_url,
+            'prev_url': prev_url,
+            'page_number': len(page['prev']) + (2 if page['cursor'] else 1),
+            'per_page': page['per_page'],
+            'sort': page['sort'],
+            'order': page['order'],
+            'sort_fields': sort_fields,
+            'extra': extra
+        }
+
+    @staticmethod
+    def generate_email_html(subject, body_content):
+        """Generates a styled HTML email template."""
+        year = datetime.now().year
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <body style="margin:0; padding:0; background-color: #f3f4f6; font-family: 'Inter', sans-serif;">
+            <div style="max-width: 600px; margin: 40px auto; background: white; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);">
+                <div style="background: linear-gradient(135deg, #4F46E5 0%, #06B6D4 100%); padding: 32px 24px; text-align: center;">
+                    <h1 style="margin:0; color:white; font-size: 24px; font-weight: 800;">Instant Library</h1>
+                    <p style="margin:8px 0 0; color: rgba(255,255,255,0.9); font-size: 14px;">Greenfield University</p>
+                </div>
+                <div style="padding: 32px 24px;">
+                    <h2 style="margin-top:0; color: #111827; font-size: 20px;">{subject}</h2>
+                    <div style="color: #4B5563; line-height: 1.6; font-size: 16px;">
+                        {body_content}
+                    </div>
+                </div>
+                <div style="background: #F9FAFB; padding: 20px; text-align: center; border-top: 1px solid #E5E7EB;">
+                    <p style="margin:0; color: #9CA3AF; font-size: 12px;">© {year} Greenfield University. All rights reserved.</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+class NotificationService:
+    # Background sender for enqueue(); started lazily so each forked worker gets its own thread
+    _queue = queue.Queue()
+    _worker = None
+    _worker_lock = threading.Lock()
+
+    @staticmethod
+    def subscribe(email):
+        """Subscribes a user's email to the SNS Topic."""
+        if not Config.SNS_TOPIC_ARN:
+             return
+
+        try:
+            sns_client.subscribe(
+                TopicArn=Config.SNS_TOPIC_ARN,
+                Protocol='email',
+                Endpoint=email
+            )
+            print(f" [INFO] SNS Subscription Request sent to {email}")
+        except Exception as e:
+            print(f" [ERROR] SNS Subscribe Failed: {e}")
+
+
+    @staticmethod
+    def send(to_email, subject, body):
+        """Sends an email notification via AWS SNS."""
+        if not Config.SNS_TOPIC_ARN:
+            print(f" [MOCK SNS] To: {to_email} | Subject: {subject}")
+            return
+
+        try:
+            # SNS 'email' protocol sends raw text. HTML is not supported effectively.
+            # We convert our body to plain text for readability.
+            plain_text = body.replace('<br>', '\n').replace('<br/>', '\n')
+            
+            # Simple strip of other tags if any (basic approach)
+            import re
+            plain_text = re.sub('<[^<]+?>', '', plain_text)
+
+            message = {"default": plain_text, "email": plain_text}
+            
+            sns_client.publish(
+                TopicArn=Config.SNS_TOPIC_ARN,
+                Subject=subject[:100],
+                Message=json.dumps(message),
+                MessageStructure='json'
+            )
+        except Exception as e:
+            print(f"SNS Error: {e}")
+
+    @staticmethod
+    def enqueue(to_email, subject, body):
+        """Queues a notification for the background sender instead of publishing inline."""
+        with NotificationService._worker_lock:
+            worker = NotificationService._worker
+            if worker is None or not worker.is_alive():
+                worker = threading.Thread(target=NotificationService._drain_forever, name='notifications', daemon=True)
+                worker.start()
+                NotificationService._worker = worker
+        NotificationService._queue.put((to_email, subject, body))
+
+    @staticmethod
+    def _drain_forever():
+        while True:
+            to_email, subject, body = NotificationService._queue.get()
+            try:
+                NotificationService.send(to_email, subject, body)
+            finally:
+                NotificationService._queue.task_done()
+
+    @staticmethod
+    def flush():
+        """Blocks until every queued notification has been sent."""
+        NotificationService._queue.join()
+
+class DatabaseService:
+    """Data access for the routes and services.
+
+    Caching, paging and the request workflow live here; every read and write goes through
+    `storage`, the engine chosen by Config.STORAGE_BACKEND (see STORAGE BACKENDS), so the
+    routes never depend on which database is underneath."""
+
+    @staticmethod
+    def get_user(email, fresh=False):
+        """User record from the per-worker cache; fresh=True always reads the database
+        (and refreshes the cache), for password checks."""
+        if fresh:
+            user = DatabaseService._load_user(email)
+            if user is None:
+                user_cache.invalidate(email)
+            else:
+                user_cache.put(email, user)
+            return user
+        return user_cache.get(email, DatabaseService._load_user)
+
+    @staticmethod
+    def _load_user(email):
+        return storage.get_user(email)
+
+    @staticmethod
+    def set_password(email, password_hash):
+        storage.update_user(email, {'password': password_hash})
+        user_cache.invalidate(email)
+
+    @staticmethod
+    def create_user(user_data):
+        storage.put_user(user_data)
+        user_cache.invalidate(user_data['email'])
+        if user_data.get('role') == 'staff':
+            staff_roster.invalidate()
+
+    @staticmethod
+    def query_users_by_role(role, projection=None):
+        """All users with a given role, from the role/email index."""
+        return list(DatabaseService.iter_users_by_role(role, projection))
+
+    @staticmethod
+    def iter_users_by_role(role, projection=None, page_size=None):
+        """Generator over the users with a given role, one index page in memory at a time."""
+        return storage.users_by_role(role, projection, page_size)
+
+    @staticmethod
+    def get_staff_emails():
+        """Staff notification list, served from the in-memory roster."""
+        return staff_roster.emails()
+
+    @staticmethod
+    def delete_user(email):
+        storage.delete_user(email)
+        user_cache.invalidate(email)
+        staff_roster.invalidate()
+
+    @staticmethod
+    def save_otp(record):
+        storage.put_otp(record)
+
+    @staticmethod
+    def get_otp(email):
+        return storage.get_otp(email)
+
+    @staticmethod
+    def delete_otp(email):
+        storage.delete_otp(email)
+
+    @staticmethod
+    def get_all_books(projection=None):
+        """Full catalog, served from the in-process cache when it is enabled.
+        The returned dicts are shared with the cache (full items): treat them as read-only.
+        projection only narrows the storage read when the cache is disabled."""
+        if catalog_cache.enabled:
+            return catalog_cache.all()
+        return DatabaseService.scan_all_books(projection)
+
+    @staticmethod
+    def scan_all_books(projection=None):
+        """Full catalog read straight from storage, every page."""
+        return list(storage.scan(Config.TABLE_BOOKS, projection=projection))
+
+    @staticmethod
+    def get_books_page(page_size=Config.CATALOG_PAGE_SIZE, start_key=None, sort_by=None, descending=False,
+                       projection=None, only=None):
+        """Returns one page of the catalog as (books, next_key).
+        From the cache the sort is global; straight from storage (cache disabled)
+        pages follow the table's key order and sort_by orders rows within the page.
+        only (book ids, e.g. from facet_index.browse) always pages through the cache, which
+        with the cache disabled reuses the request's one catalog load."""
+        if catalog_cache.enabled or only is not None:
+            return catalog_cache.page(page_size, start_key, sort_by, descending, only)
+        
+        items, start_key = storage.books_page(page_size, start_key,
+                                              Utils.projection_names(projection, [sort_by] if sort_by else ()))
+        if sort_by:
+            items.sort(key=lambda b: Utils.sort_key(b.get(sort_by)), reverse=descending)
+        return items, start_key
+
+    @staticmethod
+    def get_book(book_id, consistent=False, projection=None):
+        return storage.get_book(str(book_id), consistent, projection)
+
+    @staticmethod
+    def add_book(book):
+        storage.put_book(book)
+        catalog_cache.put(book)
+
+    @staticmethod
+    def update_book(book_id, fields):
+        """Overwrites the given fields; returns the book as it was before (None if it did not exist)."""
+        old_book = storage.update_book(str(book_id), fields)
+        catalog_cache.put(dict(old_book or {}, id=str(book_id), **fields))
+        return old_book
+
+    @staticmethod
+    def delete_book(book_id):
+        """Deletes a book; returns the deleted item (None if it did not exist)."""
+        old_book = storage.delete_book(str(book_id))
+        catalog_cache.remove(book_id)
+        return old_book
+
+    @staticmethod
+    def put_books(books):
+        """Upserts many books at once (bulk import, catalog seeding). The catalog cache is not touched."""
+        storage.put_books(books)
+
+    @staticmethod
+    def count_books():
+        return storage.count(Config.TABLE_BOOKS)
+
+    @staticmethod
+    def batch_get(table_name, ids, projection=None, consistent=False):
+        """Fetches items by their 'id' key and returns {id: item}; ids are deduplicated."""
+        unique_ids = list(dict.fromkeys(str(i) for i in ids if i is not None))
+        if not unique_ids:
+            return {}
+        return storage.batch_get(table_name, unique_ids, Utils.projection_names(projection, ['id']), consistent)
+
+    @staticmethod
+    def get_books_batch(ids, projection=None, consistent=False):
+        """Fetches specific books by id; returns {id: book}."""
+        return DatabaseService.batch_get(Config.TABLE_BOOKS, ids, projection, consistent)
+
+    @staticmethod
+    def get_books_map(ids, projection=None):
+        """{id: book} for just the referenced books: from the catalog cache when it is
+        already warm, otherwise one batch read so a cold worker never scans the table."""
+        if catalog_cache.is_warm:
+            books = {}
+            for book_id in ids:
+                book = catalog_cache.get(book_id)
+                if book:
+                    books[str(book_id)] = book
+            return books
+        return DatabaseService.get_books_batch(ids, projection)
+
+    @staticmethod
+    def scan_table(table_name, segments=None, projection=None, page_size=None):
+        """Generator over every item in a table (Config.TABLE_*). On DynamoDB this is a
+        parallel scan over `segments` workers; items arrive in no particular order."""
+        return storage.scan(table_name, segments, projection, page_size)
+
+    @staticmethod
+    def create_request(item):
+        storage.put_request(item)
+
+    @staticmethod
+    def get_request(req_id):
+        return storage.get_request(str(req_id))
+
+    @staticmethod
+    def query_user_requests(email, limit=None, start_key=None, newest_first=True, match=None,
+                            projection=None, since=None, until=None):
+        """Queries one page of a student's requests from the user_email/date index, optionally
+        limited to a since/until date range on the sort key. match maps attribute -> value
+        (or tuple of accepted values) to filter on.
+        Returns (items, next_key); pass the key back as start_key for the next page."""
+        return storage.user_requests(email, limit, start_key, newest_first, match,
+                                     Utils.projection_names(projection), since, until)
+
+    @staticmethod
+    def get_user_requests(email, newest_first=True, match=None, projection=None, since=None, until=None):
+        """Returns all of a student's requests (in the date range, if given), following every page."""
+        items, start_key = [], None
+        while True:
+            page, start_key = DatabaseService.query_user_requests(
+                email, start_key=start_key, newest_first=newest_first, match=match,
+                projection=projection, since=since, until=until)
+            items.extend(page)
+            if not start_key:
+                return items
+
+    @staticmethod
+    def query_requests_by_status(statuses, limit=Config.REQUESTS_PAGE_SIZE, cursor=None, projection=None,
+                                 since=None, until=None):
+        """Returns one newest-first page of requests in the given statuses, from the status/date index.
+        
+        Each status is its own index partition, so one page is read from each and merged by date;
+        since/until become a key range on the sort key, so a date window reads only its own items.
+        cursor maps status -> start key for that partition (None once it is exhausted).
+        Returns (items, next_cursor); next_cursor is None after the last page."""
+        cursor = cursor or {}
+        # The merge and the next cursor need each item's keys
+        names = Utils.projection_names(projection, ['id', 'status', 'date'])
+        batches, has_more = {}, {}
+        for status in statuses:
+            if status in cursor and cursor[status] is None:
+                continue
+            batches[status], next_key = storage.requests_by_status(status, limit, cursor.get(status), names,
+                                                                   since, until)
+            has_more[status] = next_key is not None
+        
+        # Stable sort keeps each partition's own index order for equal dates
+        merged = sorted((r for batch in batches.values() for r in batch), key=lambda r: r.get('date', ''), reverse=True)
+        page = merged[:limit]
+        
+        next_cursor = {}
+        for status in statuses:
+            if status not in batches:
+                next_cursor[status] = None
+                continue
+            consumed = [r for r in page if r['status'] == status]
+            if len(consumed) == len(batches[status]) and not has_more[status]:
+                next_cursor[status] = None
+            elif consumed:
+                last = consumed[-1]
+                next_cursor[status] = {'id': last['id'], 'status': status, 'date': last['date']}
+            elif cursor.get(status):
+                next_cursor[status] = cursor[status]
+            # else: nothing read from this partition yet, start from its top next time
+        
+        if all(v is None for v in next_cursor.values()) and len(next_cursor) == len(statuses):
+            return page, None
+        return page, next_cursor
+
+    @staticmethod
+    def count_requests_by_status(status, since=None, until=None):
+        """Counts one status partition of the status/date index (or a date range of it) without reading item bodies."""
+        return storage.count_requests_by_status(status, since, until)
+
+    @staticmethod
+    def next_waitlisted(book_id, limit=1):
+        """The longest-waiting requests for a book, oldest first, from the sparse waitlist index.
+        Only waitlisted requests carry waitlist_book, so this reads just the head of the queue."""
+        return storage.waitlist_head(str(book_id), limit)
+
+    @staticmethod
+    def promote_waitlist(book_id, count=1):
+        """Moves up to `count` of a book's oldest waitlisted requests to pending; returns them.
+        
+        Each promotion is the usual conditional status transition, so a request another staff
+        member approved or rejected meanwhile is skipped and the next one in line is tried."""
+        promoted, attempts = [], count + Config.WAITLIST_PROMOTE_RETRIES
+        while len(promoted) < count and attempts > 0:
+            queue_head = DatabaseService.next_waitlisted(book_id, limit=count - len(promoted))
+            if not queue_head:
+                break
+            for req in queue_head:
+                attempts -= 1
+                if DatabaseService.transition_request(req, 'pending') == 'ok':
+                    promoted.append(req)
+        return promoted
+
+    @staticmethod
+    def backfill_waitlist():
+        """Adds the waitlist index keys to waitlisted requests created before the index existed.
+        Their queue position falls back to the request date. Returns how many were updated."""
+        return storage.backfill_waitlist()
+
+    @staticmethod
+    def transition_request(req, new_status, copies_delta=0):
+        """Moves a request to new_status in one transaction.
+        
+        The request must still hold the status it was read with, so two staff acting at
+        once cannot both process it. With copies_delta the book's copies change in the same
+        transaction; a decrement is conditional on enough copies, so stock never goes negative.
+        Returns 'ok', 'out_of_stock', 'missing_book' or 'conflict'."""
+        copies = [(str(req['book_id']), copies_delta)] if copies_delta else []
+        failed = storage.transact(copies, [(req, new_status)])
+        if failed is None:
+            return 'ok'
+        if copies_delta and failed == 0:
+            return 'out_of_stock' if copies_delta < 0 else 'missing_book'
+        return 'conflict'
+
+    @staticmethod
+    def bulk_transition(plans):
+        """Applies many (req, new_status, copies_delta) transitions; returns {req_id: outcome}.
+        
+        Plans are split into BULK_WORKERS lanes by book, so transactions touching the same
+        book never race each other, and each lane is packed into transactions of up to
+        TRANSACT_MAX_ITEMS actions with the copies changes for a book folded into one
+        conditional update. Lanes run in parallel. If a packed transaction is cancelled (a
+        stale status, not enough stock for everyone) its plans are retried one by one with
+        transition_request so each request still gets its own exact outcome."""
+        lanes = [[] for _ in range(Config.BULK_WORKERS)]
+        for plan in plans:
+            lanes[zlib.crc32(str(plan[0]['book_id']).encode()) % len(lanes)].append(plan)
+        
+        def pack(lane):
+            chunks, current, actions, chunk_books = [], [], 0, set()
+            for plan in lane:
+                req, _, copies_delta = plan
+                book_id = str(req['book_id'])
+                cost = 1 + (1 if copies_delta and book_id not in chunk_books else 0)
+                if current and actions + cost > Config.TRANSACT_MAX_ITEMS:
+                    chunks.append(current)
+                    current, actions, chunk_books = [], 0, set()
+                    cost = 1 + (1 if copies_delta else 0)
+                current.append(plan)
+                actions += cost
+                if copies_delta:
+                    chunk_books.add(book_id)
+            if current:
+                chunks.append(current)
+            return chunks
+        
+        def run_chunk(chunk):
+            per_book = {}
+            for req, _, copies_delta in chunk:
+                if copies_delta:
+                    book_id = str(req['book_id'])
+                    per_book[book_id] = per_book.get(book_id, 0) + copies_delta
+            copies = [(b, d) for b, d in per_book.items() if d]
+            if storage.transact(copies, [(req, new_status) for req, new_status, _ in chunk]) is None:
+                return {str(req['id']): 'ok' for req, _, _ in chunk}
+            return {str(req['id']): DatabaseService.transition_request(req, new_status, copies_delta)
+                    for req, new_status, copies_delta in chunk}
+        
+        def run_lane(lane):
+            outcomes = {}
+            for chunk in pack(lane):
+                outcomes.update(run_chunk(chunk))
+            return outcomes
+        
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=Config.BULK_WORKERS) as executor:
+            for result in executor.map(run_lane, [lane for lane in lanes if lane]):
+                outcomes.update(result)
+        return outcomes
+
+    @staticmethod
+    def has_open_request(email, book_id):
+        """True if the student already has a pending/waitlisted request for this book."""
+        open_requests = DatabaseService.get_user_requests(
+            email, match={'book_id': str(book_id), 'status': ('pending', 'waitlisted')}, projection=['id'])
+        return len(open_requests) > 0
+
+class StatsService:
+    """Pre-aggregated analytics counters in InstantLibrary_Stats.
+    
+    One 'totals' item holds the library-wide counters (books, requests, low stock and one
+    requests_<status> counter per status); one 'book#<id>' item per book holds its request
+    count and is indexed by the popularity GSI for the top-N chart. All updates are atomic
+    adds in the storage engine (ADD expressions on DynamoDB), so concurrent workers never
+    lose increments. Writes that bypass the app (console edits, scripts) are reconciled
+    with `python manage.py rebuild-stats`.
+    """
+    TOTALS_ID = 'totals'
+    STATUSES = ('pending', 'approved', 'rejected', 'returned', 'waitlisted')  # Chart colour order
+
+    @staticmethod
+    def _add(stat_id, deltas, set_values=None):
+        """Atomically ADDs the non-zero deltas (and SETs set_values) on one stats item."""
+        deltas = {k: v for k, v in deltas.items() if v}
+        set_values = set_values or {}
+        if not deltas and not set_values:
+            return
+        try:
+            storage.add_stats(stat_id, deltas, set_values)
+        except Exception as e:
+            # Counters are best-effort; never fail the user's action over them
+            print(f" [ERROR] Stats update failed ({stat_id}): {e}")
+
+    @staticmethod
+    def low_stock_delta(old_copies, new_copies):
+        was_low, is_low = (old_copies or 0) < 1, (new_copies or 0) < 1
+        return int(is_low) - int(was_low)
+
+    @staticmethod
+    def record_request(book, status):
+        StatsService._add(StatsService.TOTALS_ID, {'total_requests': 1, f'requests_{status}': 1})
+        StatsService._add(f"book#{book['id']}", {'request_count': 1},
+                          {'kind': 'book', 'book_id': str(book['id']), 'title': book.get('title', 'Unknown Book')})
+
+    @staticmethod
+    def record_transition(old_status, new_status, low_stock_delta=0):
+        StatsService.record_transitions([(old_status, new_status)], low_stock_delta)
+
+    @staticmethod
+    def record_transitions(transitions, low_stock_delta=0):
+        """Folds many (old_status, new_status) moves into a single ADD on the totals item."""
+        deltas = {'low_stock': low_stock_delta}
+        for old_status, new_status in transitions:
+            if old_status != new_status:
+                deltas[f'requests_{old_status}'] = deltas.get(f'requests_{old_status}', 0) - 1
+                deltas[f'requests_{new_status}'] = deltas.get(f'requests_{new_status}', 0) + 1
+        StatsService._add(StatsService.TOTALS_ID, deltas)
+
+    @staticmethod
+    def record_book_added(book):
+        StatsService._add(StatsService.TOTALS_ID, {'total_books': 1, 'low_stock': StatsService.low_stock_delta(1, book.get('copies'))})
+
+    @staticmethod
+    def record_book_edited(old_book, new_book):
+        StatsService._add(StatsService.TOTALS_ID, {'low_stock': StatsService.low_stock_delta(old_book.get('copies'), new_book.get('copies'))})
+        if old_book.get('title') != new_book.get('title'):
+            # Only retitles books that already have a popularity item
+            storage.retitle_stat(f"book#{new_book['id']}", new_book.get('title'))
+
+    @staticmethod
+    def record_book_removed(book):
+        StatsService._add(StatsService.TOTALS_ID, {'total_books': -1, 'low_stock': -StatsService.low_stock_delta(1, book.get('copies'))})
+        try:
+            storage.delete_stat(f"book#{book['id']}")
+        except Exception as e:
+            print(f" [ERROR] Stats delete failed: {e}")
+
+    @staticmethod
+    def get_dashboard(top_n=5):
+        """Analytics payload from one GetItem and one top-N index query.
+        Backfills once if the counters have never been built: the totals item is missing,
+        or holds only the ADDs made since deploy (no rebuilt_at from rebuild())."""
+        totals = storage.get_stat(StatsService.TOTALS_ID)
+        if totals is None or 'rebuilt_at' not in totals:
+            totals = StatsService.rebuild()
+        
+        popular = storage.top_stats('book', top_n)
+        
+        status_counts = {s.capitalize(): totals.get(f'requests_{s}', 0) for s in StatsService.STATUSES}
+        status_counts = {label: count for label, count in status_counts.items() if count > 0}
+        
+        return {
+            'total_books': totals.get('total_books', 0),
+            'total_requests': totals.get('total_requests', 0),
+            'pending_requests': totals.get('requests_pending', 0),
+            'low_stock': totals.get('low_stock', 0),
+            'popular_labels': [p.get('title', 'Unknown Book') for p in popular],
+            'popular_data': [p.get('request_count', 0) for p in popular],
+            'status_labels': list(status_counts.keys()),
+            'status_data': list(status_counts.values())
+        }
+
+    @staticmethod
+    def book_popularity():
+        """{book_id: request_count} for every book that has been requested."""
+        return {item['book_id']: item.get('request_count', 0)
+                for item in DatabaseService.scan_table(Config.TABLE_STATS, projection=['kind', 'book_id', 'request_count'])
+                if item.get('kind') == 'book' and 'book_id' in item}
+
+    @staticmethod
+    def rebuild():
+        """Recomputes every counter from the Books and Requests tables (parallel scans) and
+        overwrites the stats items. Returns the new totals item."""
+        books = {str(b['id']): b for b in DatabaseService.scan_table(Config.TABLE_BOOKS, projection='analytics')}
+        totals = {'stat_id': StatsService.TOTALS_ID, 'total_books': len(books), 'total_requests': 0,
+                  'low_stock': sum(1 for b in books.values() if (b.get('copies') or 0) < 1),
+                  'rebuilt_at': Utils.timestamp()}
+        per_book = {}
+        for r in DatabaseService.scan_table(Config.TABLE_REQUESTS, projection='analytics'):
+            totals['total_requests'] += 1
+            key = f"requests_{r.get('status', 'unknown')}"
+            totals[key] = totals.get(key, 0) + 1
+            if str(r.get('book_id')) in books:
+                per_book[str(r['book_id'])] = per_book.get(str(r['book_id']), 0) + 1
+        
+        stale = [i['stat_id'] for i in DatabaseService.scan_table(Config.TABLE_STATS, projection=['stat_id'])
+                 if i['stat_id'] != StatsService.TOTALS_ID and i['stat_id'][len('book#'):] not in per_book]
+        items = [totals] + [{'stat_id': f'book#{book_id}', 'kind': 'book', 'book_id': book_id,
+                             'title': books[book_id].get('title', 'Unknown Book'), 'request_count': count}
+                            for book_id, count in per_book.items()]
+        storage.replace_stats(items, stale)
+        return totals
+
+class CatalogCache:
+    """Per-worker, in-memory copy of InstantLibrary_Books.
+    
+    The whole table is loaded (via a parallel scan) on first use and reloaded once it is
+    older than `ttl` seconds. Writes made through this worker are applied write-through
+    with put()/remove(), so they are visible immediately; writes from other workers show
+    up after at most `ttl` seconds. `version` increases on every reload or write so
+    derived structures (sorted views, indexes) know when to rebuild; those that can update
+    in place ask changes_since() for just the books that changed.
+    
+    With ttl 0 the cache is disabled: nothing is kept between requests, but one load
+    still serves every read within the request that made it (one scan, not one per call).
+    """
+
+    def __init__(self, loader, ttl):
+        self._loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._books = {}
+        self._loaded_at = None
+        self._views = {}  # (sort_by, descending) -> (version, ordered books, {id: position})
+        self._changes = deque()  # (version, book_id) per change, oldest first
+        self._changes_from = 0   # The log is complete for every version >= this
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @property
+    def is_warm(self):
+        """True when reads would be served without touching DynamoDB."""
+        return self.enabled and self._fresh()
+
+    def _fresh(self):
+        if self._loaded_at is None:
+            return False
+        if not self.enabled:
+            return has_request_context() and g.get('catalog_loaded', False)
+        return time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        if self._fresh():
+            self.hits += 1
+            return
+        with self._lock:
+            if self._fresh():  # Another thread reloaded while we waited
+                self.hits += 1
+                return
+            self.misses += 1
+            books = {str(b['id']): b for b in self._loader()}
+            if self._loaded_at is None:
+                changed = None  # First load or after invalidate(): no baseline to diff against
+            else:
+                changed = [book_id for book_id, book in books.items() if self._books.get(book_id) != book]
+                changed += [book_id for book_id in self._books if book_id not in books]
+            self._books = books
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            self._log_changes(changed)
+            if has_request_context():
+                g.catalog_loaded = True
+
+    def _log_changes(self, book_ids):
+        """Records the books changed at the current version; None (or too many) restarts the log."""
+        if book_ids is None or len(book_ids) > Config.CATALOG_CHANGE_LOG_SIZE:
+            self._changes.clear()
+            self._changes_from = self.version
+            return
+        self._changes.extend((self.version, book_id) for book_id in book_ids)
+        while len(self._changes) > Config.CATALOG_CHANGE_LOG_SIZE:
+            self._changes_from = self._changes.popleft()[0]
+
+    def changes_since(self, version):
+        """(current version, ids of books added, edited or removed after `version`, {id: book}).
+        The ids are None when the log no longer reaches back that far: rebuild from the books.
+        The books are the cache's own mapping at that version, from the same single load;
+        treat it as read-only."""
+        self._ensure_loaded()
+        with self._lock:
+            if version == self.version:
+                return self.version, set(), self._books
+            if version < self._changes_from:
+                return self.version, None, self._books
+            return self.version, {book_id for v, book_id in self._changes if v > version}, self._books
+
+    def all(self):
+        self._ensure_loaded()
+        return list(self._books.values())
+
+    def get(self, book_id):
+        self._ensure_loaded()
+        return self._books.get(str(book_id))
+
+    def page(self, page_size, start_key=None, sort_by=None, descending=False, only=None):
+        """Cursor page over a globally sorted view. The cursor is {'id': last_id_of_previous_page}.
+        only restricts the view to those book ids, kept in the view's order."""
+        self._ensure_loaded()
+        ordered, positions = self._view(sort_by, descending)
+        if only is not None:
+            ordered = [ordered[i] for i in sorted(positions[book_id] for book_id in only if book_id in positions)]
+            positions = {str(b['id']): i for i, b in enumerate(ordered)}
+        start = 0
+        if start_key:
+            # Unknown id (book deleted since the link was made) restarts from the top
+            start = positions.get(str(start_key.get('id')), -1) + 1
+        books = ordered[start:start + page_size]
+        next_key = {'id': str(books[-1]['id'])} if books and start + page_size < len(ordered) else None
+        return books, next_key
+
+    def _view(self, sort_by, descending):
+        with self._lock:
+            key = (sort_by, descending)
+            cached = self._views.get(key)
+            if cached and cached[0] == self.version:
+                return cached[1], cached[2]
+            if sort_by:
+                ordered = sorted(self._books.values(),
+                                 key=lambda b: (Utils.sort_key(b.get(sort_by)), str(b['id'])), reverse=descending)
+            else:
+                ordered = sorted(self._books.values(), key=lambda b: str(b['id']))
+            positions = {str(b['id']): i for i, b in enumerate(ordered)}
+            self._views[key] = (self.version, ordered, positions)
+            return ordered, positions
+
+    def put(self, book):
+        """Write-through for an added or updated book."""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # Nothing cached yet; the first read will load it
+            self._books[str(book['id'])] = dict(book)
+            self.version += 1
+            self._log_changes([str(book['id'])])
+
+    def remove(self, book_id):
+        with self._lock:
+            if self._books.pop(str(book_id), None) is not None:
+                self.version += 1
+                self._log_changes([str(book_id)])
+
+    def invalidate(self):
+        """Drops everything; the next read reloads from DynamoDB."""
+        with self._lock:
+            self._loaded_at = None
+            self._books = {}
+            self._views = {}
+            self.version += 1
+            self._log_changes(None)
+
+    def stats(self):
+        return {'version': self.version, 'books': len(self._books), 'hits': self.hits, 'misses': self.misses,
+                'age_seconds': None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1)}
+
+class CatalogIndex:
+    """Base for per-worker lookup structures derived from the catalog cache.
+    
+    Subclasses implement _rebuild(books), _add(book) and _remove(book_id), and _fields(book)
+    for the part of a book they read. sync() (called before each lookup) re-indexes only
+    the books changed since the cache version last seen, so adds, edits and deletes cost
+    one book each, and a change outside _fields (copies for search) costs nothing; a full
+    rebuild happens only after a cache invalidate() or a reload that changed most of the
+    catalog. All structure changes happen under the index lock, and _changed() runs after
+    each sync that made any.
+    """
+    _WORD = re.compile(r'[^\W_]+')
+
+    def __init__(self, source):
+        self._source = source
+        self.version = -1  # Catalog cache version the index reflects
+        self._indexed = {}  # book_id -> _fields(book) as last indexed
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def tokenize(text):
+        """Lower-case words with accents removed: 'Émile Zola' -> ['emile', 'zola']."""
+        text = unicodedata.normalize('NFKD', str(text or '')).casefold()
+        return CatalogIndex._WORD.findall(''.join(ch for ch in text if not unicodedata.combining(ch)))
+
+    def sync(self):
+        """Brings the index up to date with the catalog cache. Returns the cache's {id: book}
+        it synced from, so lookups resolve ids from the same load instead of one get() each."""
+        version, changed, books = self._source.changes_since(self.version)
+        if version == self.version:
+            return books
+        with self._lock:
+            if version == self.version:
+                return books  # Another thread got here first
+            if changed is None:
+                self._rebuild(list(books.values()))
+                self._indexed = {book_id: self._fields(book) for book_id, book in books.items()}
+                touched = True
+            else:
+                # Re-applying a change is harmless, so racing with newer writes only repeats work
+                touched = False
+                for book_id in changed:
+                    book = books.get(book_id)
+                    fields = None if book is None else self._fields(book)
+                    if fields is not None and fields == self._indexed.get(book_id):
+                        continue
+                    self._remove(book_id)
+                    if book is None:
+                        self._indexed.pop(book_id, None)
+                    else:
+                        self._add(book)
+                        self._indexed[book_id] = fields
+                    touched = True
+            self.version = version
+            if touched:
+                self._changed()
+        return books
+
+    def _fields(self, book):
+        """What the index reads from a book; a change that leaves this equal skips re-indexing."""
+        return dict(book)
+
+    def _rebuild(self, books):
+        raise NotImplementedError
+
+    def _add(self, book):
+        raise NotImplementedError
+
+    def _remove(self, book_id):
+        raise NotImplementedError
+
+    def _changed(self):
+        pass
+
+class SearchIndex(CatalogIndex):
+    """Per-worker inverted index over the catalog, ranked with BM25.
+    
+    Title, author, category and ISBN are tokenized (case-folded, accents stripped) into
+    postings of term -> {book_id: field-weighted term frequency}, so a query reads only the
+    postings of its own words and costs in proportion to the books that match them, not to
+    the catalog. Kept current book by book from the catalog cache (see CatalogIndex).
+    
+    Typos: every alphabetic term is also filed under its trigrams ('$ha', 'har', ...,
+    'ry$'). A query word with no postings of its own looks up the terms sharing its
+    trigrams (only those, never the whole vocabulary), keeps the ones within Config.FUZZY_*
+    similarity and edit distance, and searches for them instead, scored by similarity.
+    """
+    FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'category': 1.0, 'isbn': 1.0}
+    K1 = 1.2
+    B = 0.75
+    # Dropped from queries that have other words (chat messages are full sentences)
+    STOPWORDS = frozenset((
+        'a', 'about', 'an', 'and', 'any', 'are', 'as', 'at', 'by', 'can', 'do', 'does', 'for', 'from', 'have',
+        'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'the', 'there', 'to', 'what', 'with', 'you'))
+
+    def __init__(self, source):
+        super().__init__(source)
+        self._postings = {}   # term -> {book_id: weighted tf}
+        self._terms = []      # Sorted vocabulary, for prefix expansion
+        self._doc_terms = {}  # book_id -> its terms, to unindex it
+        self._lengths = {}    # book_id -> weighted length
+        self._total_length = 0.0
+        self._trigrams = {}   # trigram -> {term}, alphabetic terms only
+
+    @staticmethod
+    def _field_tokens(field, value):
+        if field == 'isbn':
+            try:
+                isbn = Utils.normalize_isbn(value)
+                return [isbn.lower()] if isbn else []
+            except ValueError:
+                pass
+        return CatalogIndex.tokenize(value)
+
+    @staticmethod
+    def trigrams(word):
+        padded = f'${word}$'
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def edit_distance(a, b, limit):
+        """Edit distance counting an adjacent swap as one edit; anything over limit is limit + 1."""
+        if abs(len(a) - len(b)) > limit:
+            return limit + 1
+        before, previous = None, list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            current = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    current[j] = min(current[j], before[j - 2] + 1)
+            if min(current) > limit:
+                return limit + 1
+            before, previous = previous, current
+        return min(previous[-1], limit + 1)
+
+    def _file_trigrams(self, term):
+        if term.isalpha() and len(term) >= 3:
+            for gram in self.trigrams(term):
+                self._trigrams.setdefault(gram, set()).add(term)
+
+    def _unfile_trigrams(self, term):
+        if term.isalpha() and len(term) >= 3:
+            for gram in self.trigrams(term):
+                terms = self._trigrams[gram]
+                terms.discard(term)
+                if not terms:
+                    del self._trigrams[gram]
+
+    def similar_terms(self, word, limit=Config.FUZZY_EXPANSIONS):
+        """Index terms a misspelled word probably meant: [(term, similarity)], best first.
+        A term within max_edits shares at least `needed` of the word's trigrams (an edit
+        breaks at most three), so it must appear in one of the len(grams) - needed + 1
+        rarest trigram lists; the most common lists are never read."""
+        if not word.isalpha() or len(word) < 3:
+            return []
+        grams = self.trigrams(word)
+        max_edits = 1 if len(word) <= 5 else 2
+        needed = max(1, len(grams) - 3 * max_edits,
+                     math.ceil(Config.FUZZY_MIN_SIMILARITY * (2 * len(grams) - max_edits) / 2))
+        lists = sorted((self._trigrams.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*lists[:len(grams) - needed + 1])
+        
+        matches = []
+        for term in candidates:
+            if abs(len(term) - len(word)) > max_edits:
+                continue
+            term_grams = self.trigrams(term)
+            similarity = 2.0 * len(grams & term_grams) / (len(grams) + len(term_grams))  # Dice
+            if similarity < Config.FUZZY_MIN_SIMILARITY:
+                continue
+            edits = self.edit_distance(word, term, max_edits)
+            if edits <= max_edits:
+                matches.append((edits, -similarity, -len(self._postings[term]), term))
+        return [(term, -negative_similarity) for _, negative_similarity, _, term in sorted(matches)[:limit]]
+
+    def _fields(self, book):
+        return tuple(book.get(field) for field in self.FIELD_WEIGHTS)
+
+    def _rebuild(self, books):
+        self._postings, self._doc_terms, self._lengths, self._total_length = {}, {}, {}, 0.0
+        for book in books:
+            self._add(book, keep_sorted=False)
+        self._terms = sorted(self._postings)
+        self._trigrams = {}
+        for term in self._terms:
+            self._file_trigrams(term)
+
+    def _add(self, book, keep_sorted=True):
+        book_id = str(book['id'])
+        frequencies, length = {}, 0.0
+        for field, weight in self.FIELD_WEIGHTS.items():
+            tokens = self._field_tokens(field, book.get(field))
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+            length += weight * len(tokens)
+        self._doc_terms[book_id] = list(frequencies)
+        self._lengths[book_id] = length
+        self._total_length += length
+        for term, tf in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self._terms, term)
+                    self._file_trigrams(term)
+            postings[book_id] = tf
+
+    def _remove(self, book_id):
+        terms = self._doc_terms.pop(book_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(book_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[book_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+                self._unfile_trigrams(term)
+
+    def _expand(self, prefix):
+        """Index terms starting with prefix, the shortest first (at most SEARCH_PREFIX_TERMS)."""
+        start = bisect.bisect_left(self._terms, prefix)
+        stop = bisect.bisect_left(self._terms, prefix + '\uffff')
+        return sorted(self._terms[start:stop], key=len)[:Config.SEARCH_PREFIX_TERMS]
+
+    def query_words(self, query):
+        """The words a query searches for: an ISBN as one term, otherwise its non-stopword tokens."""
+        try:
+            isbn = Utils.normalize_isbn(query)
+            if isbn:
+                return [isbn.lower()]
+        except ValueError:
+            pass
+        words = list(dict.fromkeys(self.tokenize(query)))
+        return [w for w in words if w not in self.STOPWORDS] or words
+
+    def _slots(self, words, last_open, fuzzy):
+        """Per query word, the [(term, weight)] it matches: itself, its completions if it is
+        the unfinished last word, or failing both (with fuzzy) its likely intended terms."""
+        slots = []
+        for i, word in enumerate(words):
+            terms = self._expand(word) if last_open and i == len(words) - 1 else [word]
+            slot = [(t, 1.0) for t in terms if t in self._postings]
+            if not slot and fuzzy:
+                slot = self.similar_terms(word)
+            slots.append(slot)
+        return slots
+
+    def corrections(self, query, prefix=True):
+        """{word: term} for the query words searched as a different (closest) term."""
+        words = self.query_words(query)
+        if not words:
+            return {}
+        self.sync()
+        with self._lock:
+            slots = self._slots(words, prefix and query[-1:].isalnum(), fuzzy=True)
+        return {word: slot[0][0] for word, slot in zip(words, slots)
+                if slot and slot[0][1] < 1.0}
+
+    def search(self, query, limit=Config.SEARCH_RESULTS, require_all=True, prefix=True, fuzzy=True, within=None):
+        """Ranked [(book, score)] for a query, best first.
+        require_all keeps only books matching every word (catalog search); otherwise any word
+        counts (chat). With prefix, an unfinished last word also matches longer terms, so
+        results follow the user as they type. With fuzzy, a word found nowhere in the index
+        matches its nearest spellings instead, scored down by how far off it was. within
+        (book ids, e.g. from facet_index.select) limits the results to those books."""
+        words = self.query_words(query)
+        if not words or within is not None and not within:
+            return []
+        books = self.sync()
+        with self._lock:
+            slots = self._slots(words, prefix and query[-1:].isalnum(), fuzzy)
+            if require_all and not all(slots):
+                return []
+            
+            candidates = set(within) if within is not None else None
+            if require_all:
+                # Intersect from the rarest word, so the work is bounded by its matches
+                for slot in sorted(slots, key=lambda s: sum(len(self._postings[t]) for t, _ in s)):
+                    docs = set().union(*(self._postings[t] for t, _ in slot))
+                    candidates = docs if candidates is None else candidates & docs
+                    if not candidates:
+                        return []
+            
+            total = len(self._lengths)
+            avg_length = self._total_length / total if total else 1.0
+            scores = {}
+            for slot in slots:
+                for term, weight in slot:
+                    postings = self._postings[term]
+                    idf = weight * math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                    if candidates is not None:
+                        # Walk the smaller side: a common word's postings can dwarf the candidates
+                        matched = ((book_id, postings[book_id]) for book_id in candidates if book_id in postings) \
+                            if len(candidates) < len(postings) else \
+                            ((book_id, tf) for book_id, tf in postings.items() if book_id in candidates)
+                    else:
+                        matched = postings.items()
+                    for book_id, tf in matched:
+                        norm = self.K1 * (1 - self.B + self.B * self._lengths[book_id] / (avg_length or 1.0))
+                        scores[book_id] = scores.get(book_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        results = []
+        for book_id, score in top:
+            book = books.get(book_id)
+            if book is not None:
+                results.append((book, score))
+        return results
+
+    def stats(self):
+        return {'version': self.version, 'books': len(self._lengths), 'terms': len(self._postings),
+                'trigrams': len(self._trigrams)}
+
+class SuggestIndex(CatalogIndex):
+    """Per-worker typeahead over normalized titles and authors.
+    
+    Every title and author (an item) is stored under its normalized form (see tokenize)
+    and under each later word start ('potter and the ...') in one sorted list of
+    (key, kind, ref), so the keys matching a prefix are the range between two bisects.
+    Items are ranked by popularity (requests per book, summed over an author's books),
+    then by shorter text. A second list holds every item in that rank order: a prefix
+    with a short key range scans the range, and a common prefix (a large range) walks the
+    rank list from the top until `limit` items match, so neither costs more than a few
+    thousand steps. Results are memoized per prefix until titles, authors or popularity change.
+    """
+    MAX_WORD_STARTS = 6  # Later word starts indexed per title/author
+
+    def __init__(self, source, popularity_loader):
+        super().__init__(source)
+        self._popularity_loader = popularity_loader
+        self._popularity = {}
+        self._popularity_at = None
+        self._entries = []       # Sorted (key, kind, ref)
+        self._ranked = []        # Sorted rank tuples (-requests, len(text), text, kind, ref)
+        self._items = {}         # (kind, ref) -> {'text', 'keys', 'rank'}
+        self._authors = {}       # author key -> {book_id}
+        self._book_authors = {}  # book_id -> author key
+        self._memo = OrderedDict()
+        self._dirty = False
+
+    def _keys(self, text):
+        tokens = self.tokenize(text)
+        keys = []
+        for position in range(min(len(tokens), self.MAX_WORD_STARTS + 1)):
+            if position and (tokens[position] in SearchIndex.STOPWORDS or len(tokens[position]) < 2):
+                continue
+            keys.append(' '.join(tokens[position:]))
+        return keys
+
+    def _score(self, kind, ref):
+        if kind == 'title':
+            return self._popularity.get(ref, 0)
+        return sum(self._popularity.get(book_id, 0) for book_id in self._authors[ref])
+
+    def _rank(self, kind, ref, text):
+        return (-self._score(kind, ref), len(text), text.casefold(), kind, ref)
+
+    @staticmethod
+    def _sorted_remove(entries, entry):
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def _put_item(self, kind, ref, text, bulk=False):
+        item = {'text': text, 'keys': self._keys(text), 'rank': self._rank(kind, ref, text)}
+        self._items[(kind, ref)] = item
+        entries = [(key, kind, ref) for key in item['keys']]
+        if bulk:
+            self._entries.extend(entries)
+            self._ranked.append(item['rank'])
+            return
+        for entry in entries:
+            bisect.insort(self._entries, entry)
+        bisect.insort(self._ranked, item['rank'])
+
+    def _drop_item(self, kind, ref):
+        item = self._items.pop((kind, ref), None)
+        if item is None:
+            return
+        for key in item['keys']:
+            self._sorted_remove(self._entries, (key, kind, ref))
+        self._sorted_remove(self._ranked, item['rank'])
+
+    def _rerank(self, kind, ref):
+        item = self._items[(kind, ref)]
+        rank = self._rank(kind, ref, item['text'])
+        if rank != item['rank']:
+            self._sorted_remove(self._ranked, item['rank'])
+            item['rank'] = rank
+            bisect.insort(self._ranked, rank)
+
+    def _fields(self, book):
+        return book.get('title'), book.get('author')
+
+    def _rebuild(self, books):
+        self._entries, self._ranked, self._items, self._authors, self._book_authors = [], [], {}, {}, {}
+        for book in books:
+            self._add(book, bulk=True)
+        for author_key in self._authors:
+            self._items[('author', author_key)]['rank'] = self._rank('author', author_key,
+                                                                     self._items[('author', author_key)]['text'])
+        self._entries.sort()
+        self._ranked = sorted(item['rank'] for item in self._items.values())
+        self._dirty = True
+
+    def _add(self, book, bulk=False):
+        book_id = str(book['id'])
+        author_key = ' '.join(self.tokenize(book.get('author')))
+        self._put_item('title', book_id, book.get('title') or '', bulk)
+        self._dirty = True
+        if not author_key:
+            return
+        self._book_authors[book_id] = author_key
+        if author_key not in self._authors:
+            self._authors[author_key] = set()
+            self._put_item('author', author_key, book.get('author'), bulk)
+        self._authors[author_key].add(book_id)
+        if not bulk:
+            self._rerank('author', author_key)
+
+    def _remove(self, book_id):
+        if ('title', book_id) not in self._items:
+            return
+        self._drop_item('title', book_id)
+        self._dirty = True
+        author_key = self._book_authors.pop(book_id, None)
+        if author_key is None:
+            return
+        self._authors[author_key].discard(book_id)
+        if self._authors[author_key]:
+            self._rerank('author', author_key)
+        else:
+            del self._authors[author_key]
+            self._drop_item('author', author_key)
+
+    def _changed(self):
+        if self._dirty:
+            self._memo.clear()
+            self._dirty = False
+
+    def _refresh_popularity(self):
+        """Reloads the per-book request counts every SUGGEST_POPULARITY_TTL seconds and re-ranks."""
+        now = time.monotonic()
+        if self._popularity_at is not None and now - self._popularity_at < Config.SUGGEST_POPULARITY_TTL:
+            return
+        try:
+            popularity = self._popularity_loader()
+        except Exception as e:
+            print(f" [WARN] Suggest popularity refresh failed: {e}")
+            popularity = self._popularity
+        with self._lock:
+            self._popularity_at = now
+            if popularity == self._popularity:
+                return
+            self._popularity = popularity
+            for (kind, ref), item in self._items.items():
+                item['rank'] = self._rank(kind, ref, item['text'])
+            self._ranked = sorted(item['rank'] for item in self._items.values())
+            self._memo.clear()
+
+    def suggest(self, query, limit=Config.SUGGEST_RESULTS):
+        """Up to `limit` completions for a typed prefix, most requested first:
+        [{'text', 'type' ('title' or 'author'), 'book_id' (titles only), 'requests'}]."""
+        prefix = ' '.join(self.tokenize(query))
+        if not prefix:
+            return []
+        self.sync()
+        self._refresh_popularity()
+        with self._lock:
+            memo_key = (prefix, limit)
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+            
+            start = bisect.bisect_left(self._entries, (prefix,))
+            stop = bisect.bisect_left(self._entries, (prefix + '\uffff',), start)
+            if stop - start <= Config.SUGGEST_SCAN_LIMIT:
+                matches = {(kind, ref) for _, kind, ref in self._entries[start:stop]}
+                candidates = sorted(self._items[m]['rank'] for m in matches)
+            else:
+                candidates = (rank for rank in self._ranked
+                              if any(key.startswith(prefix) for key in self._items[rank[3:]]['keys']))
+            
+            suggestions, seen = [], set()
+            for rank in candidates:
+                kind, ref = rank[3:]
+                if (kind, rank[2]) in seen:
+                    continue  # Same title held under several ids
+                seen.add((kind, rank[2]))
+                suggestion = {'text': self._items[(kind, ref)]['text'], 'type': kind, 'requests': -rank[0]}
+                if kind == 'title':
+                    suggestion['book_id'] = ref
+                suggestions.append(suggestion)
+                if len(suggestions) == limit:
+                    break
+            
+            self._memo[memo_key] = suggestions
+            if len(self._memo) > Config.SUGGEST_MEMO_SIZE:
+                self._memo.popitem(last=False)
+            return suggestions
+
+    def stats(self):
+        return {'version': self.version, 'entries': len(self._entries), 'items': len(self._items),
+                'memoized': len(self._memo)}
+
+class FacetIndex(CatalogIndex):
+    """Per-worker facets over the catalog: category, author and availability.
+    
+    Every book holds a small integer slot, and every facet value a bitset (a Python int
+    with bit n set when the book in slot n has that value). Narrowing by several facets is
+    an AND of a few ints and a count is a popcount, so neither walks the books. Counts are
+    disjunctive: a facet's own selection does not narrow its counts, so other values stay
+    one click away. Kept current book by book from the catalog cache, so a copies change
+    (handle_request) re-files only that book's bits.
+    """
+    FACETS = ('category', 'author', 'availability')
+    AVAILABILITY = {'in_stock': 'In stock', 'out_of_stock': 'Out of stock'}
+    TALLY_COST = 4096  # A book tallied costs about as much as ANDing this many bits
+    _popcount = staticmethod(int.bit_count if hasattr(int, 'bit_count') else lambda bits: bin(bits).count('1'))
+
+    def __init__(self, source):
+        super().__init__(source)
+        self._rebuild([])
+
+    def key(self, facet, value):
+        """The value a book is filed under: normalized words, or an AVAILABILITY key."""
+        if facet == 'availability':
+            return value if value in self.AVAILABILITY else None
+        return ' '.join(self.tokenize(value)) or None
+
+    def _book_keys(self, book):
+        try:
+            copies = int(book.get('copies') or 0)
+        except (TypeError, ValueError):
+            copies = 0
+        return {'category': self.key('category', book.get('category')),
+                'author': self.key('author', book.get('author')),
+                'availability': 'in_stock' if copies >= 1 else 'out_of_stock'}
+
+    def _fields(self, book):
+        return book.get('category'), book.get('author'), self._book_keys(book)['availability']
+
+    def _rebuild(self, books):
+        self._slots = {}      # book_id -> slot
+        self._ids = []        # slot -> book_id (None when free)
+        self._free = []
+        self._all = 0         # Bits of every occupied slot
+        self._slot_keys = {facet: [] for facet in self.FACETS}  # facet -> slot -> key
+        self._bits = {facet: {} for facet in self.FACETS}    # facet -> key -> bitset
+        self._sizes = {facet: {} for facet in self.FACETS}   # facet -> key -> books
+        self._labels = {facet: dict(self.AVAILABILITY) if facet == 'availability' else {} for facet in self.FACETS}
+        self._memo = OrderedDict()  # (filters, limit) -> counts, cleared on every change
+        for book in books:
+            self._add(book)
+
+    def _changed(self):
+        self._memo.clear()
+
+    def _add(self, book):
+        book_id = str(book['id'])
+        slot = self._free.pop() if self._free else len(self._ids)
+        if slot == len(self._ids):
+            self._ids.append(None)
+            for keys in self._slot_keys.values():
+                keys.append(None)
+        self._ids[slot] = book_id
+        self._slots[book_id] = slot
+        bit = 1 << slot
+        self._all |= bit
+        for facet, key in self._book_keys(book).items():
+            self._slot_keys[facet][slot] = key
+            if key is None:
+                continue
+            self._bits[facet][key] = self._bits[facet].get(key, 0) | bit
+            self._sizes[facet][key] = self._sizes[facet].get(key, 0) + 1
+            if facet != 'availability':
+                self._labels[facet].setdefault(key, str(book.get(facet)).strip())
+
+    def _remove(self, book_id):
+        slot = self._slots.pop(book_id, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+        self._all ^= bit
+        for facet in self.FACETS:
+            key, self._slot_keys[facet][slot] = self._slot_keys[facet][slot], None
+            if key is None:
+                continue
+            self._sizes[facet][key] -= 1
+            if self._sizes[facet][key]:
+                self._bits[facet][key] ^= bit
+            else:
+                del self._bits[facet][key], self._sizes[facet][key]
+                if facet != 'availability':
+                    del self._labels[facet][key]
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def filter_args(self, args):
+        """{facet: key} for the facets selected in a query string; unknown values are dropped."""
+        filters = {}
+        for facet in self.FACETS:
+            key = self.key(facet, args.get(facet, ''))
+            if key:
+                filters[facet] = key
+        return filters
+
+    def _mask(self, filters, skip=None):
+        mask = self._all
+        for facet, key in filters.items():
+            if facet != skip:
+                mask &= self._bits[facet].get(key, 0)
+        return mask
+
+    @staticmethod
+    def _positions(mask):
+        """Slots whose bit is set in mask, lowest first."""
+        return [match.start() for match in re.finditer('1', bin(mask)[:1:-1])]
+
+    def select(self, filters):
+        """Ids of the books matching every {facet: key} in filters."""
+        self.sync()
+        with self._lock:
+            return set(map(self._ids.__getitem__, self._positions(self._mask(filters))))
+
+    def browse(self, filters):
+        """(ids matching filters or None without any, counts(filters)) from one sync, so a
+        page's books and its facet counts describe the same catalog version."""
+        self.sync()
+        with self._lock:
+            only = set(map(self._ids.__getitem__, self._positions(self._mask(filters)))) if filters else None
+            return only, self.counts(filters)
+
+    def count(self, filters=None):
+        """Books matching every {facet: key} in filters (all books without)."""
+        self.sync()
+        with self._lock:
+            return self._popcount(self._mask(filters or {}))
+
+    def counts(self, filters=None, limit=Config.FACET_VALUES):
+        """{'total': matching books, 'groups': [{'name', 'selected', 'values': [{'value', 'label', 'count'}]}]}.
+        Each facet lists its `limit` largest values (plus the selected one) counted over the
+        books matching the other facets' selections."""
+        filters = filters or {}
+        self.sync()
+        with self._lock:
+            memo_key = (tuple(sorted(filters.items())), limit)
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+            
+            groups = []
+            for facet in self.FACETS:
+                mask = self._mask(filters, skip=facet)
+                if mask == self._all:
+                    counted = self._sizes[facet]
+                elif self._popcount(mask) * self.TALLY_COST < len(self._bits[facet]) * len(self._ids):
+                    # Many values (authors) and few matching books: tally the books' keys instead
+                    counted = Counter(map(self._slot_keys[facet].__getitem__, self._positions(mask)))
+                    counted.pop(None, None)
+                else:
+                    counted = {key: self._popcount(bits & mask) for key, bits in self._bits[facet].items()}
+                top = heapq.nsmallest(limit, ((-n, self._labels[facet][key], key) for key, n in counted.items() if n))
+                selected = filters.get(facet)
+                if selected and selected not in {key for _, _, key in top}:
+                    top.append((-counted.get(selected, 0), self._labels[facet].get(selected, selected), selected))
+                groups.append({'name': facet, 'selected': selected,
+                               'values': [{'value': key, 'label': label, 'count': -n} for n, label, key in top]})
+            result = self._memo[memo_key] = {'total': self._popcount(self._mask(filters)), 'groups': groups}
+            if len(self._memo) > Config.FACET_MEMO_SIZE:
+                self._memo.popitem(last=False)
+            return result
+
+    def stats(self):
+        return {'version': self.version, 'books': len(self._slots),
+                'values': {facet: len(self._bits[facet]) for facet in self.FACETS}}
+
+class StaffRoster:
+    """Per-worker cache of staff email addresses used for request notifications.
+    Loaded from the role/email GSI and kept for `ttl` seconds; staff registration
+    and user deletion invalidate it."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._emails = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def emails(self):
+        with self._lock:
+            if self._emails is None or time.monotonic() - self._loaded_at >= self.ttl:
+                staff = DatabaseService.query_users_by_role('staff', projection=['email'])
+                self._emails = [u['email'] for u in staff]
+                self._loaded_at = time.monotonic()
+            return list(self._emails)
+
+    def invalidate(self):
+        with self._lock:
+            self._emails = None
+
+class UserCache:
+    """Per-worker read-through cache of user records, keyed by email.
+    
+    Entries live for `ttl` seconds and at most `max_size` are kept (least recently used
+    are evicted first). Password changes, registration and deletion through this worker
+    invalidate the entry; changes made by other workers show up within `ttl`, which is
+    why password checks always read through with fresh=True.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # email -> (loaded_at, user)
+        self._lock = threading.Lock()
+
+    def get(self, email, loader):
+        if self.ttl <= 0:
+            return loader(email)
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(email)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        user = loader(email)
+        if user is not None:  # Unknown emails are not cached, so a new registration is seen at once
+            self.put(email, user)
+        return user
+
+    def put(self, email, user):
+        with self._lock:
+            self._entries[email] = (time.monotonic(), user)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def stats(self):
+        return {'users': len(self._entries), 'max_size': self.max_size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+class BookImporter:
+    """Streams books from CSV or JSONL into the Books table.
+    
+    Rows are read lazily, validated, and grouped into chunks that parallel workers write
+    with batch_writer, so memory stays bounded by the chunks in flight rather than the file.
+    Rows whose ISBN is already in the catalog replace that book's details under its existing
+    id, so its requests stay attached; new ISBNs get the id 'isbn_<isbn>' and ISBN-less rows an id
+    derived from title and author, which makes re-running an import idempotent.
+    
+    With a checkpoint_path the number of rows safely written is saved after every chunk,
+    and a later run over the same file skips straight past them.
+    """
+    FIELDS = ('title', 'author', 'category', 'copies', 'isbn', 'cover_url')
+
+    def __init__(self, workers=None, checkpoint_path=None, progress=None):
+        self.workers = max(1, workers or Config.IMPORT_WORKERS)
+        self.checkpoint_path = checkpoint_path
+        self.progress = progress  # Called with the running report after every chunk
+        self.isbn_ids = None
+        self.known_ids = None
+
+    @staticmethod
+    def detect_format(filename):
+        name = (filename or '').lower()
+        return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+    @staticmethod
+    def read_rows(lines, fmt):
+        """Yields one dict per data row from an iterable of text lines."""
+        if fmt == 'jsonl':
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield row if isinstance(row, dict) else {'__error__': 'not a JSON object'}
+        else:
+            reader = csv.DictReader(lines)
+            for row in reader:
+                yield {str(k or '').strip().lower(): v for k, v in row.items()}
+
+    @staticmethod
+    def validate(row):
+        """Maps a raw row to a book item (without id); raises ValueError on bad data."""
+        if '__error__' in row:
+            raise ValueError(row['__error__'])
+        title = str(row.get('title') or '').strip()
+        if not title:
+            raise ValueError("missing title")
+        copies = row.get('copies')
+        try:
+            copies = 1 if copies in (None, '') else int(str(copies).strip())
+        except ValueError:
+            raise ValueError(f"copies must be a whole number, got '{copies}'")
+        if copies < 0:
+            raise ValueError("copies cannot be negative")
+        
+        book = {
+            'title': title[:200],
+            'author': str(row.get('author') or '').strip() or 'Unknown',
+            'category': str(row.get('category') or '').strip() or 'General',
+            'copies': copies
+        }
+        isbn = Utils.normalize_isbn(row.get('isbn'))
+        if isbn:
+            book['isbn'] = isbn
+        cover_url = str(row.get('cover_url') or '').strip()
+        if cover_url:
+            book['cover_url'] = cover_url
+        return book
+
+    def _assign_id(self, book):
+        """Returns True if the book updates an existing title."""
+        isbn = book.get('isbn')
+        if isbn:
+            book['id'] = self.isbn_ids.setdefault(isbn, f"isbn_{isbn}")
+        else:
+            book['id'] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{book['title']}|{book['author']}".lower()))
+        existed = book['id'] in self.known_ids
+        self.known_ids.add(book['id'])
+        return existed
+
+    def _load_catalog_keys(self):
+        self.isbn_ids, self.known_ids = {}, set()
+        for item in DatabaseService.scan_table(Config.TABLE_BOOKS, projection=['id', 'isbn']):
+            self.known_ids.add(item['id'])
+            try:
+                isbn = Utils.normalize_isbn(item.get('isbn'))
+            except ValueError:
+                continue
+            if isbn:
+                self.isbn_ids.setdefault(isbn, item['id'])
+
+    def _read_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, report):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(report, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @staticmethod
+    def _write_chunk(books):
+        DatabaseService.put_books(books)
+
+    def run(self, lines, fmt='csv'):
+        """Imports every row; returns a report with row, insert, update and error counts."""
+        report = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+        checkpoint = self._read_checkpoint()
+        if checkpoint:
+            report.update(checkpoint)
+        resumed_at = report['rows']
+        self._load_catalog_keys()
+        
+        started = time.monotonic()
+        done_chunks, next_seq = {}, 0
+        
+        def finish(future):
+            nonlocal next_seq
+            seq, rows_end, inserted, updated = in_flight.pop(future)
+            future.result()
+            done_chunks[seq] = (rows_end, inserted, updated)
+            # Only advance the watermark over a contiguous run of written chunks
+            while next_seq in done_chunks:
+                rows_end, inserted, updated = done_chunks.pop(next_seq)
+                report['rows'] = rows_end
+                report['inserted'] += inserted
+                report['updated'] += updated
+                next_seq += 1
+            report['rows_per_second'] = round((report['rows'] - resumed_at) / max(time.monotonic() - started, 1e-6))
+            if self.checkpoint_path:
+                self._write_checkpoint(report)
+            if self.progress:
+                self.progress(report)
+        
+        in_flight, seq = {}, 0
+        chunk, inserted, updated, row_no = [], 0, 0, resumed_at
+        
+        def submit():
+            nonlocal chunk, inserted, updated, seq
+            while len(in_flight) >= self.workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future)
+            in_flight[executor.submit(self._write_chunk, chunk)] = (seq, row_no, inserted, updated)
+            chunk, inserted, updated, seq = [], 0, 0, seq + 1
+        
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import') as executor:
+            rows = self.read_rows(lines, fmt)
+            for _ in range(resumed_at):
+                next(rows, None)  # Already imported by the interrupted run
+            for row in rows:
+                row_no += 1
+                try:
+                    book = self.validate(row)
+                except ValueError as e:
+                    report['failed'] += 1
+                    if len(report['errors']) < Config.IMPORT_MAX_ERRORS:
+                        report['errors'].append({'row': row_no, 'error': str(e)})
+                    continue
+                if self._assign_id(book):
+                    updated += 1
+                else:
+                    inserted += 1
+                chunk.append(book)
+                if len(chunk) >= Config.IMPORT_CHUNK_ROWS:
+                    submit()
+            if chunk or row_no > report['rows']:
+                submit()
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future)
+        
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        catalog_cache.invalidate()
+        StatsService.rebuild()
+        return report
+
+class DataExporter:
+    """Streams a dataset out as CSV or NDJSON text chunks.
+    
+    Items come from a paginated scan (or a parallel scan, or the role GSI for students)
+    with a projection of just the exported columns, and are encoded as they arrive, so
+    memory holds one page plus one output chunk no matter how large the table is.
+    Passwords and other unlisted attributes are never read.
+    """
+    DATASETS = {
+        'books': ('id', 'title', 'author', 'category', 'copies', 'isbn', 'cover_url'),
+        'requests': ('id', 'user_email', 'book_id', 'status', 'date'),
+        'students': ('email', 'name', 'roll_no', 'semester', 'year', 'created_at')
+    }
+    FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+    @staticmethod
+    def items(dataset, parallel=False):
+        columns = list(DataExporter.DATASETS[dataset])
+        if dataset == 'students':
+            return DatabaseService.iter_users_by_role('student', projection=columns, page_size=Config.EXPORT_PAGE_SIZE)
+        table_name = Config.TABLE_BOOKS if dataset == 'books' else Config.TABLE_REQUESTS
+        return DatabaseService.scan_table(table_name, segments=None if parallel else 1,
+                                          projection=columns, page_size=Config.EXPORT_PAGE_SIZE)
+
+    @staticmethod
+    def stream(dataset, fmt='csv', parallel=False):
+        """Generator of text chunks of roughly EXPORT_CHUNK_BYTES."""
+        columns = DataExporter.DATASETS[dataset]
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=columns, extrasaction='ignore', lineterminator='\n')
+        if fmt == 'csv':
+            writer.writeheader()
+        for item in DataExporter.items(dataset, parallel):
+            if fmt == 'csv':
+                writer.writerow(item)
+            else:
+                buf.write(json.dumps({c: item[c] for c in columns if c in item}) + '\n')
+            if buf.tell() >= Config.EXPORT_CHUNK_BYTES:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+staff_roster = StaffRoster(ttl=Config.STAFF_ROSTER_TTL)
+
+user_cache = UserCache(ttl=Config.USER_CACHE_TTL, max_size=Config.USER_CACHE_SIZE)
+
+catalog_cache = CatalogCache(loader=lambda: DatabaseService.scan_table(Config.TABLE_BOOKS), ttl=Config.CATALOG_CACHE_TTL)
+
+search_index = SearchIndex(catalog_cache)
+
+suggest_index = SuggestIndex(catalog_cache, popularity_loader=lambda: StatsService.book_popularity())
+
+facet_index = FacetIndex(catalog_cache)
+
+# =============================================================================
+# STORAGE BACKENDS
+# =============================================================================
+class StorageBackend:
+    """Repository interface behind DatabaseService and StatsService.
+
+    Items are plain dicts shaped like the DynamoDB items (string ids, ISO dates, int/float
+    numbers); absent attributes are simply missing. Page keys (start_key / next_key) are
+    opaque JSON-able dicts. `projection` is a list of attribute names or None for whole
+    items. Conditional writes report failures through return values, never engine errors.
+    """
+    name = None
+
+    # Users and password-reset codes
+    def get_user(self, email):
+        raise NotImplementedError
+
+    def put_user(self, user):
+        raise NotImplementedError
+
+    def update_user(self, email, fields):
+        raise NotImplementedError
+
+    def delete_user(self, email):
+        raise NotImplementedError
+
+    def users_by_role(self, role, projection=None, page_size=None):
+        """Generator over the users with a role, in email order."""
+        raise NotImplementedError
+
+    def put_otp(self, record):
+        raise NotImplementedError
+
+    def get_otp(self, email):
+        raise NotImplementedError
+
+    def delete_otp(self, email):
+        raise NotImplementedError
+
+    # Books
+    def get_book(self, book_id, consistent=False, projection=None):
+        raise NotImplementedError
+
+    def books_page(self, page_size, start_key=None, projection=None):
+        """One page of books in the table's own order: (books, next_key)."""
+        raise NotImplementedError
+
+    def put_book(self, book):
+        raise NotImplementedError
+
+    def put_books(self, books):
+        """Upserts many books; the last of several with one id wins."""
+        raise NotImplementedError
+
+    def update_book(self, book_id, fields):
+        """SETs fields on a book (creating it if needed); returns the old item or None."""
+        raise NotImplementedError
+
+    def delete_book(self, book_id):
+        """Returns the deleted item, or None if there was none."""
+        raise NotImplementedError
+
+    # Any table by name (Config.TABLE_*)
+    def batch_get(self, table_name, ids, projection=None, consistent=False):
+        """{id: item} for the ids that exist."""
+        raise NotImplementedError
+
+    def scan(self, table_name, segments=None, projection=None, page_size=None):
+        """Generator over every item in a table, in no particular order."""
+        raise NotImplementedError
+
+    def count(self, table_name):
+        raise NotImplementedError
+
+    # Requests
+    def put_request(self, item):
+        raise NotImplementedError
+
+    def get_request(self, req_id):
+        raise NotImplementedError
+
+    def user_requests(self, email, limit=None, start_key=None, newest_first=True, match=None, projection=None,
+                      since=None, until=None):
+        """One page of a student's requests by date: (items, next_key)."""
+        raise NotImplementedError
+
+    def requests_by_status(self, status, limit, start_key=None, projection=None, since=None, until=None):
+        """One newest-first page of a status partition: (items, next_key)."""
+        raise NotImplementedError
+
+    def count_requests_by_status(self, status, since=None, until=None):
+        raise NotImplementedError
+
+    def waitlist_head(self, book_id, limit=1):
+        """A book's waitlisted requests, longest-waiting first."""
+        raise NotImplementedError
+
+    def backfill_waitlist(self):
+        raise NotImplementedError
+
+    def transact(self, copies_changes, status_changes):
+        """Applies [(book_id, copies_delta)] and [(req, new_status)] all-or-nothing.
+
+        A copies decrement needs that many copies in stock and an increment needs the book
+        to exist; a status change needs the request to still hold req['status'], and leaving
+        the waitlist drops waitlist_book. Returns None once applied, otherwise the position
+        (copies changes first, then status changes) of the first action whose condition
+        failed, or -1 if the transaction was cancelled for another reason."""
+        raise NotImplementedError
+
+    # Analytics counters
+    def get_stat(self, stat_id):
+        raise NotImplementedError
+
+    def add_stats(self, stat_id, deltas, set_values=None):
+        """Atomically adds deltas to numeric attributes (missing ones count as 0) and sets set_values."""
+        raise NotImplementedError
+
+    def retitle_stat(self, stat_id, title):
+        """Sets title only if the item already exists."""
+        raise NotImplementedError
+
+    def delete_stat(self, stat_id):
+        raise NotImplementedError
+
+    def top_stats(self, kind, limit):
+        """Items of a kind with the highest request_count first."""
+        raise NotImplementedError
+
+    def replace_stats(self, items, stale_ids):
+        """Overwrites the given stats items and deletes stale_ids (used by StatsService.rebuild)."""
+        raise NotImplementedError
+
+    @staticmethod
+    def matches(item, match):
+        """True if item passes a {attribute: value or tuple of values} filter."""
+        for attr, expected in (match or {}).items():
+            value = item.get(attr)
+            if value not in expected if isinstance(expected, (tuple, list, set)) else value != expected:
+                return False
+        return True
+
+class DynamoDBBackend(StorageBackend):
+    """The production engine: the InstantLibrary_* tables and their GSIs.
+    Server-side projections, key conditions on the GSI sort keys and TransactWriteItems
+    do the work; reads of a table go through `aws` (see AWS CLIENTS & SERVICES SETUP)."""
+    name = 'dynamodb'
+
+    TABLES = {
+        Config.TABLE_USERS: users_table,
+        Config.TABLE_BOOKS: books_table,
+        Config.TABLE_REQUESTS: requests_table,
+        Config.TABLE_OTP: password_resets_table,
+        Config.TABLE_STATS: stats_table
+    }
+
+    def get_user(self, email):
+        try:
+            return users_table.get_item(Key={'email': email}).get('Item')
+        except ClientError:
+            return None
+
+    def put_user(self, user):
+        users_table.put_item(Item=user)
+
+    def update_user(self, email, fields):
+        names = {f'#f{i}': attr for i, attr in enumerate(fields)}
+        users_table.update_item(
+            Key={'email': email},
+            UpdateExpression='SET ' + ', '.join(f'{n} = :f{i}' for i, n in enumerate(names)),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f':f{i}': value for i, value in enumerate(fields.values())}
+        )
+
+    def delete_user(self, email):
+        users_table.delete_item(Key={'email': email})
+
+    def users_by_role(self, role, projection=None, page_size=None):
+        from boto3.dynamodb.conditions import Key
+        kwargs = {
+            'IndexName': Config.INDEX_USERS_BY_ROLE,
+            'KeyConditionExpression': Key('role').eq(role)
+        }
+        kwargs.update(Utils.projection_args(projection))
+        if page_size:
+            kwargs['Limit'] = page_size
+        while True:
+            resp = users_table.query(**kwargs)
+            yield from resp.get('Items', [])
+            if 'LastEvaluatedKey' not in resp:
+                return
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def put_otp(self, record):
+        password_resets_table.put_item(Item=record)
+
+    def get_otp(self, email):
+        return password_resets_table.get_item(Key={'email': email}).get('Item')
+
+    def delete_otp(self, email):
+        password_resets_table.delete_item(Key={'email': email})
+
+    def get_book(self, book_id, consistent=False, projection=None):
+        resp = books_table.get_item(Key={'id': book_id}, ConsistentRead=consistent,
+                                    **Utils.projection_args(projection))
+        return resp.get('Item')
+
+    def books_page(self, page_size, start_key=None, projection=None):
+        items = []
+        kwargs = dict(Utils.projection_args(projection), Limit=page_size)
+        while True:
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            resp = books_table.scan(**kwargs)
+            items.extend(resp.get('Items', []))
+            start_key = resp.get('LastEvaluatedKey')
+            # A scan page can stop short of Limit at the 1 MB boundary; top it up
+            if not start_key or len(items) >= page_size:
+                return items, start_key
+            kwargs['Limit'] = page_size - len(items)
+
+    def put_book(self, book):
+        books_table.put_item(Item=book)
+
+    def put_books(self, books):
+        from boto3.dynamodb.table import BatchWriter
+        # One BatchWriter per call on the thread-safe client; overwrite_by_pkeys drops in-batch duplicates
+        with BatchWriter(Config.TABLE_BOOKS, books_table.meta.client, overwrite_by_pkeys=['id']) as batch:
+            for book in books:
+                batch.put_item(Item=book)
+
+    def update_book(self, book_id, fields):
+        names = {f'#f{i}': attr for i, attr in enumerate(fields)}
+        resp = books_table.update_item(
+            Key={'id': book_id},
+            UpdateExpression='SET ' + ', '.join(f'{n} = :f{i}' for i, n in enumerate(names)),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f':f{i}': value for i, value in enumerate(fields.values())},
+            ReturnValues='ALL_OLD'
+        )
+        return resp.get('Attributes')
+
+    def delete_book(self, book_id):
+        return books_table.delete_item(Key={'id': book_id}, ReturnValues='ALL_OLD').get('Attributes')
+
+    def batch_get(self, table_name, ids, projection=None, consistent=False):
+        """BatchGetItem, BATCH_GET_SIZE keys per call; UnprocessedKeys (throttling / 16 MB
+        limit) are retried with exponential backoff."""
+        table_args = dict(Utils.projection_args(projection), ConsistentRead=consistent)
+        found = {}
+        for start in range(0, len(ids), Config.BATCH_GET_SIZE):
+            chunk = ids[start:start + Config.BATCH_GET_SIZE]
+            pending = {table_name: dict(table_args, Keys=[{'id': i} for i in chunk])}
+            attempt = 0
+            while pending:
+                resp = dynamodb.batch_get_item(RequestItems=pending)
+                for item in resp.get('Responses', {}).get(table_name, []):
+                    found[str(item['id'])] = item
+                pending = resp.get('UnprocessedKeys') or None
+                if pending:
+                    attempt += 1
+                    if attempt > Config.BATCH_MAX_RETRIES:
+                        print(f" [WARN] BatchGetItem gave up with unprocessed keys: {pending}")
+                        break
+                    time.sleep(min(0.05 * (2 ** attempt), 2.0))
+        return found
+
+    def scan(self, table_name, segments=None, projection=None, page_size=None):
+        """Parallel scan: each Segment/TotalSegments slice runs on its own thread and follows
+        LastEvaluatedKey to the end; pages are merged through a bounded queue and yielded
+        as they arrive."""
+        segments = max(1, segments or Config.SCAN_SEGMENTS)
+        # The resource's client is thread-safe (the Table resource is not) and already deserializes items
+        client = self.TABLES[table_name].meta.client
+        base = dict(Utils.projection_args(projection), TableName=table_name)
+        if page_size:
+            base['Limit'] = page_size
+
+        pages = queue.Queue(maxsize=segments * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(entry):
+            # Give up if the consumer has gone away, instead of blocking the worker forever
+            while not stop.is_set():
+                try:
+                    pages.put(entry, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def scan_segment(segment):
+            kwargs = dict(base, Segment=segment, TotalSegments=segments)
+            try:
+                while not stop.is_set():
+                    resp = client.scan(**kwargs)
+                    put(resp.get('Items', []))
+                    if 'LastEvaluatedKey' not in resp:
+                        break
+                    kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        executor = ThreadPoolExecutor(max_workers=segments, thread_name_prefix='scan')
+        try:
+            for segment in range(segments):
+                executor.submit(scan_segment, segment)
+            remaining = segments
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                yield from page
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
+
+    def count(self, table_name):
+        total, kwargs = 0, {'Select': 'COUNT'}
+        while True:
+            resp = self.TABLES[table_name].scan(**kwargs)
+            total += resp.get('Count', 0)
+            if 'LastEvaluatedKey' not in resp:
+                return total
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def put_request(self, item):
+        requests_table.put_item(Item=item)
+
+    def get_request(self, req_id):
+        return requests_table.get_item(Key={'id': req_id}).get('Item')
+
+    @staticmethod
+    def _date_condition(partition, since=None, until=None):
+        """Adds a since/until range on the 'date' sort key to a partition key condition."""
+        from boto3.dynamodb.conditions import Key
+        since, until = Utils.date_bounds(since, until)
+        if since and until:
+            return partition & Key('date').between(since, until)
+        if since:
+            return partition & Key('date').gte(since)
+        if until:
+            return partition & Key('date').lte(until)
+        return partition
+
+    def user_requests(self, email, limit=None, start_key=None, newest_first=True, match=None, projection=None,
+                      since=None, until=None):
+        from boto3.dynamodb.conditions import Key, Attr
+        kwargs = {
+            'IndexName': Config.INDEX_REQUESTS_BY_USER,
+            'KeyConditionExpression': self._date_condition(Key('user_email').eq(email), since, until),
+            'ScanIndexForward': not newest_first
+        }
+        if limit:
+            kwargs['Limit'] = limit
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        if match:
+            conditions = [Attr(attr).is_in(list(v)) if isinstance(v, (tuple, list, set)) else Attr(attr).eq(v)
+                          for attr, v in match.items()]
+            kwargs['FilterExpression'] = conditions[0]
+            for condition in conditions[1:]:
+                kwargs['FilterExpression'] &= condition
+        kwargs.update(Utils.projection_args(projection))
+        resp = requests_table.query(**kwargs)
+        return resp.get('Items', []), resp.get('LastEvaluatedKey')
+
+    def requests_by_status(self, status, limit, start_key=None, projection=None, since=None, until=None):
+        from boto3.dynamodb.conditions import Key
+        kwargs = {
+            'IndexName': Config.INDEX_REQUESTS_BY_STATUS,
+            'KeyConditionExpression': self._date_condition(Key('status').eq(status), since, until),
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        kwargs.update(Utils.projection_args(projection))
+        resp = requests_table.query(**kwargs)
+        return resp.get('Items', []), resp.get('LastEvaluatedKey')
+
+    def count_requests_by_status(self, status, since=None, until=None):
+        from boto3.dynamodb.conditions import Key
+        total, kwargs = 0, {
+            'IndexName': Config.INDEX_REQUESTS_BY_STATUS,
+            'KeyConditionExpression': self._date_condition(Key('status').eq(status), since, until),
+            'Select': 'COUNT'
+        }
+        while True:
+            resp = requests_table.query(**kwargs)
+            total += resp.get('Count', 0)
+            if 'LastEvaluatedKey' not in resp:
+                return total
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    def waitlist_head(self, book_id, limit=1):
+        from boto3.dynamodb.conditions import Key
+        resp = requests_table.query(
+            IndexName=Config.INDEX_WAITLIST,
+            KeyConditionExpression=Key('waitlist_book').eq(book_id),
+            ScanIndexForward=True,
+            Limit=limit
+        )
+        return resp.get('Items', [])
+
+    def backfill_waitlist(self):
+        from boto3.dynamodb.conditions import Key
+        updated, kwargs = 0, {
+            'IndexName': Config.INDEX_REQUESTS_BY_STATUS,
+            'KeyConditionExpression': Key('status').eq('waitlisted'),
+            'ScanIndexForward': True
+        }
+        while True:
+            resp = requests_table.query(**kwargs)
+            for req in resp.get('Items', []):
+                if 'waitlist_book' in req:
+                    continue
+                requests_table.update_item(
+                    Key={'id': req['id']},
+                    UpdateExpression='SET waitlist_book = :book, waitlisted_at = if_not_exists(waitlisted_at, :at)',
+                    ExpressionAttributeValues={':book': str(req['book_id']), ':at': Utils.waitlist_position(req)}
+                )
+                updated += 1
+            if 'LastEvaluatedKey' not in resp:
+                return updated
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    @staticmethod
+    def _copies_update(book_id, copies_delta):
+        """Transaction action changing a book's copies; decrements require enough stock."""
+        update = {
+            'TableName': Config.TABLE_BOOKS,
+            'Key': {'id': str(book_id)},
+            'UpdateExpression': 'SET copies = copies + :delta',
+            'ExpressionAttributeValues': {':delta': copies_delta}
+        }
+        if copies_delta < 0:
+            update['ConditionExpression'] = 'copies >= :needed'
+            update['ExpressionAttributeValues'][':needed'] = -copies_delta
+        else:
+            update['ConditionExpression'] = 'attribute_exists(id)'
+        return {'Update': update}
+
+    @staticmethod
+    def _status_update(req, new_status):
+        """Transaction action moving a request on, only if it still holds the status it was read with.
+        Leaving the waitlist drops waitlist_book, which takes the request out of the waitlist GSI."""
+        update_expression = 'SET #s = :new'
+        if req['status'] == 'waitlisted' and new_status != 'waitlisted':
+            update_expression += ' REMOVE waitlist_book'
+        return {'Update': {
+            'TableName': Config.TABLE_REQUESTS,
+            'Key': {'id': str(req['id'])},
+            'UpdateExpression': update_expression,
+            'ConditionExpression': '#s = :current',
+            'ExpressionAttributeNames': {'#s': 'status'},
+            'ExpressionAttributeValues': {':new': new_status, ':current': req['status']}
+        }}
+
+    def transact(self, copies_changes, status_changes):
+        items = [self._copies_update(book_id, delta) for book_id, delta in copies_changes]
+        items += [self._status_update(req, new_status) for req, new_status in status_changes]
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=items)
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+            return reasons.index('ConditionalCheckFailed') if 'ConditionalCheckFailed' in reasons else -1
+
+    def get_stat(self, stat_id):
+        return stats_table.get_item(Key={'stat_id': stat_id}).get('Item')
+
+    def add_stats(self, stat_id, deltas, set_values=None):
+        names, values, clauses = {}, {}, []
+        if deltas:
+            adds = []
+            for i, (attr, delta) in enumerate(deltas.items()):
+                names[f'#a{i}'], values[f':a{i}'] = attr, delta
+                adds.append(f'#a{i} :a{i}')
+            clauses.append('ADD ' + ', '.join(adds))
+        if set_values:
+            sets = []
+            for i, (attr, value) in enumerate(set_values.items()):
+                names[f'#s{i}'], values[f':s{i}'] = attr, value
+                sets.append(f'#s{i} = :s{i}')
+            clauses.append('SET ' + ', '.join(sets))
+        stats_table.update_item(Key={'stat_id': stat_id}, UpdateExpression=' '.join(clauses),
+                                ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+
+    def retitle_stat(self, stat_id, title):
+        try:
+            stats_table.update_item(Key={'stat_id': stat_id}, UpdateExpression='SET title = :t',
+                                    ConditionExpression='attribute_exists(stat_id)',
+                                    ExpressionAttributeValues={':t': title})
+        except ClientError:
+            pass
+
+    def delete_stat(self, stat_id):
+        stats_table.delete_item(Key={'stat_id': stat_id})
+
+    def top_stats(self, kind, limit):
+        from boto3.dynamodb.conditions import Key
+        return stats_table.query(
+            IndexName=Config.INDEX_STATS_BY_POPULARITY,
+            KeyConditionExpression=Key('kind').eq(kind),
+            ScanIndexForward=False,
+            Limit=limit
+        ).get('Items', [])
+
+    def replace_stats(self, items, stale_ids):
+        with stats_table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+            for stat_id in stale_ids:
+                batch.delete_item(Key={'stat_id': stat_id})
+
+class SortedIndex:
+    """Partitioned sorted index for the in-memory engine: partition -> sorted [(sort, key)].
+    Inserts and deletes are a bisect plus a list shift; range reads are two bisects."""
+
+    def __init__(self):
+        self._partitions = {}
+
+    def add(self, partition, sort, key):
+        entries = self._partitions.setdefault(partition, [])
+        bisect.insort(entries, (sort, key))
+
+    def remove(self, partition, sort, key):
+        entries = self._partitions.get(partition)
+        if not entries:
+            return
+        i = bisect.bisect_left(entries, (sort, key))
+        if i < len(entries) and entries[i] == (sort, key):
+            del entries[i]
+            if not entries:
+                del self._partitions[partition]
+
+    def range(self, partition, low=None, high=None, descending=False, after=None):
+        """Entries with low <= sort <= high, in order, starting after the (sort, key) entry `after`."""
+        entries = self._partitions.get(partition, [])
+        start = 0 if low is None else bisect.bisect_left(entries, (low,))
+        stop = len(entries) if high is None else bisect.bisect_right(entries, (high, '\uffff'))
+        if after is not None:
+            if descending:
+                stop = min(stop, bisect.bisect_left(entries, after))
+            else:
+                start = max(start, bisect.bisect_right(entries, after))
+        if descending:
+            return [entries[i] for i in range(stop - 1, start - 1, -1)]
+        return entries[start:stop]
+
+    def count(self, partition, low=None, high=None):
+        entries = self._partitions.get(partition, [])
+        start = 0 if low is None else bisect.bisect_left(entries, (low,))
+        stop = len(entries) if high is None else bisect.bisect_right(entries, (high, '\uffff'))
+        return max(0, stop - start)
 
-# =============================================================================
-# AWS CLIENTS & SERVICES SETUP
-# =============================================================================
-try:
-    dynamodb = boto3.resource('dynamodb', region_name=Config.AWS_REGION)
-    sns_client = boto3.client('sns', region_name=Config.AWS_REGION)
-    
-    # Table Resources
-    users_table = dynamodb.Table(Config.TABLE_USERS)
-    books_table = dynamodb.Table(Config.TABLE_BOOKS)
-    requests_table = dynamodb.Table(Config.TABLE_REQUESTS)
-    password_resets_table = dynamodb.Table(Config.TABLE_OTP)
-except Exception as e:
-    print(f"CRITICAL: Failed to connect to AWS Services. Error: {e}")
-
-# AI Model Setup
-model = None
-if Config.GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-flash-latest')
-    except Exception as e:
-        print(f"AI Setup Warning: {e}")
+class MemoryBackend(StorageBackend):
+    """Indexed in-process engine for benchmarks, load tests and local runs without moto.
 
-# =============================================================================
-# UTILITIES & HELPER CLASSES
-# =============================================================================
-class Utils:
-    @staticmethod
-    def generate_otp():
-        """Generates a 6-digit numeric OTP."""
-        return ''.join(random.choices(string.digits, k=6))
+    Each table is a dict keyed by its primary key, and every DynamoDB GSI the app queries
+    is mirrored by a SortedIndex, so reads cost what they cost on DynamoDB (a key lookup or
+    a range) minus the network. One lock serialises writes, which makes transact() atomic.
+    Data lives and dies with the process, and each worker process has its own copy."""
+    name = 'memory'
 
-    @staticmethod
-    def convert_decimals(obj):
-        """Recursively converts DynamoDB Decimal types to int/float for JSON serialization."""
-        if isinstance(obj, list):
-            return [Utils.convert_decimals(item) for item in obj]
-        elif isinstance(obj, dict):
-            return {k: Utils.convert_decimals(v) for k, v in obj.items()}
-        elif isinstance(obj, Decimal):
-            return int(obj) if obj % 1 == 0 else float(obj)
-        return obj
+    KEYS = {
+        Config.TABLE_USERS: 'email',
+        Config.TABLE_BOOKS: 'id',
+        Config.TABLE_REQUESTS: 'id',
+        Config.TABLE_OTP: 'email',
+        Config.TABLE_STATS: 'stat_id'
+    }
+    # table -> {index name: (partition attribute, sort attribute)}; items lacking either are not indexed
+    INDEXES = {
+        Config.TABLE_USERS: {'role': ('role', 'email')},
+        Config.TABLE_BOOKS: {'ids': (None, 'id')},
+        Config.TABLE_REQUESTS: {'user': ('user_email', 'date'), 'status': ('status', 'date'),
+                                'waitlist': ('waitlist_book', 'waitlisted_at')},
+        Config.TABLE_STATS: {'popularity': ('kind', 'request_count')}
+    }
 
-    @staticmethod
-    def generate_email_html(subject, body_content):
-        """Generates a styled HTML email template."""
-        year = datetime.now().year
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <body style="margin:0; padding:0; background-color: #f3f4f6; font-family: 'Inter', sans-serif;">
-            <div style="max-width: 600px; margin: 40px auto; background: white; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1);">
-                <div style="background: linear-gradient(135deg, #4F46E5 0%, #06B6D4 100%); padding: 32px 24px; text-align: center;">
-                    <h1 style="margin:0; color:white; font-size: 24px; font-weight: 800;">Instant Library</h1>
-                    <p style="margin:8px 0 0; color: rgba(255,255,255,0.9); font-size: 14px;">Greenfield University</p>
-                </div>
-                <div style="padding: 32px 24px;">
-                    <h2 style="margin-top:0; color: #111827; font-size: 20px;">{subject}</h2>
-                    <div style="color: #4B5563; line-height: 1.6; font-size: 16px;">
-                        {body_content}
-                    </div>
-                </div>
-                <div style="background: #F9FAFB; padding: 20px; text-align: center; border-top: 1px solid #E5E7EB;">
-                    <p style="margin:0; color: #9CA3AF; font-size: 12px;">© {year} Greenfield University. All rights reserved.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+    def __init__(self):
+        self._tables = {name: {} for name in self.KEYS}
+        self._indexes = {(table, name): SortedIndex() for table, specs in self.INDEXES.items() for name in specs}
+        self._lock = threading.RLock()
 
-class NotificationService:
-    @staticmethod
-    def subscribe(email):
-        """Subscribes a user's email to the SNS Topic."""
-        if not Config.SNS_TOPIC_ARN:
-             return
+    def _index_entries(self, table, item):
+        for name, (partition, sort) in self.INDEXES.get(table, {}).items():
+            if (partition is None or item.get(partition) is not None) and item.get(sort) is not None:
+                yield self._indexes[(table, name)], (item.get(partition) if partition else None), item[sort]
 
-        try:
-            sns_client.subscribe(
-                TopicArn=Config.SNS_TOPIC_ARN,
-                Protocol='email',
-                Endpoint=email
-            )
-            print(f" [INFO] SNS Subscription Request sent to {email}")
-        except Exception as e:
-            print(f" [ERROR] SNS Subscribe Failed: {e}")
+    def _put(self, table, item):
+        """Stores a copy of item and moves its index entries; returns the old item."""
+        key = str(item[self.KEYS[table]])
+        item = dict(item)
+        with self._lock:
+            old = self._tables[table].get(key)
+            if old is not None:
+                for index, partition, sort in self._index_entries(table, old):
+                    index.remove(partition, sort, key)
+            self._tables[table][key] = item
+            for index, partition, sort in self._index_entries(table, item):
+                index.add(partition, sort, key)
+        return old
 
+    def _get(self, table, key, projection=None):
+        item = self._tables[table].get(str(key))
+        return None if item is None else Utils.project(item, projection)
 
-    @staticmethod
-    def send(to_email, subject, body):
-        """Sends an email notification via AWS SNS."""
-        if not Config.SNS_TOPIC_ARN:
-            print(f" [MOCK SNS] To: {to_email} | Subject: {subject}")
-            return
+    def _delete(self, table, key):
+        with self._lock:
+            old = self._tables[table].pop(str(key), None)
+            if old is not None:
+                for index, partition, sort in self._index_entries(table, old):
+                    index.remove(partition, sort, str(key))
+        return old
+
+    def _update(self, table, key, fields):
+        with self._lock:
+            old = self._tables[table].get(str(key))
+            self._put(table, dict(old or {self.KEYS[table]: str(key)}, **fields))
+        return None if old is None else dict(old)
+
+    def _page(self, table, entries, limit, match=None, projection=None):
+        """Items for index entries, filtered, cut at limit; next_key is the last entry's keys."""
+        items, last = [], None
+        rows = self._tables[table]
+        for entry in entries:
+            item = rows.get(entry[1])
+            if item is None or not self.matches(item, match):
+                continue
+            if limit and len(items) == limit:
+                return items, last
+            items.append(Utils.project(item, projection))
+            last = {'id': entry[1], 'sort': entry[0]}
+        return items, None
+
+    def get_user(self, email):
+        return self._get(Config.TABLE_USERS, email)
+
+    def put_user(self, user):
+        self._put(Config.TABLE_USERS, user)
+
+    def update_user(self, email, fields):
+        self._update(Config.TABLE_USERS, email, fields)
+
+    def delete_user(self, email):
+        self._delete(Config.TABLE_USERS, email)
+
+    def users_by_role(self, role, projection=None, page_size=None):
+        with self._lock:
+            emails = [key for _, key in self._indexes[(Config.TABLE_USERS, 'role')].range(role)]
+        for email in emails:
+            user = self._get(Config.TABLE_USERS, email, projection)
+            if user is not None:
+                yield user
+
+    def put_otp(self, record):
+        self._put(Config.TABLE_OTP, record)
+
+    def get_otp(self, email):
+        return self._get(Config.TABLE_OTP, email)
+
+    def delete_otp(self, email):
+        self._delete(Config.TABLE_OTP, email)
+
+    def get_book(self, book_id, consistent=False, projection=None):
+        return self._get(Config.TABLE_BOOKS, book_id, projection)
+
+    def books_page(self, page_size, start_key=None, projection=None):
+        after = (str(start_key['id']), str(start_key['id'])) if start_key and 'id' in start_key else None
+        with self._lock:
+            entries = self._indexes[(Config.TABLE_BOOKS, 'ids')].range(None, after=after)
+            items, last = self._page(Config.TABLE_BOOKS, entries, page_size, projection=projection)
+        return items, {'id': last['id']} if last else None
+
+    def put_book(self, book):
+        self._put(Config.TABLE_BOOKS, book)
+
+    def put_books(self, books):
+        with self._lock:
+            for book in books:
+                self._put(Config.TABLE_BOOKS, book)
+
+    def update_book(self, book_id, fields):
+        return self._update(Config.TABLE_BOOKS, book_id, fields)
+
+    def delete_book(self, book_id):
+        return self._delete(Config.TABLE_BOOKS, book_id)
+
+    def batch_get(self, table_name, ids, projection=None, consistent=False):
+        found = {}
+        for item_id in ids:
+            item = self._get(table_name, item_id, projection)
+            if item is not None:
+                found[str(item_id)] = item
+        return found
+
+    def scan(self, table_name, segments=None, projection=None, page_size=None):
+        with self._lock:
+            items = list(self._tables[table_name].values())
+        for item in items:
+            yield Utils.project(item, projection)
+
+    def count(self, table_name):
+        return len(self._tables[table_name])
+
+    def put_request(self, item):
+        self._put(Config.TABLE_REQUESTS, item)
+
+    def get_request(self, req_id):
+        return self._get(Config.TABLE_REQUESTS, req_id)
+
+    def _date_page(self, index, partition, limit, start_key, descending, match, projection, since, until):
+        low, high = Utils.date_bounds(since, until)
+        after = (str(start_key.get('date', '')), str(start_key.get('id', ''))) if start_key else None
+        with self._lock:
+            entries = self._indexes[(Config.TABLE_REQUESTS, index)].range(partition, low, high, descending, after)
+            items, last = self._page(Config.TABLE_REQUESTS, entries, limit, match, projection)
+        return items, {'id': last['id'], 'date': last['sort']} if last else None
+
+    def user_requests(self, email, limit=None, start_key=None, newest_first=True, match=None, projection=None,
+                      since=None, until=None):
+        return self._date_page('user', email, limit, start_key, newest_first, match, projection, since, until)
+
+    def requests_by_status(self, status, limit, start_key=None, projection=None, since=None, until=None):
+        return self._date_page('status', status, limit, start_key, True, None, projection, since, until)
+
+    def count_requests_by_status(self, status, since=None, until=None):
+        low, high = Utils.date_bounds(since, until)
+        with self._lock:
+            return self._indexes[(Config.TABLE_REQUESTS, 'status')].count(status, low, high)
+
+    def waitlist_head(self, book_id, limit=1):
+        with self._lock:
+            entries = self._indexes[(Config.TABLE_REQUESTS, 'waitlist')].range(book_id)
+            return self._page(Config.TABLE_REQUESTS, entries, limit)[0]
+
+    def backfill_waitlist(self):
+        updated = 0
+        with self._lock:
+            for _, req_id in self._indexes[(Config.TABLE_REQUESTS, 'status')].range('waitlisted'):
+                req = self._tables[Config.TABLE_REQUESTS][req_id]
+                if 'waitlist_book' not in req:
+                    self._update(Config.TABLE_REQUESTS, req_id, {
+                        'waitlist_book': str(req['book_id']),
+                        'waitlisted_at': req.get('waitlisted_at') or Utils.waitlist_position(req)})
+                    updated += 1
+        return updated
+
+    def transact(self, copies_changes, status_changes):
+        books, requests_ = self._tables[Config.TABLE_BOOKS], self._tables[Config.TABLE_REQUESTS]
+        with self._lock:
+            # Check every condition before writing anything
+            for position, (book_id, delta) in enumerate(copies_changes):
+                book = books.get(str(book_id))
+                if book is None or (delta < 0 and (book.get('copies') or 0) < -delta):
+                    return position
+            for position, (req, _) in enumerate(status_changes, start=len(copies_changes)):
+                current = requests_.get(str(req['id']))
+                if current is None or current.get('status') != req['status']:
+                    return position
+            for book_id, delta in copies_changes:
+                self._update(Config.TABLE_BOOKS, book_id, {'copies': (books[str(book_id)].get('copies') or 0) + delta})
+            for req, new_status in status_changes:
+                updated = dict(requests_[str(req['id'])], status=new_status)
+                if req['status'] == 'waitlisted' and new_status != 'waitlisted':
+                    updated.pop('waitlist_book', None)
+                self._put(Config.TABLE_REQUESTS, updated)
+        return None
+
+    def get_stat(self, stat_id):
+        return self._get(Config.TABLE_STATS, stat_id)
+
+    def add_stats(self, stat_id, deltas, set_values=None):
+        with self._lock:
+            item = dict(self._tables[Config.TABLE_STATS].get(stat_id) or {'stat_id': stat_id})
+            for attr, delta in deltas.items():
+                item[attr] = (item.get(attr) or 0) + delta
+            item.update(set_values or {})
+            self._put(Config.TABLE_STATS, item)
 
+    def retitle_stat(self, stat_id, title):
+        with self._lock:
+            if stat_id in self._tables[Config.TABLE_STATS]:
+                self._update(Config.TABLE_STATS, stat_id, {'title': title})
+
+    def delete_stat(self, stat_id):
+        self._delete(Config.TABLE_STATS, stat_id)
+
+    def top_stats(self, kind, limit):
+        with self._lock:
+            entries = self._indexes[(Config.TABLE_STATS, 'popularity')].range(kind, descending=True)[:limit]
+            return [self._get(Config.TABLE_STATS, key) for _, key in entries]
+
+    def replace_stats(self, items, stale_ids):
+        with self._lock:
+            for item in items:
+                self._put(Config.TABLE_STATS, item)
+            for stat_id in stale_ids:
+                self._delete(Config.TABLE_STATS, stat_id)
+
+class SQLiteBackend(StorageBackend):
+    """Single-host engine on one SQLite file (Config.SQLITE_PATH), shared by every worker.
+
+    Primary keys, GSI keys and copies are real columns with the same indexes as the DynamoDB
+    tables (the waitlist one is partial, so it stays sparse); every other attribute rides
+    along in a JSON 'extra' column. Each thread has its own connection, in WAL mode, and
+    conditional writes run inside BEGIN IMMEDIATE transactions."""
+    name = 'sqlite'
+
+    # table -> (SQL table, key column, other columns)
+    TABLES = {
+        Config.TABLE_USERS: ('users', 'email', ('role',)),
+        Config.TABLE_BOOKS: ('books', 'id', ('copies',)),
+        Config.TABLE_REQUESTS: ('requests', 'id', ('user_email', 'book_id', 'status', 'date',
+                                                   'waitlist_book', 'waitlisted_at')),
+        Config.TABLE_OTP: ('password_resets', 'email', ()),
+        Config.TABLE_STATS: ('stats', 'stat_id', ('kind', 'request_count'))
+    }
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, role TEXT, extra TEXT);
+        CREATE INDEX IF NOT EXISTS users_role ON users (role, email);
+        CREATE TABLE IF NOT EXISTS books (id TEXT PRIMARY KEY, copies INTEGER, extra TEXT);
+        CREATE TABLE IF NOT EXISTS requests (id TEXT PRIMARY KEY, user_email TEXT, book_id TEXT, status TEXT,
+                                             date TEXT, waitlist_book TEXT, waitlisted_at TEXT, extra TEXT);
+        CREATE INDEX IF NOT EXISTS requests_user_date ON requests (user_email, date);
+        CREATE INDEX IF NOT EXISTS requests_status_date ON requests (status, date);
+        CREATE INDEX IF NOT EXISTS requests_waitlist ON requests (waitlist_book, waitlisted_at)
+            WHERE waitlist_book IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS password_resets (email TEXT PRIMARY KEY, extra TEXT);
+        CREATE TABLE IF NOT EXISTS stats (stat_id TEXT PRIMARY KEY, kind TEXT, request_count INTEGER, extra TEXT);
+        CREATE INDEX IF NOT EXISTS stats_popularity ON stats (kind, request_count);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.SQLITE_PATH
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        """This thread's connection; a forked child opens its own instead of reusing the parent's."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # Explicit BEGIN below
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(self.SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
         try:
-            # SNS 'email' protocol sends raw text. HTML is not supported effectively.
-            # We convert our body to plain text for readability.
-            plain_text = body.replace('<br>', '\n').replace('<br/>', '\n')
-            
-            # Simple strip of other tags if any (basic approach)
-            import re
-            plain_text = re.sub('<[^<]+?>', '', plain_text)
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
 
-            message = {"default": plain_text, "email": plain_text}
-            
-            sns_client.publish(
-                TopicArn=Config.SNS_TOPIC_ARN,
-                Subject=subject[:100],
-                Message=json.dumps(message),
-                MessageStructure='json'
-            )
-        except Exception as e:
-            print(f"SNS Error: {e}")
+    def _item(self, table, row, projection=None):
+        _, key, columns = self.TABLES[table]
+        item = json.loads(row['extra']) if row['extra'] else {}
+        for column in (key,) + columns:
+            if row[column] is not None:
+                item[column] = row[column]
+        return Utils.project(item, projection)
+
+    def _put(self, conn, table, item):
+        sql_table, key, columns = self.TABLES[table]
+        extra = {k: v for k, v in item.items() if k != key and k not in columns}
+        names = (key,) + columns + ('extra',)
+        values = [str(item[key])] + [item.get(c) for c in columns] + [json.dumps(extra) if extra else None]
+        conn.execute(f"INSERT OR REPLACE INTO {sql_table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                     values)
+
+    def _select(self, conn, table, key_value):
+        sql_table, key, _ = self.TABLES[table]
+        return conn.execute(f"SELECT * FROM {sql_table} WHERE {key} = ?", (str(key_value),)).fetchone()
+
+    def _get(self, table, key_value, projection=None):
+        row = self._select(self._conn(), table, key_value)
+        return None if row is None else self._item(table, row, projection)
+
+    def _delete(self, table, key_value):
+        with self._transaction() as conn:
+            row = self._select(conn, table, key_value)
+            if row is not None:
+                sql_table, key, _ = self.TABLES[table]
+                conn.execute(f"DELETE FROM {sql_table} WHERE {key} = ?", (str(key_value),))
+        return None if row is None else self._item(table, row)
+
+    def _update(self, table, key_value, fields):
+        with self._transaction() as conn:
+            row = self._select(conn, table, key_value)
+            old = None if row is None else self._item(table, row)
+            self._put(conn, table, dict(old or {self.TABLES[table][1]: str(key_value)}, **fields))
+        return old
+
+    def get_user(self, email):
+        return self._get(Config.TABLE_USERS, email)
+
+    def put_user(self, user):
+        with self._transaction() as conn:
+            self._put(conn, Config.TABLE_USERS, user)
+
+    def update_user(self, email, fields):
+        self._update(Config.TABLE_USERS, email, fields)
+
+    def delete_user(self, email):
+        self._delete(Config.TABLE_USERS, email)
+
+    def users_by_role(self, role, projection=None, page_size=None):
+        cursor = self._conn().execute("SELECT * FROM users WHERE role = ? ORDER BY email", (role,))
+        while True:
+            rows = cursor.fetchmany(page_size or 1000)
+            if not rows:
+                return
+            for row in rows:
+                yield self._item(Config.TABLE_USERS, row, projection)
+
+    def put_otp(self, record):
+        with self._transaction() as conn:
+            self._put(conn, Config.TABLE_OTP, record)
+
+    def get_otp(self, email):
+        return self._get(Config.TABLE_OTP, email)
+
+    def delete_otp(self, email):
+        self._delete(Config.TABLE_OTP, email)
+
+    def get_book(self, book_id, consistent=False, projection=None):
+        return self._get(Config.TABLE_BOOKS, book_id, projection)
+
+    def books_page(self, page_size, start_key=None, projection=None):
+        after = str(start_key['id']) if start_key and 'id' in start_key else ''
+        rows = self._conn().execute("SELECT * FROM books WHERE id > ? ORDER BY id LIMIT ?",
+                                    (after, page_size + 1)).fetchall()
+        items = [self._item(Config.TABLE_BOOKS, row, projection) for row in rows[:page_size]]
+        return items, {'id': rows[page_size - 1]['id']} if len(rows) > page_size else None
+
+    def put_book(self, book):
+        with self._transaction() as conn:
+            self._put(conn, Config.TABLE_BOOKS, book)
+
+    def put_books(self, books):
+        with self._transaction() as conn:
+            for book in books:
+                self._put(conn, Config.TABLE_BOOKS, book)
+
+    def update_book(self, book_id, fields):
+        return self._update(Config.TABLE_BOOKS, book_id, fields)
+
+    def delete_book(self, book_id):
+        return self._delete(Config.TABLE_BOOKS, book_id)
+
+    def batch_get(self, table_name, ids, projection=None, consistent=False):
+        sql_table, key, _ = self.TABLES[table_name]
+        found, conn = {}, self._conn()
+        for start in range(0, len(ids), 500):  # Stay well under SQLite's bound-parameter limit
+            chunk = ids[start:start + 500]
+            rows = conn.execute(f"SELECT * FROM {sql_table} WHERE {key} IN ({', '.join('?' * len(chunk))})", chunk)
+            for row in rows:
+                found[str(row[key])] = self._item(table_name, row, projection)
+        return found
+
+    def scan(self, table_name, segments=None, projection=None, page_size=None):
+        cursor = self._conn().execute(f"SELECT * FROM {self.TABLES[table_name][0]}")
+        while True:
+            rows = cursor.fetchmany(page_size or 1000)
+            if not rows:
+                return
+            for row in rows:
+                yield self._item(table_name, row, projection)
+
+    def count(self, table_name):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.TABLES[table_name][0]}").fetchone()[0]
+
+    def put_request(self, item):
+        with self._transaction() as conn:
+            self._put(conn, Config.TABLE_REQUESTS, item)
+
+    def get_request(self, req_id):
+        return self._get(Config.TABLE_REQUESTS, req_id)
 
-class DatabaseService:
     @staticmethod
-    def get_user(email):
+    def _date_where(partition_column, partition, since, until, start_key, descending):
+        """WHERE clause and parameters for a (partition, date) index range read."""
+        low, high = Utils.date_bounds(since, until)
+        clauses, params = [f"{partition_column} = ?"], [partition]
+        if low:
+            clauses.append("date >= ?")
+            params.append(low)
+        if high:
+            clauses.append("date <= ?")
+            params.append(high)
+        if start_key:
+            clauses.append(f"(date, id) {'<' if descending else '>'} (?, ?)")
+            params += [str(start_key.get('date', '')), str(start_key.get('id', ''))]
+        return ' AND '.join(clauses), params
+
+    def _date_page(self, partition_column, partition, limit, start_key, descending, match, projection,
+                   since, until):
+        where, params = self._date_where(partition_column, partition, since, until, start_key, descending)
+        order = 'DESC' if descending else 'ASC'
+        cursor = self._conn().execute(f"SELECT * FROM requests WHERE {where} ORDER BY date {order}, id {order}",
+                                      params)
+        items, last = [], None
+        for row in cursor:
+            item = self._item(Config.TABLE_REQUESTS, row)
+            if not self.matches(item, match):
+                continue
+            if limit and len(items) == limit:
+                return items, last
+            items.append(Utils.project(item, projection))
+            last = {'id': row['id'], 'date': row['date']}
+        return items, None
+
+    def user_requests(self, email, limit=None, start_key=None, newest_first=True, match=None, projection=None,
+                      since=None, until=None):
+        return self._date_page('user_email', email, limit, start_key, newest_first, match, projection, since, until)
+
+    def requests_by_status(self, status, limit, start_key=None, projection=None, since=None, until=None):
+        return self._date_page('status', status, limit, start_key, True, None, projection, since, until)
+
+    def count_requests_by_status(self, status, since=None, until=None):
+        where, params = self._date_where('status', status, since, until, None, True)
+        return self._conn().execute(f"SELECT COUNT(*) FROM requests WHERE {where}", params).fetchone()[0]
+
+    def waitlist_head(self, book_id, limit=1):
+        rows = self._conn().execute("SELECT * FROM requests WHERE waitlist_book = ? ORDER BY waitlisted_at, id LIMIT ?",
+                                    (book_id, limit)).fetchall()
+        return [self._item(Config.TABLE_REQUESTS, row) for row in rows]
+
+    def backfill_waitlist(self):
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT * FROM requests WHERE status = 'waitlisted' AND waitlist_book IS NULL").fetchall()
+            for row in rows:
+                req = self._item(Config.TABLE_REQUESTS, row)
+                req['waitlist_book'] = str(req['book_id'])
+                req['waitlisted_at'] = req.get('waitlisted_at') or Utils.waitlist_position(req)
+                self._put(conn, Config.TABLE_REQUESTS, req)
+        return len(rows)
+
+    def transact(self, copies_changes, status_changes):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
         try:
-            resp = users_table.get_item(Key={'email': email})
-            return Utils.convert_decimals(resp.get('Item'))
-        except ClientError:
-            return None
+            failed = self._apply(conn, copies_changes, status_changes)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('ROLLBACK' if failed is not None else 'COMMIT')
+        return failed
 
     @staticmethod
-    def create_user(user_data):
-        users_table.put_item(Item=user_data)
+    def _apply(conn, copies_changes, status_changes):
+        """Runs transact()'s updates in order; the position of the first that matched no row, else None."""
+        for position, (book_id, delta) in enumerate(copies_changes):
+            if not conn.execute("UPDATE books SET copies = copies + ? WHERE id = ? AND copies >= ?",
+                                (delta, str(book_id), max(0, -delta))).rowcount:
+                return position
+        for position, (req, new_status) in enumerate(status_changes, start=len(copies_changes)):
+            leaving_waitlist = req['status'] == 'waitlisted' and new_status != 'waitlisted'
+            if not conn.execute(
+                    "UPDATE requests SET status = ?, waitlist_book = CASE WHEN ? THEN NULL ELSE waitlist_book END "
+                    "WHERE id = ? AND status = ?", (new_status, leaving_waitlist, str(req['id']), req['status'])
+            ).rowcount:
+                return position
+        return None
 
-    @staticmethod
-    def get_all_books():
-        resp = books_table.scan()
-        return Utils.convert_decimals(resp.get('Items', []))
+    def get_stat(self, stat_id):
+        return self._get(Config.TABLE_STATS, stat_id)
 
-    @staticmethod
-    def get_book(book_id):
-        resp = books_table.get_item(Key={'id': str(book_id)})
-        return Utils.convert_decimals(resp.get('Item'))
+    def add_stats(self, stat_id, deltas, set_values=None):
+        with self._transaction() as conn:
+            row = self._select(conn, Config.TABLE_STATS, stat_id)
+            item = {'stat_id': stat_id} if row is None else self._item(Config.TABLE_STATS, row)
+            for attr, delta in deltas.items():
+                item[attr] = (item.get(attr) or 0) + delta
+            item.update(set_values or {})
+            self._put(conn, Config.TABLE_STATS, item)
+
+    def retitle_stat(self, stat_id, title):
+        with self._transaction() as conn:
+            row = self._select(conn, Config.TABLE_STATS, stat_id)
+            if row is not None:
+                self._put(conn, Config.TABLE_STATS, dict(self._item(Config.TABLE_STATS, row), title=title))
+
+    def delete_stat(self, stat_id):
+        self._delete(Config.TABLE_STATS, stat_id)
+
+    def top_stats(self, kind, limit):
+        rows = self._conn().execute("SELECT * FROM stats WHERE kind = ? ORDER BY request_count DESC LIMIT ?",
+                                    (kind, limit)).fetchall()
+        return [self._item(Config.TABLE_STATS, row) for row in rows]
+
+    def replace_stats(self, items, stale_ids):
+        with self._transaction() as conn:
+            for item in items:
+                self._put(conn, Config.TABLE_STATS, item)
+            conn.executemany("DELETE FROM stats WHERE stat_id = ?", [(stat_id,) for stat_id in stale_ids])
+
+STORAGE_BACKENDS = {backend.name: backend for backend in (DynamoDBBackend, SQLiteBackend, MemoryBackend)}
+
+def make_storage(name):
+    """The engine for a Config.STORAGE_BACKEND name."""
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}' (expected one of: {', '.join(STORAGE_BACKENDS)})")
+    return STORAGE_BACKENDS[name]()
+
+storage = make_storage(Config.STORAGE_BACKEND)
 
 # =============================================================================
 # PUBLIC ROUTES
@@ -187,9 +3377,8 @@ def index():
     # Feature a book on the landing page
     trending_book = None
     try:
-        # Scan limit to 50 efficient load
-        response = books_table.scan(Limit=50)
-        items = Utils.convert_decimals(response.get('Items', []))
+        # One page of 50 books is enough to pick from
+        items, _ = DatabaseService.get_books_page(50)
         if items:
             trending_book = random.choice(items)
     except Exception:
@@ -244,7 +3433,7 @@ def forgot_password():
             return redirect(url_for('verify_otp'))
             
         otp = Utils.generate_otp()
-        password_resets_table.put_item(Item={
+        DatabaseService.save_otp({
             'email': email,
             'otp': otp,
             'ttl': int((datetime.now().timestamp()) + 600)
@@ -267,8 +3456,7 @@ def verify_otp():
             flash("Session expired. Start over.", "danger")
             return redirect(url_for('forgot_password'))
             
-        resp = password_resets_table.get_item(Key={'email': email})
-        record = Utils.convert_decimals(resp.get('Item'))
+        record = DatabaseService.get_otp(email)
         
         if record and record.get('otp') == otp:
             session['otp_verified'] = True
@@ -294,12 +3482,8 @@ def reset_password():
             return redirect(url_for('reset_password'))
             
         hashed_pw = generate_password_hash(password)
-        users_table.update_item(
-            Key={'email': email},
-            UpdateExpression="set password=:p",
-            ExpressionAttributeValues={':p': hashed_pw}
-        )
-        password_resets_table.delete_item(Key={'email': email})
+        DatabaseService.set_password(email, hashed_pw)
+        DatabaseService.delete_otp(email)
         
         NotificationService.send('Instant Library Alert', f"Audit: Password Reset", f"Password for user {email} was successfully reset via OTP.")
         NotificationService.send(email, "Security Alert: Password Changed", "Your password was successfully reset.")
@@ -331,7 +3515,7 @@ def handle_registration(req, role):
         flash("Passwords do not match.", "danger")
         return redirect(url_for('auth', mode='register', role=role))
     
-    if DatabaseService.get_user(email):
+    if DatabaseService.get_user(email, fresh=True):
         flash("Email already registered. Please login.", "warning")
         return redirect(url_for('auth', mode='login', role=role))
     
@@ -366,7 +3550,7 @@ def handle_login(req, role, mode):
     email = req.form.get('email').strip().lower()
     password = req.form.get('password')
     
-    user = DatabaseService.get_user(email)
+    user = DatabaseService.get_user(email, fresh=True)
     
     if user and check_password_hash(user['password'], password):
         session['user'] = user['email']
@@ -396,13 +3580,18 @@ def catalog():
     if 'user' not in session or session.get('role') != 'student':
         return redirect(url_for('index'))
     
-    books = DatabaseService.get_all_books()
-    response = requests_table.scan(
-        FilterExpression=boto3.dynamodb.conditions.Attr('user_email').eq(session['user'])
-    )
-    my_requests = Utils.convert_decimals(response.get('Items', []))
+    page = Utils.page_args(request.args)
+    filters = facet_index.filter_args(request.args)
+    only, facets = facet_index.browse(filters)
+    books, next_key = DatabaseService.get_books_page(
+        page['per_page'], Utils.decode_cursor(page['cursor']), page['sort'], page['order'] == 'desc', projection='card',
+        only=only)
+    my_requests = DatabaseService.get_user_requests(session['user'], projection=['book_id', 'status'])
     
-    return render_template('catalog.html', books=books, my_requests=my_requests)
+    return render_template('catalog.html', books=books, my_requests=my_requests,
+                           pagination=Utils.build_pagination('catalog', page, next_key, **filters),
+                           facets=facets, facet_endpoint='catalog',
+                           search_url=url_for('search_books'), suggest_url=url_for('suggest_books'))
 
 @app.route('/request_book/<book_id>')
 def request_book(book_id):
@@ -412,12 +3601,7 @@ def request_book(book_id):
     book_id = str(book_id)
     
     # Check existing
-    response = requests_table.scan(
-        FilterExpression=boto3.dynamodb.conditions.Attr('user_email').eq(session['user']) & 
-                         boto3.dynamodb.conditions.Attr('book_id').eq(book_id) &
-                         boto3.dynamodb.conditions.Attr('status').is_in(['pending', 'waitlisted'])
-    )
-    if response.get('Count', 0) > 0:
+    if DatabaseService.has_open_request(session['user'], book_id):
         flash("You already have a pending request or waitlist for this book.", "warning")
         return redirect(url_for('dashboard'))
         
@@ -428,15 +3612,20 @@ def request_book(book_id):
     
     status = 'waitlisted' if book.get('copies', 0) < 1 else 'pending'
     
-    import uuid
-    requests_table.put_item(Item={
-        'id': str(uuid.uuid4()),
+    now = datetime.now()
+    item = {
+        'id': Utils.new_request_id(),
         'user_email': session['user'],
         'book_id': book_id,
         'status': status,
-        'date': datetime.now().strftime("%Y-%m-%d"),
-        'formatted_date': datetime.now().strftime("%Y-%m-%d")
-    })
+        'date': Utils.timestamp(now)  # GSI sort key: full timestamp, so ranges and order are exact
+    }
+    if status == 'waitlisted':
+        # Sparse waitlist GSI keys: this book's queue, in arrival order
+        item['waitlist_book'] = book_id
+        item['waitlisted_at'] = item['date']
+    DatabaseService.create_request(item)
+    StatsService.record_request(book, status)
     
     # Notifications
     msg_sub = f"Request Received: {book.get('title')}" if status == 'pending' else f"Added to Waitlist: {book.get('title')}"
@@ -444,10 +3633,9 @@ def request_book(book_id):
     
     NotificationService.send(session['user'], msg_sub, msg_body)
     
-    # Notify Staff (Inefficient Scan for demo)
-    staff_scan = users_table.scan(FilterExpression=boto3.dynamodb.conditions.Attr('role').eq('staff'))
-    for staff in staff_scan.get('Items', []):
-         NotificationService.send(staff['email'], f"New {status.title()}: {book.get('title')}", 
+    # Notify Staff (cached roster, no table read on the hot path)
+    for staff_email in DatabaseService.get_staff_emails():
+         NotificationService.send(staff_email, f"New {status.title()}: {book.get('title')}", 
                                   f"Student {session['user']} requests '{book.get('title')}'.")
 
     flash("Request submitted!" if status == 'pending' else "Added to Waitlist!", "success")
@@ -458,25 +3646,24 @@ def my_requests():
     if 'user' not in session or session.get('role') != 'student':
         return redirect(url_for('index'))
     
-    resp = requests_table.scan(
-        FilterExpression=boto3.dynamodb.conditions.Attr('user_email').eq(session['user'])
-    )
-    requests_list = Utils.convert_decimals(resp.get('Items', []))
+    # Newest-first straight from the GSI sort key; ?days=7 or ?since=&until= narrow it to a key range
+    date_range = Utils.date_range_args(request.args)
+    requests_list = DatabaseService.get_user_requests(session['user'], projection='request_row',
+                                                      since=date_range.get('since'), until=date_range.get('until'))
     
-    all_books = {str(b['id']): b for b in DatabaseService.get_all_books()}
+    books = DatabaseService.get_books_map([r['book_id'] for r in requests_list], projection='request_book')
     
     enriched_requests = []
     for r in requests_list:
-        b_id = str(r['book_id'])
-        if b_id in all_books:
+        book = books.get(str(r['book_id']))
+        if book:
             r.update({
-                'book_title': all_books[b_id].get('title', 'Unknown'),
-                'book_author': all_books[b_id].get('author', 'Unknown'),
-                'book_cover': all_books[b_id].get('cover_url', '')
+                'book_title': book.get('title', 'Unknown'),
+                'book_author': book.get('author', 'Unknown'),
+                'book_cover': book.get('cover_url', '')
             })
             enriched_requests.append(r)
     
-    enriched_requests.reverse()
     return render_template('my_requests.html', my_requests=enriched_requests)
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -489,7 +3676,7 @@ def profile():
         new_pw = request.form.get('new_password')
         confirm_pw = request.form.get('confirm_password')
         
-        user = DatabaseService.get_user(session['user'])
+        user = DatabaseService.get_user(session['user'], fresh=True)
         
         if not check_password_hash(user['password'], current_pw):
             flash("Current password is incorrect.", "danger")
@@ -497,11 +3684,7 @@ def profile():
             flash("New passwords do not match.", "danger")
         else:
             hashed_pw = generate_password_hash(new_pw)
-            users_table.update_item(
-                Key={'email': session['user']},
-                UpdateExpression="set password=:p",
-                ExpressionAttributeValues={':p': hashed_pw}
-            )
+            DatabaseService.set_password(session['user'], hashed_pw)
             # Notify User of Password Change
             NotificationService.send(session['user'], "Security Alert: Password Changed", 
                                      "Your password was just changed. If this wasn't you, please contact support immediately.")
@@ -521,54 +3704,55 @@ def staff_dashboard():
         return redirect(url_for('auth', role='staff'))
     
     user = DatabaseService.get_user(session['user'])
-    books = DatabaseService.get_all_books()
-    
-    req_resp = requests_table.scan()
-    all_requests = Utils.convert_decimals(req_resp.get('Items', []))
-    
-    users_scan = users_table.scan()
-    all_users = {u['email']: u for u in Utils.convert_decimals(users_scan.get('Items', []))}
-    books_map = {str(b['id']): b for b in books}
+    book_counts = {'total': facet_index.count(), 'out_of_stock': facet_index.count({'availability': 'out_of_stock'})}
+    pending_count = DatabaseService.count_requests_by_status('pending')
+    pending_today = DatabaseService.count_requests_by_status('pending', since=datetime.now().strftime("%Y-%m-%d"))
     
-    enriched_requests = []
-    for r in all_requests:
-        b = books_map.get(str(r['book_id']), {})
-        u = all_users.get(r['user_email'], {})
-        r.update({
-            'book_title': b.get('title', 'Unknown'),
-            'user_email': u.get('email', r['user_email']),
-            'book_cover': b.get('cover_url', '')
-        })
-        enriched_requests.append(r)
-    enriched_requests.reverse()
-    
-    return render_template('staff_dashboard.html', user=user, books=books, requests=enriched_requests)
+    return render_template('staff_dashboard.html', user=user, book_counts=book_counts, pending_count=pending_count,
+                           pending_today=pending_today, exports=list(DataExporter.DATASETS))
 
 @app.route('/staff/books')
 def manage_books():
     if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
-    books = DatabaseService.get_all_books()
-    return render_template('manage_books.html', books=books)
+    page = Utils.page_args(request.args, default_size=50)
+    filters = facet_index.filter_args(request.args)
+    only, facets = facet_index.browse(filters)
+    books, next_key = DatabaseService.get_books_page(
+        page['per_page'], Utils.decode_cursor(page['cursor']), page['sort'], page['order'] == 'desc',
+        projection='admin_row', only=only)
+    return render_template('manage_books.html', books=books, bulk_import=True,
+                           pagination=Utils.build_pagination('manage_books', page, next_key, **filters),
+                           facets=facets, facet_endpoint='manage_books', search_url=url_for('search_books'),
+                           suggest_url=url_for('suggest_books'), suggest_open_url=url_for('edit_book', book_id='__ID__'))
 
 @app.route('/staff/requests')
 def manage_requests():
     if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
     
-    req_resp = requests_table.scan()
-    all_requests = Utils.convert_decimals(req_resp.get('Items', []))
-    books = DatabaseService.get_all_books()
-    books_map = {str(b['id']): b for b in books}
+    # Only the active queue (never returned/rejected history), newest first
+    status = request.args.get('status')
+    statuses = [status] if status in Config.ACTIVE_REQUEST_STATUSES else list(Config.ACTIVE_REQUEST_STATUSES)
+    page = Utils.page_args(request.args, default_size=Config.REQUESTS_PAGE_SIZE, sort_fields=())
+    date_range = Utils.date_range_args(request.args)
+    active, next_cursor = DatabaseService.query_requests_by_status(
+        statuses, page['per_page'], Utils.decode_cursor(page['cursor']), projection='request_row',
+        since=date_range.get('since'), until=date_range.get('until'))
+    
+    books = DatabaseService.get_books_map([r['book_id'] for r in active], projection='request_book')
     
     enriched = []
-    for r in all_requests:
-        b = books_map.get(str(r['book_id']), {})
+    for r in active:
+        b = books.get(str(r['book_id']), {})
         r.update({'book_title': b.get('title', 'Unknown'), 'book_cover': b.get('cover_url', '')})
         enriched.append(r)
-    enriched.reverse()
     
-    return render_template('manage_requests.html', requests=enriched)
+    filters = dict(date_range, **({'status': status} if len(statuses) == 1 else {}))
+    pagination = Utils.build_pagination('manage_requests', page, next_cursor, sort_fields=(), **filters)
+    return render_template('manage_requests.html', requests=enriched, pagination=pagination,
+                           status_filter=status if len(statuses) == 1 else None,
+                           statuses=Config.ACTIVE_REQUEST_STATUSES, date_range=date_range)
 
 @app.route('/staff/add_book', methods=['POST'])
 def add_book():
@@ -586,7 +3770,8 @@ def add_book():
         'cover_url': request.form.get('cover_url')
     }
     
-    books_table.put_item(Item=new_book)
+    DatabaseService.add_book(new_book)
+    StatsService.record_book_added(new_book)
     
     # Notify Admin (Audit)
     NotificationService.send('Instant Library Alert', f"Audit: New Book Added", 
@@ -595,12 +3780,58 @@ def add_book():
     flash(f"Book '{new_book['title']}' added successfully.", "success")
     return redirect(url_for('staff_dashboard'))
 
+@app.route('/staff/import_books', methods=['POST'])
+def import_books():
+    """Bulk upload of a CSV/JSONL catalog file, streamed straight from the request body."""
+    if 'user' not in session or session.get('role') != 'staff':
+        return redirect(url_for('index'))
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSONL file to import.", "warning")
+        return redirect(url_for('manage_books'))
+    
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        report = BookImporter().run(lines, BookImporter.detect_format(upload.filename))
+    except Exception as e:
+        print(f"Import Error: {e}")
+        flash("Import failed part-way; re-upload the file to finish (rows already written are updated, not duplicated).", "danger")
+        return redirect(url_for('manage_books'))
+    
+    NotificationService.send('Instant Library Alert', "Audit: Bulk Book Import",
+                             f"{session['user']} imported '{upload.filename}': {report['inserted']} added, "
+                             f"{report['updated']} updated, {report['failed']} rejected.")
+    
+    flash(f"Imported {report['inserted'] + report['updated']} books "
+          f"({report['inserted']} new, {report['updated']} updated).", "success")
+    if report['failed']:
+        sample = '; '.join(f"row {e['row']}: {e['error']}" for e in report['errors'][:3])
+        flash(f"{report['failed']} rows skipped. {sample}", "warning")
+    return redirect(url_for('manage_books'))
+
+@app.route('/staff/export/<dataset>')
+def export_data(dataset):
+    """Downloads books, requests or students as ?format=csv|ndjson; &parallel=1 uses a parallel scan."""
+    if 'user' not in session or session.get('role') != 'staff':
+        return redirect(url_for('index'))
+    fmt = request.args.get('format', 'csv')
+    if dataset not in DataExporter.DATASETS or fmt not in DataExporter.FORMATS:
+        return jsonify({'error': 'Unknown dataset or format'}), 404
+    
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+    chunks = DataExporter.stream(dataset, fmt, parallel=request.args.get('parallel') == '1')
+    return Response(stream_with_context(chunks), mimetype=DataExporter.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/staff/delete_book/<book_id>')
 def delete_book(book_id):
     if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
     
-    books_table.delete_item(Key={'id': str(book_id)})
+    old_book = DatabaseService.delete_book(book_id)
+    if old_book:
+        StatsService.record_book_removed(old_book)
     
     # Notify Admin (Audit)
     NotificationService.send('Instant Library Alert', f"Audit: Book Deleted", 
@@ -615,15 +3846,13 @@ def edit_book(book_id):
         return redirect(url_for('index'))
     
     if request.method == 'POST':
-        books_table.update_item(
-            Key={'id': str(book_id)},
-            UpdateExpression="set title=:t, author=:a, category=:c, copies=:co, isbn=:i, cover_url=:url",
-            ExpressionAttributeValues={
-                ':t': request.form.get('title'), ':a': request.form.get('author'),
-                ':c': request.form.get('category'), ':co': int(request.form.get('copies')),
-                ':i': request.form.get('isbn'), ':url': request.form.get('cover_url'),
-            }
-        )
+        fields = {
+            'title': request.form.get('title'), 'author': request.form.get('author'),
+            'category': request.form.get('category'), 'copies': int(request.form.get('copies')),
+            'isbn': request.form.get('isbn'), 'cover_url': request.form.get('cover_url')
+        }
+        old_book = DatabaseService.update_book(book_id, fields) or {}
+        StatsService.record_book_edited(old_book, dict(old_book, id=str(book_id), **fields))
         flash("Book details updated.", "success")
         return redirect(url_for('manage_books'))
         
@@ -635,56 +3864,165 @@ def handle_request(req_id, action):
     if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
 
-    resp = requests_table.get_item(Key={'id': str(req_id)})
-    req = resp.get('Item')
+    req = DatabaseService.get_request(req_id)
     
     if not req:
         flash("Request not found.", "danger")
         return redirect(url_for('manage_requests'))
     
-    book = DatabaseService.get_book(req['book_id'])
-    new_status = 'rejected'
+    plan = plan_request_action(req, action)
+    if plan is None:
+        flash("Request was already processed.", "warning")
+        return redirect(url_for('manage_requests'))
+    new_status, copies_delta = plan
+    
+    outcome = DatabaseService.transition_request(req, new_status, copies_delta)
+    if outcome == 'out_of_stock':
+        flash("Cannot approve: Out of stock.", "danger")
+        return redirect(url_for('manage_requests'))
+    if outcome == 'missing_book':
+        flash("Book not found.", "danger")
+        return redirect(url_for('manage_requests'))
+    if outcome == 'conflict':
+        flash("Request was already processed.", "warning")
+        return redirect(url_for('manage_requests'))
+    
+    books = complete_transitions([(req, new_status, copies_delta)])
+    title = books.get(str(req['book_id']), {}).get('title', 'Unknown Book')
+    subject, body, message, category = REQUEST_NOTIFICATIONS[new_status]
+    NotificationService.send(req['user_email'], subject.format(title=title), body)
+    flash(message, category)
     
+    promoted = promote_waitlists([(req, new_status, copies_delta)], books, NotificationService.send)
+    if promoted:
+        flash(f"Next student on the waitlist ({promoted[0]['user_email']}) moved to pending.", "info")
+    
+    return redirect(url_for('manage_requests'))
+
+@app.route('/api/staff/requests/bulk', methods=['POST'])
+def bulk_request_action():
+    """Applies one action to many requests: {"action": "approve", "ids": [...]}.
+    Writes go out as packed parallel transactions, notifications are queued,
+    and every id gets its own outcome in the response."""
+    if 'user' not in session or session.get('role') != 'staff':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    ids = list(dict.fromkeys(str(i) for i in data.get('ids') or []))
+    if action not in ('approve', 'reject', 'return'):
+        return jsonify({'error': 'action must be approve, reject or return'}), 400
+    if not ids or len(ids) > Config.BULK_MAX_REQUESTS:
+        return jsonify({'error': f'Provide between 1 and {Config.BULK_MAX_REQUESTS} request ids'}), 400
+    
+    found = DatabaseService.batch_get(Config.TABLE_REQUESTS, ids)
+    outcomes, plans = {}, []
+    for req_id in ids:
+        req = found.get(req_id)
+        plan = plan_request_action(req, action) if req else None
+        if req is None:
+            outcomes[req_id] = 'not_found'
+        elif plan is None:
+            outcomes[req_id] = 'conflict'
+        else:
+            plans.append((req,) + plan)
+    
+    outcomes.update(DatabaseService.bulk_transition(plans))
+    applied = [p for p in plans if outcomes[str(p[0]['id'])] == 'ok']
+    books = complete_transitions(applied)
+    for req, new_status, _ in applied:
+        title = books.get(str(req['book_id']), {}).get('title', 'Unknown Book')
+        subject, body, _, _ = REQUEST_NOTIFICATIONS[new_status]
+        NotificationService.enqueue(req['user_email'], subject.format(title=title), body)
+    promoted = promote_waitlists(applied, books, NotificationService.enqueue)
+    
+    summary = {}
+    for outcome in outcomes.values():
+        summary[outcome] = summary.get(outcome, 0) + 1
+    return jsonify({
+        'action': action,
+        'results': [{'id': req_id, 'outcome': outcomes[req_id]} for req_id in ids],
+        'summary': summary,
+        'promoted': [str(req['id']) for req in promoted]
+    })
+
+# Request Workflow Helpers
+# new_status -> (email subject, email body, flash message, flash category)
+REQUEST_NOTIFICATIONS = {
+    'approved': ("Request Approved: {title}", "Your request has been approved.", "Request approved.", "success"),
+    'returned': ("Book Returned: {title}", "Thank you for returning the book.", "Book returned.", "info"),
+    'rejected': ("Request Rejected: {title}", "Sorry, your request was rejected.", "Request rejected.", "warning"),
+    'pending': ("Off the Waitlist: {title}", "A copy is back in stock and your request is now pending approval.",
+                "Request moved off the waitlist.", "info")
+}
+
+def plan_request_action(req, action):
+    """Maps a staff action to (new_status, copies_delta), or None if the request is no
+    longer in a state the action applies to. Only requests not yet holding a copy can be
+    rejected; an approved loan ends with return, which gives the copy back."""
     if action == 'approve':
-        if book['copies'] < 1:
-            flash("Cannot approve: Out of stock.", "danger")
-            return redirect(url_for('manage_requests'))
-        
-        books_table.update_item(Key={'id': str(book['id'])}, UpdateExpression="set copies = copies - :val", ExpressionAttributeValues={':val': 1})
-        NotificationService.send(req['user_email'], f"Request Approved: {book['title']}", "Your request has been approved.")
-        new_status = 'approved'
-        flash("Request approved.", "success")
-        
-    elif action == 'return' and req['status'] == 'approved':
-        books_table.update_item(Key={'id': str(book['id'])}, UpdateExpression="set copies = copies + :val", ExpressionAttributeValues={':val': 1})
-        NotificationService.send(req['user_email'], f"Book Returned: {book['title']}", "Thank you for returning the book.")
-        new_status = 'returned'
-        flash("Book returned.", "info")
-        
-    elif action == 'reject': # implicitly handled by initialization but explicit check is better
-        NotificationService.send(req['user_email'], f"Request Rejected: {book['title']}", "Sorry, your request was rejected.")
-        new_status = 'rejected'
-        flash("Request rejected.", "warning")
+        return ('approved', -1) if req['status'] in ('pending', 'waitlisted') else None
+    if action == 'return':
+        return ('returned', 1) if req['status'] == 'approved' else None
+    return ('rejected', 0) if req['status'] in ('pending', 'waitlisted') else None
 
-    requests_table.update_item(Key={'id': str(req_id)}, UpdateExpression="set #s = :s", 
-                               ExpressionAttributeNames={'#s': 'status'}, ExpressionAttributeValues={':s': new_status})
+def complete_transitions(applied):
+    """Bookkeeping after committed (req, new_status, copies_delta) transitions.
+    One consistent batch read of the books whose stock moved refreshes the catalog cache
+    and the low-stock counter; returns {book_id: book} for notification titles."""
+    stock_moves = {}
+    for req, _, copies_delta in applied:
+        if copies_delta:
+            book_id = str(req['book_id'])
+            stock_moves[book_id] = stock_moves.get(book_id, 0) + copies_delta
     
-    return redirect(url_for('manage_requests'))
+    books = DatabaseService.get_books_batch(list(stock_moves), consistent=True) if stock_moves else {}
+    low_stock_delta = 0
+    for book_id, book in books.items():
+        catalog_cache.put(book)
+        low_stock_delta += StatsService.low_stock_delta(book['copies'] - stock_moves[book_id], book['copies'])
+    StatsService.record_transitions([(req['status'], new_status) for req, new_status, _ in applied], low_stock_delta)
+    
+    untitled = [req['book_id'] for req, _, _ in applied if str(req['book_id']) not in books]
+    if untitled:
+        books.update(DatabaseService.get_books_map(untitled, projection=['title']))
+    return books
+
+def promote_waitlists(applied, books, notify):
+    """After returns, hands each returned copy to the next waitlisted request for that book.
+    Promoted students are notified through `notify` (send or enqueue); returns the promoted requests."""
+    returned = {}
+    for req, new_status, _ in applied:
+        if new_status == 'returned':
+            book_id = str(req['book_id'])
+            returned[book_id] = returned.get(book_id, 0) + 1
+    
+    promoted = []
+    for book_id, count in returned.items():
+        promoted += DatabaseService.promote_waitlist(book_id, count)
+    if not promoted:
+        return promoted
+    
+    StatsService.record_transitions([('waitlisted', 'pending')] * len(promoted))
+    subject, body, _, _ = REQUEST_NOTIFICATIONS['pending']
+    for req in promoted:
+        title = books.get(str(req['book_id']), {}).get('title', 'Unknown Book')
+        notify(req['user_email'], subject.format(title=title), body)
+    return promoted
 
 @app.route('/staff/students')
 def manage_students():
      if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
      
-     resp = users_table.scan(FilterExpression=boto3.dynamodb.conditions.Attr('role').eq('student'))
-     students = Utils.convert_decimals(resp.get('Items', []))
+     students = DatabaseService.query_users_by_role('student')
      return render_template('manage_students.html', students=students)
 
 @app.route('/staff/delete_user/<email>')
 def delete_user(email):
     if 'user' not in session or session.get('role') != 'staff':
         return redirect(url_for('index'))
-    users_table.delete_item(Key={'email': email})
+    DatabaseService.delete_user(email)
     
     # Notify Admin (Audit)
     NotificationService.send('', f"Audit: User Deleted", 
@@ -696,12 +4034,59 @@ def delete_user(email):
 # =============================================================================
 # API ROUTES
 # =============================================================================
+@app.route('/api/staff/pool_stats')
+def pool_stats():
+    """AWS connection pool usage for this worker process."""
+    if 'user' not in session or session.get('role') != 'staff':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(aws.stats())
+
+@app.route('/api/staff/cache_stats')
+def cache_stats():
+    """Hit/miss counters of this worker's in-memory caches."""
+    if 'user' not in session or session.get('role') != 'staff':
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'catalog': catalog_cache.stats(), 'users': user_cache.stats(), 'search': search_index.stats(),
+                    'suggest': suggest_index.stats(), 'facets': facet_index.stats()})
+
+@app.route('/api/search')
+def search_books():
+    """Ranked catalog search over title, author, category and ISBN (catalog search box)."""
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    query = request.args.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', Config.SEARCH_RESULTS)), Config.MAX_PAGE_SIZE))
+    except ValueError:
+        limit = Config.SEARCH_RESULTS
+    filters = facet_index.filter_args(request.args)
+    within = facet_index.select(filters) if filters else None
+    results = search_index.search(query, limit, within=within) if query else []
+    corrections = search_index.corrections(query) if results else {}
+    return jsonify({'query': query, 'corrections': corrections,
+                    'results': [dict(Utils.project(book, 'card'), score=round(score, 3)) for book, score in results]})
+
+@app.route('/api/suggest')
+def suggest_books():
+    """Title and author completions for the search boxes, most requested first."""
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    query = request.args.get('q', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', Config.SUGGEST_RESULTS)), 20))
+    except ValueError:
+        limit = Config.SUGGEST_RESULTS
+    return jsonify({'query': query, 'suggestions': suggest_index.suggest(query, limit)})
+
 @app.route('/api/fetch_book_details')
 def fetch_book_details():
     isbn = request.args.get('isbn')
     if not isbn:
         return jsonify({'error': 'ISBN required'}), 400
     
+    import requests
     try:
         url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
         data = requests.get(url).json()
@@ -734,46 +4119,8 @@ def analytics():
         return jsonify({'error': 'Unauthorized'}), 403
         
     try:
-        # 1. Fetch Data
-        books = Utils.convert_decimals(books_table.scan().get('Items', []))
-        requests = Utils.convert_decimals(requests_table.scan().get('Items', []))
-        all_books_map = {str(b['id']): b['title'] for b in books}
-        
-        # 2. Key Performance Indicators (KPIs)
-        total_books = len(books)
-        total_requests = len(requests)
-        pending_requests = len([r for r in requests if r['status'] == 'pending'])
-        low_stock = len([b for b in books if b['copies'] < 1])
-        
-        # 3. Chart 1: Most Popular Books (Request Count by Book Title)
-        book_counts = {}
-        for r in requests:
-            b_id = str(r['book_id'])
-            title = all_books_map.get(b_id, 'Unknown Book')
-            book_counts[title] = book_counts.get(title, 0) + 1
-            
-        # Sort top 5
-        sorted_books = sorted(book_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-        popular_labels = [x[0] for x in sorted_books]
-        popular_data = [x[1] for x in sorted_books]
-        
-        # 4. Chart 2: Request Status Distribution
-        status_counts = {}
-        for r in requests:
-            s = r.get('status', 'Unknown').capitalize()
-            status_counts[s] = status_counts.get(s, 0) + 1
-            
-        return jsonify({
-            'total_books': total_books,
-            'total_requests': total_requests,
-            'pending_requests': pending_requests,
-            'low_stock': low_stock,
-            'popular_labels': popular_labels,
-            'popular_data': popular_data,
-            'status_labels': list(status_counts.keys()),
-            'status_data': list(status_counts.values())
-        })
-        
+        # Pre-aggregated counters: constant cost regardless of catalog/history size
+        return jsonify(StatsService.get_dashboard())
     except Exception as e:
         print(f"Analytics Error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -786,11 +4133,8 @@ def recommendations():
 
     try:
         # Fetch Catalog & User History
-        all_books = Utils.convert_decimals(books_table.scan().get('Items', []))
-        user_requests = Utils.convert_decimals(requests_table.scan().get('Items', []))
-        
-        # Filter for current user
-        my_history = [r for r in user_requests if r['user_email'] == session['user']]
+        all_books = DatabaseService.get_all_books()
+        my_history = DatabaseService.get_user_requests(session['user'])
         
         # 1. Fallback Strategy (If no history or no API key)
         if not Config.GEMINI_API_KEY or not my_history:
@@ -816,9 +4160,7 @@ def recommendations():
         """
         
         try:
-            genai.configure(api_key=Config.GEMINI_API_KEY)
-            model = genai.GenerativeModel('gemini-flash-latest')
-            response = model.generate_content(prompt)
+            response = AIService.model().generate_content(prompt)
             
             # Clean response (remove markdown code blocks)
             text = response.text.replace('```json', '').replace('```', '').strip()
@@ -845,48 +4187,53 @@ def populate_catalog():
 
     try:
         # Guard Check: Don't populate if we already have data
-        existing_count = books_table.scan(Select='COUNT').get('Count', 0)
+        existing_count = DatabaseService.count_books()
         if existing_count > 50:
             return jsonify({'success': True, 'count': 0, 'message': 'Catalog already populated.'})
 
+        import requests
         subjects = ['science_fiction', 'adventure', 'history', 'programming', 'biology']
         count = 0
         
-        with books_table.batch_writer() as batch:
-            for subject in subjects:
-                try:
-                    # Use Search API to get ISBNs (fields: title, author, isbn, cover, key)
-                    url = f"https://openlibrary.org/search.json?subject={subject}&limit=100&fields=title,author_name,isbn,cover_i,key"
-                    resp = requests.get(url, timeout=10).json()
-                    
-                    for doc in resp.get('docs', []):
-                        try:
-                            title = doc.get('title', 'Unknown Title')
-                            author_name = doc.get('author_name', ['Unknown'])[0]
-                            
-                            # Get ISBN (first one found)
-                            isbn_list = doc.get('isbn', [])
-                            isbn = isbn_list[0] if isbn_list else "N/A"
-                            
-                            cover_id = doc.get('cover_i')
-                            cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else ""
-                            
-                            batch.put_item(Item={
-                                'id': f"ol_{doc['key'].split('/')[-1]}", 
-                                'title': title[:100], 
-                                'author': author_name,
-                                'category': subject.replace('_', ' ').capitalize(),
-                                'copies': random.randint(1, 10),
-                                'cover_url': cover_url,
-                                'isbn': isbn
-                            })
-                            count += 1
-                        except:
-                            continue
-                except Exception as e:
-                    print(f"Fetch Error ({subject}): {e}")
-                    continue
+        books = []
+        for subject in subjects:
+            try:
+                # Use Search API to get ISBNs (fields: title, author, isbn, cover, key)
+                url = f"https://openlibrary.org/search.json?subject={subject}&limit=100&fields=title,author_name,isbn,cover_i,key"
+                resp = requests.get(url, timeout=10).json()
+                
+                for doc in resp.get('docs', []):
+                    try:
+                        title = doc.get('title', 'Unknown Title')
+                        author_name = doc.get('author_name', ['Unknown'])[0]
+                        
+                        # Get ISBN (first one found)
+                        isbn_list = doc.get('isbn', [])
+                        isbn = isbn_list[0] if isbn_list else "N/A"
+                        
+                        cover_id = doc.get('cover_i')
+                        cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-M.jpg" if cover_id else ""
+                        
+                        books.append({
+                            'id': f"ol_{doc['key'].split('/')[-1]}", 
+                            'title': title[:100], 
+                            'author': author_name,
+                            'category': subject.replace('_', ' ').capitalize(),
+                            'copies': random.randint(1, 10),
+                            'cover_url': cover_url,
+                            'isbn': isbn
+                        })
+                        count += 1
+                    except:
+                        continue
+            except Exception as e:
+                print(f"Fetch Error ({subject}): {e}")
+                continue
         
+        DatabaseService.put_books(books)
+        
+        catalog_cache.invalidate()
+        StatsService.rebuild()
         return jsonify({'success': True, 'count': count, 'message': f'Successfully seeded {count} books with ISBNs.'})
 
     except Exception as e:
@@ -907,24 +4254,13 @@ def chat():
     # 1. RAG: Search Database for context
     db_context = ""
     try:
-        # Simple keyword search strategy
-        keywords = [w for w in user_message.split() if len(w) > 3]
-        if keywords:
-            # We can't efficiently search "OR" in scan easily without complexity, 
-            # so we fetch a batch and filter in python for this MVP.
-            # Production would use proper Search Index (ElasticSearch/OpenSearch)
-            all_books = DatabaseService.get_all_books() # Warning: Scale limit, fine for demo (500 items)
-            
-            matches = []
-            for book in all_books:
-                # Check if any keyword matches title or author
-                b_str = f"{book['title']} {book['author']} {book['category']}".lower()
-                if any(k.lower() in b_str for k in keywords):
-                    matches.append(f"- {book['title']} by {book['author']} ({book['copies']} copies) [Category: {book['category']}]")
+        # Ranked keyword search: any word of the message may match, the best 5 books save tokens
+        if search_index.query_words(user_message):
+            matches = [f"- {book.get('title')} by {book.get('author')} ({book.get('copies', 0)} copies) [Category: {book.get('category')}]"
+                       for book, _ in search_index.search(user_message, limit=5, require_all=False, prefix=False)]
             
             if matches:
-                # Limit context to top 5 matches to save tokens
-                db_context = "Here are some relevant books found in the library catalog:\n" + "\n".join(matches[:5])
+                db_context = "Here are some relevant books found in the library catalog:\n" + "\n".join(matches)
             else:
                 db_context = "I searched the catalog but didn't find specific matches for those terms."
     except Exception as e:
@@ -948,10 +4284,7 @@ def chat():
     """
     
     try:
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        # Switch to generic latest alias (Safest for quotas)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        response = model.generate_content(f"{context}\nUser: {user_message}")
+        response = AIService.model().generate_content(f"{context}\nUser: {user_message}")
         return jsonify({'response': response.text})
     except Exception as e:
         print(f"!!! GEMINI ERROR: {e}")
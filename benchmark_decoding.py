@@ -0,0 +1,96 @@
+"""
+Benchmark: decoding DynamoDB Scan responses into Python dicts.
+
+Compares the old read path (boto3's TypeDeserializer, then Utils.convert_decimals over
+every item) with NativeDeserializer from app_aws.py. Both run boto3's real response
+transformation against the Scan output shape, on synthetic wire-format book items, so no
+AWS account or network is needed.
+
+Usage:
+    python benchmark_decoding.py [--items 50000] [--repeat 5]
+"""
+import argparse
+import copy
+import os
+import time
+from decimal import Decimal
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+import boto3
+from boto3.dynamodb.transform import TransformationInjector
+
+import app_aws
+
+
+def convert_decimals(obj):
+    """The pre-NativeDeserializer second pass, kept here as the baseline."""
+    if isinstance(obj, list):
+        return [convert_decimals(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {k: convert_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    return obj
+
+
+def wire_items(count):
+    """Scan-style items as DynamoDB sends them: every value tagged with its type."""
+    return [{
+        'id': {'S': f'book-{i}'},
+        'title': {'S': f'Benchmark Title {i}'},
+        'author': {'S': f'Author {i % 500}'},
+        'category': {'S': ('Science fiction', 'History', 'Biology', 'Programming')[i % 4]},
+        'copies': {'N': str(i % 11)},
+        'rating': {'N': f'{(i % 50) / 10:.1f}'},
+        'isbn': {'S': f'978{i:010d}'},
+        'cover_url': {'S': f'https://covers.openlibrary.org/b/id/{i}-M.jpg'},
+        'tags': {'L': [{'S': 'library'}, {'N': str(i % 7)}]}
+    } for i in range(count)]
+
+
+def time_path(decode, response, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        parsed = copy.deepcopy(response)  # The transformation decodes in place
+        start = time.perf_counter()
+        decode(parsed)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DynamoDB item decoding benchmark")
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    model = boto3.client('dynamodb').meta.service_model.operation_model('Scan')
+    response = {'Items': wire_items(args.items), 'Count': args.items}
+
+    legacy = TransformationInjector()
+    native = TransformationInjector(deserializer=app_aws.NativeDeserializer())
+
+    def legacy_path(parsed):
+        legacy.inject_attribute_value_output(parsed, model)
+        return convert_decimals(parsed['Items'])
+
+    def native_path(parsed):
+        native.inject_attribute_value_output(parsed, model)
+        return parsed['Items']
+
+    # Both paths must hand the app identical items
+    assert legacy_path(copy.deepcopy(response)) == native_path(copy.deepcopy(response))
+
+    old = time_path(legacy_path, response, args.repeat)
+    new = time_path(native_path, response, args.repeat)
+    print(f"Decoding {args.items} items (best of {args.repeat}):")
+    print(f"  TypeDeserializer + convert_decimals: {old * 1000:8.1f} ms  ({args.items / old:,.0f} items/s)")
+    print(f"  NativeDeserializer:                  {new * 1000:8.1f} ms  ({args.items / new:,.0f} items/s)")
+    print(f"  Speedup: {old / new:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: route and template time with the storage engine taken out of the picture.
+
+Seeds a catalog, students and requests through DatabaseService into the chosen storage
+backend (Config.STORAGE_BACKEND names), then times the busiest pages with Flask's test
+client. With the in-memory engine storage costs next to nothing, so the numbers are the
+routes' own work (paging, enrichment, Jinja); run again with --backend sqlite to see what
+a real database adds. No AWS account or network is needed.
+
+Usage:
+    python benchmark_routes.py [--backend memory] [--books 5000] [--requests 20000] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+from werkzeug.security import generate_password_hash
+
+import app_aws
+
+ROUTES = [
+    ('student', '/catalog'),
+    ('student', '/catalog?sort=title&per_page=100'),
+    ('student', '/my-requests'),
+    ('staff', '/staff'),
+    ('staff', '/staff/requests'),
+    ('staff', '/staff/requests?status=pending&days=7'),
+    ('staff', '/staff/books')
+]
+
+
+def seed(books, requests, students=200):
+    """Writes a synthetic library straight through DatabaseService; returns the busiest student."""
+    rnd = random.Random(42)
+    categories = ('Science fiction', 'History', 'Biology', 'Programming')
+    app_aws.DatabaseService.put_books([{
+        'id': f'book-{i}',
+        'title': f'Benchmark Title {i}',
+        'author': f'Author {i % 500}',
+        'category': categories[i % 4],
+        'copies': i % 11,
+        'isbn': f'978{i:010d}',
+        'cover_url': ''
+    } for i in range(books)])
+
+    password = generate_password_hash('benchmark')
+    app_aws.DatabaseService.create_user({'email': 'staff@bench', 'name': 'Staff', 'password': password, 'role': 'staff'})
+    for s in range(students):
+        app_aws.DatabaseService.create_user({'email': f'student{s}@bench', 'name': f'Student {s}',
+                                             'password': password, 'role': 'student'})
+
+    start = time.time() - 90 * 86400
+    for r in range(requests):
+        stamp = start + r * (90 * 86400 / requests)
+        app_aws.DatabaseService.create_request({
+            'id': app_aws.Utils.new_request_id(),
+            'user_email': f'student{min(rnd.randrange(students), rnd.randrange(students))}@bench',
+            'book_id': f'book-{rnd.randrange(books)}',
+            'status': rnd.choice(('pending', 'approved', 'returned', 'rejected', 'waitlisted')),
+            'date': app_aws.Utils.timestamp(app_aws.datetime.fromtimestamp(stamp))
+        })
+    app_aws.StatsService.rebuild()
+    return 'student0@bench'
+
+
+def login(email, role):
+    client = app_aws.app.test_client()
+    client.post('/login', data={'action': 'login', 'email': email, 'password': 'benchmark', 'role': role})
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route benchmark against a local storage engine")
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        app_aws.Config.SQLITE_PATH = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    app_aws.storage = app_aws.make_storage(args.backend)
+    app_aws.NotificationService.send = staticmethod(lambda *a, **k: None)  # Login alerts are not under test
+
+    started = time.perf_counter()
+    student = seed(args.books, args.requests)
+    print(f"Seeded {args.books} books and {args.requests} requests into '{args.backend}' "
+          f"in {time.perf_counter() - started:.1f} s")
+
+    clients = {'student': login(student, 'student'), 'staff': login('staff@bench', 'staff')}
+    print(f"Route timings (best and median of {args.repeat}):")
+    for role, path in ROUTES:
+        client = clients[role]
+        assert client.get(path).status_code == 200, path  # Also warms the catalog cache
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            client.get(path)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"  {path:45s} {timings[0] * 1000:8.2f} ms  {timings[len(timings) // 2] * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: catalog search latency against catalog size.
+
+Seeds synthetic catalogs of growing size into the in-memory storage engine, builds the
+SearchIndex from app_aws.py over each, and times three kinds of query: exact words, an
+unfinished last word (prefix) and a misspelled word (fuzzy, via the trigram postings).
+Baselines are what the same answers cost without an index: a substring filter over every
+book (the old catalog box) and an edit-distance pass over every distinct term. No AWS
+account or network is needed.
+
+Usage:
+    python benchmark_search.py [--sizes 1000,10000,50000,100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+import app_aws
+
+SYLLABLES = ('ka', 'lo', 'mer', 'tan', 'vi', 'shu', 'ren', 'dal', 'os', 'qui', 'bar', 'nel',
+             'to', 'fi', 'gorn', 'ash', 'e', 'lin', 'mar', 'da', 'sor', 'pe', 'um', 'wyn')
+
+
+def vocabulary(rnd, size=20000):
+    """Made-up words of two to four syllables, so typos land near real terms."""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))))
+    return sorted(words)
+
+
+def books(count, words, rnd):
+    """Titles of two to five words drawn with a long tail, like a real catalog."""
+    pick = lambda: words[int(len(words) ** rnd.random()) - 1]  # Zipf-like: rank r drawn about 1/r as often
+    categories = ('Science fiction', 'History', 'Biology', 'Programming')
+    return [{
+        'id': f'book-{i}',
+        'title': ' '.join(pick() for _ in range(rnd.randint(2, 5))).title(),
+        'author': f'{pick().title()} {pick().title()}',
+        'category': categories[i % 4],
+        'copies': i % 11,
+        'isbn': f'978{i:010d}',
+        'cover_url': ''
+    } for i in range(count)]
+
+
+def misspell(word, rnd):
+    """One deletion, substitution or adjacent swap."""
+    i = rnd.randrange(1, len(word) - 1)
+    edit = rnd.choice(('delete', 'substitute', 'swap'))
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'substitute':
+        return word[:i] + rnd.choice('aeioustrn'.replace(word[i], '')) + word[i + 1:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def substring_scan(catalog, query):
+    """The pre-index catalog filter: every book, every field."""
+    query = query.lower()
+    return [book for book in catalog
+            if query in book['title'].lower() or query in book['author'].lower() or query in book['category'].lower()]
+
+
+def edit_distance_scan(terms, word):
+    """Fuzzy matching without candidate generation: every distinct term is compared."""
+    limit = 1 if len(word) <= 5 else 2
+    return [term for term in terms if app_aws.SearchIndex.edit_distance(word, term, limit) <= limit]
+
+
+def timed(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog search latency against catalog size")
+    parser.add_argument('--sizes', default='1000,10000,50000,100000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--baseline-queries', type=int, default=20, help="The linear scans are slow; fewer samples")
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    words = vocabulary(rnd)
+    print(f"{'books':>8} {'terms':>8} {'build':>8}   {'query':10} {'p50 ms':>9} {'p95 ms':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        catalog = books(size, words, rnd)
+        app_aws.storage = app_aws.make_storage('memory')
+        app_aws.DatabaseService.put_books(catalog)
+        app_aws.catalog_cache.invalidate()
+        index = app_aws.SearchIndex(app_aws.catalog_cache)
+        started = time.perf_counter()
+        index.sync()
+        build = time.perf_counter() - started
+
+        samples = [rnd.choice(catalog)['title'].lower().split() for _ in range(args.queries)]
+        long_words = [w for title in samples for w in title if len(w) >= 6] or ['kalomer']
+        queries = {
+            'exact': [' '.join(title[:2]) for title in samples],
+            'prefix': [' '.join(title[:-1] + [title[-1][:3]]) for title in samples],
+            'typo': [misspell(rnd.choice(long_words), rnd) for _ in range(args.queries)]
+        }
+        terms = list(index._postings)
+        stats = index.stats()
+        runs = [
+            ('exact', lambda q: index.search(q, prefix=False), queries['exact']),
+            ('prefix', index.search, queries['prefix']),
+            ('typo', index.search, queries['typo']),
+            ('scan', lambda q: substring_scan(catalog, q), queries['exact'][:args.baseline_queries]),
+            ('scan typo', lambda q: edit_distance_scan(terms, q), queries['typo'][:args.baseline_queries])
+        ]
+        for n, (name, fn, sample) in enumerate(runs):
+            p50, p95 = timed(fn, sample)
+            head = f"{size:8d} {stats['terms']:8d} {build:7.2f}s" if n == 0 else ' ' * 26
+            print(f"{head}   {name:10} {p50:9.3f} {p95:9.3f}")
+
+        found = sum(1 for q in queries['typo'] if index.search(q))
+        print(f"{'':26}   typo queries answered: {found}/{len(queries['typo'])}")
+
+
+if __name__ == '__main__':
+    main()
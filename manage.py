@@ -0,0 +1,98 @@
+"""
+Maintenance commands for the DynamoDB edition (app_aws.py).
+
+Usage:
+    python manage.py rebuild-stats
+    python manage.py backfill-waitlist
+    python manage.py import-books holdings.csv [--format csv|jsonl] [--workers N] [--restart]
+    python manage.py export books|requests|students [--format csv|ndjson] [--parallel] [-o FILE]
+"""
+import argparse
+import os
+import sys
+
+import app_aws
+
+
+def rebuild_stats(args):
+    """Backfills the analytics counters from the Books and Requests tables."""
+    print(">>> Rebuilding analytics counters (full scan of Books and Requests)...")
+    totals = app_aws.StatsService.rebuild()
+    print(f">>> Done. Books: {totals['total_books']} | Requests: {totals['total_requests']} | "
+          f"Low stock: {totals['low_stock']}")
+
+
+def backfill_waitlist(args):
+    """Indexes waitlisted requests created before the waitlist GSI existed."""
+    print(">>> Adding waitlist keys to existing waitlisted requests...")
+    updated = app_aws.DatabaseService.backfill_waitlist()
+    print(f">>> Done. {updated} requests queued.")
+
+
+def import_books(args):
+    """Streams a CSV/JSONL file into the Books table, resuming from its checkpoint if one exists."""
+    fmt = args.format or app_aws.BookImporter.detect_format(args.path)
+    checkpoint = args.path + '.checkpoint'
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    elif os.path.exists(checkpoint):
+        print(f">>> Resuming from {checkpoint}")
+
+    def progress(report):
+        print(f"    rows {report['rows']:>8} | new {report['inserted']:>7} | updated {report['updated']:>7} | "
+              f"rejected {report['failed']:>5} | {report['rows_per_second']} rows/s", flush=True)
+
+    print(f">>> Importing {args.path} ({fmt}, {args.workers or app_aws.Config.IMPORT_WORKERS} writers)...")
+    importer = app_aws.BookImporter(workers=args.workers, checkpoint_path=checkpoint, progress=progress)
+    with open(args.path, encoding='utf-8-sig', newline='') as f:
+        report = importer.run(f, fmt)
+
+    for error in report['errors']:
+        print(f"    row {error['row']}: {error['error']}")
+    print(f">>> Done. {report['rows']} rows | {report['inserted']} new | {report['updated']} updated | "
+          f"{report['failed']} rejected")
+
+
+def export(args):
+    """Streams a dataset to a file (or stdout) without loading the table into memory."""
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in app_aws.DataExporter.stream(args.dataset, args.format, parallel=args.parallel):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f">>> Exported {args.dataset} to {args.output}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instant Library maintenance commands")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('rebuild-stats', help="Recompute the pre-aggregated analytics counters")
+    cmd.set_defaults(func=rebuild_stats)
+
+    cmd = commands.add_parser('backfill-waitlist', help="Queue existing waitlisted requests in the waitlist index")
+    cmd.set_defaults(func=backfill_waitlist)
+
+    cmd = commands.add_parser('import-books', help="Bulk load books from a CSV or JSONL file (upserts by ISBN)")
+    cmd.add_argument('path', help="CSV with a header row, or one JSON object per line")
+    cmd.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+    cmd.add_argument('--workers', type=int, help="Parallel batch writers")
+    cmd.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and start from row 1")
+    cmd.set_defaults(func=import_books)
+
+    cmd = commands.add_parser('export', help="Stream books, requests or students out as CSV or NDJSON")
+    cmd.add_argument('dataset', choices=sorted(app_aws.DataExporter.DATASETS))
+    cmd.add_argument('--format', choices=sorted(app_aws.DataExporter.FORMATS), default='csv')
+    cmd.add_argument('--parallel', action='store_true', help="Use a parallel scan (faster, unordered)")
+    cmd.add_argument('-o', '--output', help="Write to this file instead of stdout")
+    cmd.set_defaults(func=export)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,7 @@
 import os
+import sys
+import time
+import subprocess
 import boto3
 import requests
 import random
@@ -30,7 +33,19 @@ def setup_data():
     dynamodb.create_table(
         TableName='InstantLibrary_Users',
         KeySchema=[{'AttributeName': 'email', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'email', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'email', 'AttributeType': 'S'},
+            {'AttributeName': 'role', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'role-email-index',
+            'KeySchema': [
+                {'AttributeName': 'role', 'KeyType': 'HASH'},
+                {'AttributeName': 'email', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
     dynamodb.create_table(
@@ -42,7 +57,39 @@ def setup_data():
     dynamodb.create_table(
         TableName='InstantLibrary_Requests',
         KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_email', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'},
+            {'AttributeName': 'status', 'AttributeType': 'S'},
+            {'AttributeName': 'waitlist_book', 'AttributeType': 'S'},
+            {'AttributeName': 'waitlisted_at', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'user_email-date-index',
+            'KeySchema': [
+                {'AttributeName': 'user_email', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }, {
+            'IndexName': 'status-date-index',
+            'KeySchema': [
+                {'AttributeName': 'status', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }, {
+            'IndexName': 'waitlist_book-waitlisted_at-index',
+            'KeySchema': [
+                {'AttributeName': 'waitlist_book', 'KeyType': 'HASH'},
+                {'AttributeName': 'waitlisted_at', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
     dynamodb.create_table(
@@ -51,6 +98,25 @@ def setup_data():
         AttributeDefinitions=[{'AttributeName': 'email', 'AttributeType': 'S'}],
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
+    dynamodb.create_table(
+        TableName='InstantLibrary_Stats',
+        KeySchema=[{'AttributeName': 'stat_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'stat_id', 'AttributeType': 'S'},
+            {'AttributeName': 'kind', 'AttributeType': 'S'},
+            {'AttributeName': 'request_count', 'AttributeType': 'N'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'kind-request_count-index',
+            'KeySchema': [
+                {'AttributeName': 'kind', 'KeyType': 'HASH'},
+                {'AttributeName': 'request_count', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
     
     # Create SNS
     sns.create_topic(Name='InstantLibraryNotifications')
@@ -90,7 +156,52 @@ def populate_large_catalog():
     # Simplified for readability in this view, effectively I just need to remove the CALL in main
     pass 
 
+def profile_imports(top=12):
+    """Startup-time report (python run_local.py --profile-imports).
+    Measures `import app_aws` in a fresh interpreter with -X importtime, checks which heavy
+    SDKs it pulled in, then times the setup that is now deferred to the first requests."""
+    probe = ("import sys; import app_aws; "
+             "print(','.join(m for m in ('boto3', 'google.generativeai', 'requests') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    
+    total, direct = 0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if name.strip() == 'app_aws':
+            total = int(cumulative)
+        elif depth == 1:
+            direct.append((int(cumulative), name.strip()))
+    
+    print(">>> Import profile: app_aws")
+    print(f"    import app_aws: {total / 1000:.0f} ms")
+    for cumulative, name in sorted(direct, reverse=True)[:top]:
+        print(f"      {cumulative / 1000:7.1f} ms  {name}")
+    loaded = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+    print(f"    Heavy SDKs loaded at import: {loaded or 'none'}")
+    
+    print(">>> Deferred setup (paid by the first request that needs it)")
+    started = time.perf_counter()
+    app_aws.aws.dynamodb
+    print(f"    AWS clients (boto3 + session + tuned config): {(time.perf_counter() - started) * 1000:.0f} ms")
+    started = time.perf_counter()
+    app_aws.app.test_client().get('/')
+    print(f"    First request to /: {(time.perf_counter() - started) * 1000:.0f} ms")
+    started = time.perf_counter()
+    try:
+        app_aws.AIService.model()
+        print(f"    Gemini SDK import + model: {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"    Gemini SDK unavailable: {e}")
+
 if __name__ == '__main__':
+    if '--profile-imports' in sys.argv:
+        setup_data()
+        profile_imports()
+        sys.exit(0)
     setup_data()
     # populate_large_catalog()  <-- Disabled for "From 0" experience
     print(">>> Starting Local Server on http://127.0.0.1:5000")
@@ -1,6 +1,10 @@
+import io
 import os
 import sys
+import tempfile
+import re
 import boto3
+import csv
 import json
 import moto
 import werkzeug
@@ -50,7 +54,19 @@ def run_verification():
     dynamodb.create_table(
         TableName='InstantLibrary_Users',
         KeySchema=[{'AttributeName': 'email', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'email', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'email', 'AttributeType': 'S'},
+            {'AttributeName': 'role', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'role-email-index',
+            'KeySchema': [
+                {'AttributeName': 'role', 'KeyType': 'HASH'},
+                {'AttributeName': 'email', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
     
@@ -66,7 +82,39 @@ def run_verification():
     dynamodb.create_table(
         TableName='InstantLibrary_Requests',
         KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
-        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_email', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'},
+            {'AttributeName': 'status', 'AttributeType': 'S'},
+            {'AttributeName': 'waitlist_book', 'AttributeType': 'S'},
+            {'AttributeName': 'waitlisted_at', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'user_email-date-index',
+            'KeySchema': [
+                {'AttributeName': 'user_email', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }, {
+            'IndexName': 'status-date-index',
+            'KeySchema': [
+                {'AttributeName': 'status', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }, {
+            'IndexName': 'waitlist_book-waitlisted_at-index',
+            'KeySchema': [
+                {'AttributeName': 'waitlist_book', 'KeyType': 'HASH'},
+                {'AttributeName': 'waitlisted_at', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
     
@@ -78,6 +126,27 @@ def run_verification():
         ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
     )
     
+    print("    - Creating DynamoDB Table: InstantLibrary_Stats")
+    dynamodb.create_table(
+        TableName='InstantLibrary_Stats',
+        KeySchema=[{'AttributeName': 'stat_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'stat_id', 'AttributeType': 'S'},
+            {'AttributeName': 'kind', 'AttributeType': 'S'},
+            {'AttributeName': 'request_count', 'AttributeType': 'N'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'kind-request_count-index',
+            'KeySchema': [
+                {'AttributeName': 'kind', 'KeyType': 'HASH'},
+                {'AttributeName': 'request_count', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        }],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
+    
     
     # Create EC2 Resource (Mock)
     ec2 = boto3.resource('ec2', region_name='us-east-1')
@@ -340,6 +409,10 @@ def run_verification():
         assert_true(b_count >= 51, "Stress Book Count Verified")
         assert_true(r_count >= 51, "Stress Request Count Verified")
 
+        # The stress rows were written straight to the tables, bypassing the analytics counters
+        print("    - Rebuilding analytics counters...")
+        app_aws.StatsService.rebuild()
+
     # 7. SNS STRESS TEST
     print("\n[7] Stress Testing SNS (50 Rapid Notifications)...")
     for i in range(50):
@@ -500,6 +573,205 @@ def run_verification():
         resp = client.get('/catalog')
         assert_true(resp.status_code == 200, "Catalog/Dashboard loads for logged-in user")
 
+        # Date filters clamp huge day counts instead of overflowing timedelta
+        date_range = app_aws.Utils.date_range_args({'days': '99999999'})
+        assert_true(date_range.get('days') == str(app_aws.Config.MAX_RANGE_DAYS), "Huge days filter is clamped")
+        resp = client.get('/my-requests?days=1000000')
+        assert_true(resp.status_code == 200, "My Requests with a huge days filter loads (200 OK)")
+
+    # 13. REQUEST LIFECYCLE & CATALOG BEHAVIOUR
+    print("\n[13] Request Lifecycle & Catalog Behaviour...")
+    db.create_user({'email': 'checks@staff.com', 'name': 'Check Staff',
+                    'password': generate_password_hash('staff123'), 'role': 'staff'})
+    staff_client = app_aws.app.test_client()
+    staff_client.post('/login', data={'email': 'checks@staff.com', 'password': 'staff123',
+                                      'role': 'staff', 'action': 'login'})
+
+    def new_request(email, book_id, status='pending', **fields):
+        item = {'id': app_aws.Utils.new_request_id(), 'user_email': email, 'book_id': book_id,
+                'status': status, 'date': app_aws.Utils.timestamp()}
+        if status == 'waitlisted':
+            item['waitlist_book'] = book_id
+            item['waitlisted_at'] = item['date']
+        item.update(fields)
+        db.create_request(item)
+        return item
+
+    def status_of(req):
+        return db.get_request(req['id'])['status']
+
+    def copies_of(book_id):
+        return db.get_book(book_id, consistent=True)['copies']
+
+    # 13.1 Conditional approve/return/reject (one transaction per action)
+    db.add_book({'id': 'check-tx', 'title': 'Transaction Checks', 'author': 'Verify', 'category': 'Test',
+                 'copies': 2, 'isbn': '', 'cover_url': ''})
+    first, second, third = (new_request('test@student.com', 'check-tx') for _ in range(3))
+    stale = dict(first)
+    staff_client.get(f"/staff/request/{first['id']}/approve")
+    assert_true(status_of(first) == 'approved' and copies_of('check-tx') == 1, "Approve takes a copy in the same transaction")
+    assert_true(db.transition_request(stale, 'approved', -1) == 'conflict' and copies_of('check-tx') == 1,
+                "Racing approve of an already processed request is a conflict")
+    staff_client.get(f"/staff/request/{second['id']}/approve")
+    assert_true(db.transition_request(third, 'approved', -1) == 'out_of_stock' and status_of(third) == 'pending',
+                "Approve with no copies left is refused (out_of_stock)")
+    staff_client.get(f"/staff/request/{first['id']}/reject")
+    assert_true(status_of(first) == 'approved' and copies_of('check-tx') == 0, "Reject of an on-loan request is refused")
+    assert_true(app_aws.plan_request_action({'status': 'returned'}, 'reject') is None, "Reject of a returned request is refused")
+    staff_client.get(f"/staff/request/{first['id']}/return")
+    assert_true(status_of(first) == 'returned' and copies_of('check-tx') == 1, "Return gives the copy back")
+    staff_client.get(f"/staff/request/{third['id']}/reject")
+    assert_true(status_of(third) == 'rejected' and copies_of('check-tx') == 1, "Reject of a pending request leaves copies alone")
+
+    # 13.2 Bulk actions: one outcome per id, loans cannot be rejected
+    db.add_book({'id': 'check-bulk', 'title': 'Bulk Checks', 'author': 'Verify', 'category': 'Test',
+                 'copies': 1, 'isbn': '', 'cover_url': ''})
+    on_loan = new_request('test@student.com', 'check-bulk', 'approved')
+    waiting = new_request('test@student.com', 'check-bulk', 'waitlisted')
+    response = staff_client.post('/api/staff/requests/bulk', json={'action': 'reject', 'ids': [on_loan['id'], waiting['id'], 'no-such-request']})
+    outcomes = {r['id']: r['outcome'] for r in (response.get_json() or {}).get('results', [])}
+    assert_true(outcomes == {on_loan['id']: 'conflict', waiting['id']: 'ok', 'no-such-request': 'not_found'},
+                "Bulk reject reports ok / conflict / not_found per id")
+    assert_true(status_of(on_loan) == 'approved' and status_of(waiting) == 'rejected' and copies_of('check-bulk') == 1,
+                "Bulk reject leaves the on-loan copy alone")
+    page = staff_client.get('/staff/requests').get_data(as_text=True)
+    assert_true(re.search(rf'value="{on_loan["id"]}"\s+data-actions="return"', page) is not None,
+                "On-loan rows only offer Return to the bulk bar")
+
+    # 13.3 Typeahead: prefixes follow edits, copies changes keep the memo
+    db.add_book({'id': 'check-suggest', 'title': 'Zanzibar Chronicles', 'author': 'Quillon Verify',
+                 'category': 'Test', 'copies': 1, 'isbn': '', 'cover_url': ''})
+    first_hit = app_aws.suggest_index.suggest('zanzi')
+    assert_true([s.get('book_id') for s in first_hit] == ['check-suggest'], "Typeahead completes a title prefix")
+    assert_true(any(s['type'] == 'author' for s in app_aws.suggest_index.suggest('quill')), "Typeahead completes an author prefix")
+    db.update_book('check-suggest', {'copies': 0})
+    assert_true(app_aws.suggest_index.suggest('zanzi') is first_hit, "A copies change leaves the typeahead memo in place")
+    db.update_book('check-suggest', {'title': 'Zanzibar Almanac'})
+    assert_true([s['text'] for s in app_aws.suggest_index.suggest('zanzi')] == ['Zanzibar Almanac'],
+                "A title edit reaches the typeahead")
+
+    # 13.4 Waitlist: a return promotes the oldest waitlisted request
+    db.add_book({'id': 'check-wait', 'title': 'Waitlist Checks', 'author': 'Verify', 'category': 'Test',
+                 'copies': 0, 'isbn': '', 'cover_url': ''})
+    loan = new_request('test@student.com', 'check-wait', 'approved')
+    later = new_request('test@student.com', 'check-wait', 'waitlisted', waitlisted_at='2026-01-02T00:00:00.000')
+    earlier = new_request('test@student.com', 'check-wait', 'waitlisted', waitlisted_at='2026-01-01T00:00:00.000')
+    staff_client.get(f"/staff/request/{loan['id']}/return")
+    assert_true(status_of(earlier) == 'pending' and status_of(later) == 'waitlisted',
+                "A return promotes the oldest waitlisted request first")
+    assert_true(copies_of('check-wait') == 1, "Promotion leaves the returned copy for staff to approve")
+    staff_client.get(f"/staff/request/{earlier['id']}/approve")
+    response = staff_client.post('/api/staff/requests/bulk', json={'action': 'return', 'ids': [earlier['id']]})
+    assert_true((response.get_json() or {}).get('promoted') == [later['id']] and status_of(later) == 'pending',
+                "A bulk return promotes the next in line")
+
+    # 13.5 Search: ranked hits, typo correction, edits and deletes reach the index
+    db.add_book({'id': 'check-search', 'title': 'Marmalade Cartography', 'author': 'Verify', 'category': 'Test',
+                 'copies': 1, 'isbn': '', 'cover_url': ''})
+
+    def search(query):
+        data = staff_client.get('/api/search', query_string={'q': query}).get_json() or {}
+        return [book['id'] for book in data.get('results', [])], data.get('corrections', {})
+
+    assert_true(search('marmalade cartog')[0][:1] == ['check-search'], "Search finds a book by title words and prefix")
+    assert_true(search('marmelade') == (['check-search'], {'marmelade': 'marmalade'}),
+                "A misspelled word is corrected and still finds the book")
+    db.update_book('check-search', {'title': 'Quince Cartography'})
+    assert_true('check-search' not in search('marmalade')[0] and search('quince')[0] == ['check-search'],
+                "A title edit reaches the search index")
+    db.delete_book('check-search')
+    assert_true(search('quince')[0] == [], "A deleted book leaves the search index")
+
+    # 13.6 Facets: counts follow copies changes and edits
+    facets = app_aws.facet_index
+    for book_id, copies in (('check-facet-1', 1), ('check-facet-2', 0)):
+        db.add_book({'id': book_id, 'title': 'Facet Checks', 'author': 'Verify', 'category': 'Facet Check',
+                     'copies': copies, 'isbn': '', 'cover_url': ''})
+    category = {'category': facets.key('category', 'Facet Check')}
+    in_stock = dict(category, availability='in_stock')
+    assert_true(facets.count(category) == 2 and facets.count(in_stock) == 1, "Facet counts cover new books")
+    db.update_book('check-facet-2', {'copies': 3})
+    assert_true(facets.count(in_stock) == 2, "A copies change moves a book between availability counts")
+    db.update_book('check-facet-1', {'category': 'Elsewhere'})
+    values = {v['value']: v['count'] for g in facets.counts(in_stock)['groups'] if g['name'] == 'category' for v in g['values']}
+    assert_true(facets.count(category) == 1 and values.get(category['category']) == 1 and values.get('elsewhere') == 1,
+                "A category edit moves the book between category counts")
+    only, counts = facets.browse(category)
+    assert_true(only == {'check-facet-2'} and counts['total'] == 1, "Browse returns the books and counts of one snapshot")
+
+    # 13.7 Import: ISBN rows upsert, bad rows are reported, re-runs are idempotent
+    db.add_book({'id': 'check-import', 'title': 'Before Import', 'author': 'Verify', 'category': 'Test',
+                 'copies': 1, 'isbn': '9780306406157', 'cover_url': ''})
+    upload = ("title,author,category,copies,isbn\n"
+              "After Import,Verify,Test,4,978-0-306-40615-7\n"
+              "Imported Fresh,Verify,Test,2,9780131103627\n"
+              ",No Title,Test,1,\n"
+              "Bad Copies,Verify,Test,many,\n"
+              "Bad Isbn,Verify,Test,1,12345\n")
+    report = app_aws.BookImporter().run(io.StringIO(upload), 'csv')
+    assert_true((report['inserted'], report['updated'], report['failed']) == (1, 1, 3),
+                "Import reports one insert, one ISBN update and three rejected rows")
+    assert_true(db.get_book('check-import', consistent=True)['title'] == 'After Import'
+                and db.get_book('isbn_9780131103627', consistent=True) is not None,
+                "An ISBN already in the catalog updates that book in place")
+    assert_true(sorted(e['row'] for e in report['errors']) == [3, 4, 5], "Rejected rows are reported by row number")
+    rerun = app_aws.BookImporter().run(io.StringIO(upload), 'csv')
+    assert_true((rerun['inserted'], rerun['updated']) == (0, 2), "Re-running an import updates instead of duplicating")
+
+    # 13.8 Export: CSV and NDJSON round-trip the table, passwords never leave
+    def export(dataset, fmt, parallel=False):
+        query = {'format': fmt, 'parallel': '1' if parallel else '0'}
+        text = staff_client.get(f'/staff/export/{dataset}', query_string=query).get_data(as_text=True)
+        rows = list(csv.DictReader(io.StringIO(text))) if fmt == 'csv' else [json.loads(line) for line in text.splitlines()]
+        return {row.get('id') or row.get('email'): row for row in rows}
+
+    stored = {book['id']: book for book in db.scan_table(app_aws.Config.TABLE_BOOKS)}
+    as_csv, as_ndjson = export('books', 'csv'), export('books', 'ndjson')
+    assert_true(set(as_csv) == set(as_ndjson) == set(stored), "CSV and NDJSON exports hold every book")
+    book = stored['check-import']
+    assert_true(as_ndjson['check-import'] == {k: book[k] for k in app_aws.DataExporter.DATASETS['books'] if k in book}
+                and as_csv['check-import']['title'] == book['title'] and int(as_csv['check-import']['copies']) == book['copies'],
+                "Exported rows carry the stored values")
+    assert_true(set(export('books', 'ndjson', parallel=True)) == set(stored), "A parallel-scan export holds the same books")
+    students = export('students', 'ndjson')
+    assert_true(students and not any('password' in row for row in students.values()), "Student export leaves out passwords")
+
+    # 13.9 Storage engines: memory and SQLite give the same answers as DynamoDB
+    def lifecycle(book_id):
+        db.add_book({'id': book_id, 'title': 'Engine Checks', 'author': 'Verify', 'category': 'Test',
+                     'copies': 2, 'isbn': '', 'cover_url': ''})
+        email = f'{book_id}@student.com'
+        reqs = [new_request(email, book_id, date=f'2026-01-0{n}T00:00:00.000') for n in range(1, 4)]
+        waiting = new_request(email, book_id, 'waitlisted', date='2026-01-04T00:00:00.000')
+        outcomes = [db.transition_request(dict(reqs[0]), 'approved', -1),
+                    db.transition_request(dict(reqs[0]), 'approved', -1),
+                    db.transition_request(dict(reqs[1]), 'approved', -1),
+                    db.transition_request(dict(reqs[2]), 'approved', -1),
+                    db.transition_request(dict(reqs[0], status='approved'), 'returned', 1)]
+        promoted = [req['id'] == waiting['id'] for req in db.promote_waitlist(book_id)]
+        page, _ = db.query_user_requests(email, limit=2)
+        return (outcomes, promoted, [status_of(req) for req in reqs + [waiting]], copies_of(book_id),
+                [req['id'] for req in page] == [waiting['id'], reqs[2]['id']])
+
+    expected = (['ok', 'conflict', 'ok', 'out_of_stock', 'ok'], [True],
+                ['returned', 'approved', 'pending', 'pending'], 1, True)
+    assert_true(lifecycle('engine-dynamodb') == expected, "DynamoDB engine runs the request lifecycle")
+    dynamo_storage = app_aws.storage
+    with tempfile.TemporaryDirectory() as sqlite_dir:
+        try:
+            for engine in (app_aws.MemoryBackend(), app_aws.SQLiteBackend(os.path.join(sqlite_dir, 'engines.db'))):
+                app_aws.storage = engine
+                app_aws.catalog_cache.invalidate()
+                assert_true(lifecycle(f'engine-{engine.name}') == expected,
+                            f"The {engine.name} engine matches DynamoDB on the request lifecycle")
+        finally:
+            app_aws.storage = dynamo_storage
+            app_aws.catalog_cache.invalidate()
+
+    # 13.10 Staff inventory search goes to the server, not just the rows on the page
+    page = staff_client.get('/staff/books').get_data(as_text=True)
+    assert_true('/api/search' in page and 'function bookRow' in page, "Inventory search box queries the whole catalog")
+
     # SUMMARY
     print("\n=========================================================")
     print(f"   VERIFICATION COMPLETE")